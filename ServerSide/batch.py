@@ -0,0 +1,296 @@
+"""
+Offline cohort pipeline: analyzes every eye-tracking log of the study and joins the NASA-TLX, general
+questionnaire and MC quiz results into one table with a row per participant, case and session.
+
+Logs are analyzed in parallel and every result is checkpointed, so an interrupted run resumes where it
+stopped. Checkpoints are keyed by the log and the analysis parameters, so changing a threshold reprocesses
+every log.
+
+Every row has the tracking-quality ratios of the log (tracked frames, blinks and tracking loss, see
+server.tracking_quality) and p50/p90/p99 of the session's fixation and saccade durations, saccade peak
+velocity and pupil diameter from quantile sketches. With --quantiles the sketches of all sessions are
+merged into cohort quantiles.
+
+Run from the ServerSide folder, e.g.:
+    python batch.py EyeTrackingLogs/ --nasatlx nasatlx_raw.txt \\
+        --questionnaire "VRClassroom General Questionnaire.csv" \\
+        --video-games "Video Games MC.csv" --double-slit "Double Slit MC.csv" \\
+        --output cohort.parquet --quantiles cohort_quantiles.json
+"""
+import argparse
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+import server
+
+
+def session_features(file_path):
+    """
+    Analyzes one eye-tracking log and flattens its results into one table row.
+
+    Returns:
+    - dict: Column name -> value, or None if the log cannot be analyzed. 'quantile_sketches' holds the
+      serialized sketches of the log (see server.MetricSketches) rather than a column.
+    """
+    processed = server.process_log_file(file_path, columns='analysis', mode='features')
+    if processed is None:
+        return None
+    result_dict, df = processed
+
+    features = {
+        'total_duration_seconds': result_dict['total_duration_seconds'],
+        'average_fps': result_dict['average_fps'],
+        'cognitive_overload': bool(server.cognitive_overload_detection(result_dict))
+    }
+    for movement_type, movement_stats in result_dict['eye_movement_statistics'].items():
+        for name, value in movement_stats.items():
+            features[f'{movement_type}_{name}'] = value
+    pupil_data = result_dict['pupil_data']
+    for name, value in pupil_data['normalized_statistics'].items():
+        features[f'pupil_{name}'] = value
+    for name, value in pupil_data['normalized_corrected_statistics'].items():
+        features[f'pupil_corrected_{name}'] = value
+    features['pupil_baseline'] = pupil_data['baseline_pupil_diameter']
+    for name, value in pupil_data['baseline_corrected_statistics'].items():
+        features[f'pupil_baseline_corrected_{name}'] = value
+
+    features.update(result_dict['tracking_quality'])
+
+    distraction_intervals = server.find_distraction_intervals(df)
+    features['distraction_count'] = len(distraction_intervals)
+    features['distraction_seconds'] = sum(interval['duration'] for interval in distraction_intervals)
+    for gazed_object, dwell in result_dict['gazed_object_durations'].items():
+        features[f'dwell_{gazed_object}'] = dwell
+
+    sketches = result_dict['quantile_sketches']
+    for metric, metric_summary in sketches.summary().items():
+        for percentile in server.SKETCH_PERCENTILES:
+            features[f'{metric}_p{percentile:g}'] = metric_summary[f'p{percentile:g}']
+    features['quantile_sketches'] = sketches.to_dict()
+
+    # Plain Python values, so checkpoints are JSON
+    return {name: value.item() if isinstance(value, np.generic) else value for name, value in features.items()}
+
+
+def checkpoint_path(checkpoint_folder, file_path):
+    """Returns the checkpoint file of a log for the current analysis parameters."""
+    status = os.stat(file_path)
+    digest = hashlib.sha256(json.dumps([os.path.basename(file_path), status.st_size, status.st_mtime_ns,
+                                        server.analysis_parameters()], sort_keys=True).encode())
+    return os.path.join(checkpoint_folder, digest.hexdigest()[:32] + '.json')
+
+
+def analyze_files(file_paths, workers=None, checkpoint_folder=None):
+    """
+    Runs session_features over `file_paths` in a process pool. Logs with a checkpoint are not analyzed again,
+    and every new result is checkpointed as soon as it arrives.
+
+    Returns:
+    - dict: File path -> features (None for logs that could not be analyzed).
+    """
+    features, todo = {}, []
+    for file_path in file_paths:
+        checkpoint = checkpoint_path(checkpoint_folder, file_path) if checkpoint_folder else None
+        if checkpoint and os.path.isfile(checkpoint):
+            with open(checkpoint) as file:
+                features[file_path] = json.load(file)
+        else:
+            todo.append((file_path, checkpoint))
+    print(f"{len(file_paths)} logs, {len(features)} from checkpoints, {len(todo)} to analyze")
+
+    if checkpoint_folder:
+        os.makedirs(checkpoint_folder, exist_ok=True)
+    with ProcessPoolExecutor(workers) as executor:
+        futures = {executor.submit(session_features, file_path): (file_path, checkpoint) for file_path, checkpoint in todo}
+        for done, future in enumerate(as_completed(futures), 1):
+            file_path, checkpoint = futures[future]
+            try:
+                features[file_path] = future.result()
+            except Exception as e:
+                print(f"Error processing {file_path}: {e}")
+                continue
+            if checkpoint:
+                with open(checkpoint + '.part', 'w') as file:
+                    json.dump(features[file_path], file)
+                os.replace(checkpoint + '.part', checkpoint)
+            print(f"[{done}/{len(todo)}] {os.path.basename(file_path)}")
+    return features
+
+
+def archive_file_info(file_path):
+    """
+    Returns the file information of an upload in the server's archive layout,
+    <archive>/user=<user_id>/date=<YYYY-MM-DD>/<name> (see server.UploadArchiver).
+
+    Returns:
+    - dict or None: The user ID as participant_id, the date as session and the file name without its
+      extension as upload, so every archived window keeps its own row. None if the path has no partition keys.
+    """
+    partitions = dict(part.split('=', 1) for part in os.path.normpath(os.path.dirname(file_path)).split(os.sep)[-2:]
+                      if '=' in part)
+    if 'user' not in partitions or 'date' not in partitions:
+        return None
+    return {'participant_id': partitions['user'], 'case_number': None, 'session': partitions['date'],
+            'upload': os.path.splitext(os.path.basename(file_path))[0]}
+
+
+def find_logs(folder_path):
+    """
+    Finds the logs in `folder_path` and its subfolders: CSV or Parquet/Arrow archive files whose names follow
+    parse_filename ('<date> - P<id>C<case> - <session>.csv', or .parquet/.arrow), or that are uploads in the
+    server's partitioned archive (see archive_file_info). Other files are skipped.
+
+    Returns:
+    - dict: File path -> file information (participant_id, case_number, session, ...), in path order.
+    """
+    file_infos = {}
+    for root, folders, file_names in os.walk(folder_path):
+        folders.sort()
+        for file_name in sorted(file_names):
+            if not (file_name.endswith('.csv') or server.gaze_archive_format(file_name)):
+                continue
+            file_path = os.path.join(root, file_name)
+            try:
+                file_infos[file_path] = server.parse_filename(file_name)
+            except (IndexError, ValueError):
+                file_info = archive_file_info(file_path)
+                if file_info is None:
+                    print(f"Skipping {file_name}: the name does not follow '<date> - P<id>C<case> - <session>.csv'"
+                          " and it is not in an upload archive")
+                    continue
+                file_infos[file_path] = file_info
+    return file_infos
+
+
+def cohort_quantiles(sketch_dicts):
+    """
+    Merges the quantile sketches of several sessions.
+
+    Parameters:
+    - sketch_dicts (list): Serialized sketches of every session, as session_features returns them.
+
+    Returns:
+    - dict: The number of sessions, the cohort quantiles (server.MetricSketches.summary) and the merged sketches.
+    """
+    merged = server.MetricSketches()
+    for sketch_dict in sketch_dicts:
+        merged.merge(server.MetricSketches.from_dict(sketch_dict))
+    return {'sessions': len(sketch_dicts), 'quantiles': merged.summary(), 'sketches': merged.to_dict()}
+
+
+def process_all_files_in_folder(folder_path, nasatlx_filepath, questionnaire_filepath, video_games_filepath,
+                                double_slit_filepath, workers=None, checkpoint_folder=None, quantiles_path=None):
+    """
+    Analyzes every log in `folder_path` and its subfolders and joins NASA-TLX, questionnaire and MC quiz results.
+
+    Logs are found with find_logs: study logs named as parse_filename expects, and archived uploads. With `quantiles_path` the quantile sketches of the sessions in the table are merged and written
+    there as JSON, see cohort_quantiles.
+
+    Returns:
+    - DataFrame: One row per (participant_id, case_number, session), and per upload for archived uploads,
+      with the file information, the eye-tracking features of session_features and the joined study results.
+    """
+    # Read NASA TLX results from the file
+    nasatlx_result = server.read_nasa_tlx_file(nasatlx_filepath)
+    questionnaire_results = server.read_general_questionnaire(questionnaire_filepath)
+    # Read Video Games MC and Double Slit MC results from their respective files
+    video_games_results = server.read_general_questionnaire(video_games_filepath)
+    double_slit_results = server.read_general_questionnaire(double_slit_filepath)
+
+    # Calculate scores for each topic
+    video_games_scores = server.calculate_scores(video_games_results, server.video_games_correct_answers)
+    double_slit_scores = server.calculate_scores(double_slit_results, server.double_slit_correct_answers)
+
+    file_infos = find_logs(folder_path)
+    features = analyze_files(list(file_infos), workers, checkpoint_folder)
+
+    rows, sketch_dicts = [], []
+    for file_path, file_info in file_infos.items():
+        participant_id = file_info['participant_id']
+        condition, topic = file_info.get('condition'), file_info.get('topic')
+        row = {'file_name': os.path.basename(file_path), **file_info}
+        row.update(features.get(file_path) or {})
+        sketch_dicts.append(row.pop('quantile_sketches', None))
+
+        # Cognitive load score for the session's condition, or for its topic
+        row['condition_tlx'], row['topic_tlx'], row['cognitive_load'] = None, None, None
+        if participant_id in nasatlx_result:
+            participant_data = nasatlx_result[participant_id]
+            row['condition_tlx'], row['topic_tlx'] = condition, topic
+            cognitive_load_score = participant_data['condition_tlx'].get(condition, None)
+            if cognitive_load_score is None:
+                cognitive_load_score = participant_data['topic_tlx'].get(topic, None)
+            row['cognitive_load'] = cognitive_load_score
+
+        for column, value in questionnaire_results.get(participant_id, {}).items():
+            row[f'questionnaire_{column}'] = value
+
+        # MC scores of the session's topic
+        topic_scores = {'videogames': video_games_scores, 'doubleslit': double_slit_scores}.get(topic, {})
+        if participant_id in topic_scores:
+            row['mc_familiarity'] = topic_scores[participant_id]['familiarity']
+            row['mc_quiz'] = topic_scores[participant_id]['quiz_score']
+        rows.append(row)
+
+    cohort = pd.DataFrame(rows)
+    if not cohort.empty:
+        # Like the former results dict, a later log of the same session replaces an earlier one
+        key = ['participant_id', 'case_number', 'session'] + (['upload'] if 'upload' in cohort.columns else [])
+        cohort = cohort.drop_duplicates(subset=key, keep='last')
+    if quantiles_path:
+        quantiles = cohort_quantiles([sketch_dicts[row] for row in cohort.index if sketch_dicts[row] is not None])
+        with open(quantiles_path, 'w') as file:
+            json.dump(quantiles, file)
+        print(f"Wrote the quantiles of {quantiles['sessions']} sessions to {quantiles_path}")
+    return cohort.reset_index(drop=True)
+
+
+def write_cohort_table(cohort, output_path):
+    """
+    Writes the cohort table as Parquet. Falls back to CSV next to `output_path` when no Parquet engine
+    (pyarrow or fastparquet) is installed.
+
+    Returns:
+    - str: The path written.
+    """
+    if output_path.endswith('.csv'):
+        cohort.to_csv(output_path, index=False)
+        return output_path
+    try:
+        # Mixed questionnaire answers are stored as text, Parquet columns need a single type
+        table = cohort.apply(lambda column: column.astype(str).where(column.notna(), None)
+                             if column.dtype == object else column)
+        table.to_parquet(output_path, index=False)
+        return output_path
+    except ImportError:
+        csv_path = os.path.splitext(output_path)[0] + '.csv'
+        print(f"No Parquet engine installed (pip install pyarrow), writing {csv_path} instead")
+        cohort.to_csv(csv_path, index=False)
+        return csv_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('folder', help='Folder with the eye-tracking logs (CSV, Parquet or Arrow)')
+    parser.add_argument('--nasatlx', required=True, help='NASA-TLX raw results')
+    parser.add_argument('--questionnaire', required=True, help='General questionnaire export')
+    parser.add_argument('--video-games', required=True, help='Video games MC quiz export')
+    parser.add_argument('--double-slit', required=True, help='Double slit MC quiz export')
+    parser.add_argument('--output', default='cohort.parquet', help='Cohort table, .parquet or .csv')
+    parser.add_argument('--checkpoints', default='batch_checkpoints', help='Folder of per-log checkpoints')
+    parser.add_argument('--quantiles', help='Also write the merged quantile sketches of the cohort to this JSON file')
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes (default: CPU count)')
+    args = parser.parse_args()
+
+    cohort = process_all_files_in_folder(args.folder, args.nasatlx, args.questionnaire, args.video_games,
+                                         args.double_slit, args.workers, args.checkpoints, args.quantiles)
+    print(f"Wrote {len(cohort)} sessions to {write_cohort_table(cohort, args.output)}")
+
+
+if __name__ == '__main__':
+    main()
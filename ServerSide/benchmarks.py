@@ -0,0 +1,831 @@
+"""
+Benchmarks for the eye-tracking analysis server.
+
+Run from the ServerSide folder, e.g.:
+    python benchmarks.py outlier-merge
+    python benchmarks.py ingest
+    python benchmarks.py wire-format
+    python benchmarks.py request-memory
+    python benchmarks.py kinematics
+    python benchmarks.py archive
+    python benchmarks.py outlier-filter
+    python benchmarks.py movement-statistics
+    python benchmarks.py quantile-sketch
+"""
+import argparse
+import contextlib
+import glob
+import io
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+import server
+
+
+def time_call(function, *args, repeat=3, **kwargs):
+    """Returns the best wall-clock time in seconds of `repeat` calls."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(*args, **kwargs)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def make_movement_runs(n_points, seed=0):
+    """
+    Builds classifier-style per-point movement lists with many single-point outliers between
+    fixations and saccades, so both outlier post-processors have plenty to merge.
+    """
+    rng = np.random.default_rng(seed)
+    movement_types, eye_movement_ids = [], []
+    movement_durations, movement_amplitudes, movement_velocities = {}, {}, {}
+    movement_id = 1
+    while len(movement_types) < n_points:
+        if movement_id % 2 == 0:
+            movement_type, length = 'outlier', 1
+        else:
+            movement_type = 'fixation_candidate' if rng.random() < 0.6 else 'saccade_candidate'
+            length = int(rng.integers(1, 6))
+        movement_types += [movement_type] * length
+        eye_movement_ids += [movement_id] * length
+        movement_durations[movement_id] = length * 0.01
+        movement_amplitudes[movement_id] = float(rng.uniform(0, 100))
+        movement_velocities[movement_id] = rng.uniform(0, 100, length).tolist()
+        movement_id += 1
+    return movement_types, eye_movement_ids, movement_durations, movement_amplitudes, movement_velocities
+
+
+def legacy_process_outliers_fixation(movement_types, eye_movement_ids, movement_durations, movement_amplitudes, movement_velocities, tolerance=1):
+    """The process_outliers_fixation the run-table merge replaced, kept as the parity baseline."""
+    new_movement_types = movement_types.copy()
+    new_eye_movement_ids = eye_movement_ids.copy()
+    new_movement_durations = movement_durations.copy()
+    new_movement_amplitudes = movement_amplitudes.copy()
+    new_movement_velocities = movement_velocities.copy()
+
+    merged_ids = set()  # To track IDs that have been merged and should not be added again
+
+    outlier_indices = [i for i, m_type in enumerate(new_movement_types) if m_type == 'outlier']
+
+    for outlier_idx in outlier_indices:
+        # Check the surrounding movement types
+        prev_idx = outlier_idx - 1
+        next_idx = outlier_idx + 1
+
+        if 0 <= prev_idx < len(new_movement_types) and next_idx < len(new_movement_types):
+            if (new_movement_types[prev_idx] == 'fixation_candidate' and new_movement_types[next_idx] == 'fixation_candidate') or \
+                    (new_movement_types[prev_idx] == 'fixation' and new_movement_types[next_idx] == 'fixation_candidate') or \
+                    (new_movement_types[prev_idx] == 'fixation_candidate' and new_movement_types[next_idx] == 'fixation') or \
+                    (new_movement_types[prev_idx] == 'fixation' and new_movement_types[next_idx] == 'fixation'):
+
+                prev_fixation_id = new_eye_movement_ids[prev_idx]
+                next_fixation_id = new_eye_movement_ids[next_idx]
+                outlier_id = new_eye_movement_ids[outlier_idx]  # The ID of the current outlier
+
+                # Calculate combined duration for merged fixation
+                combined_duration = (
+                    new_movement_durations.get(prev_fixation_id, 0) +
+                    new_movement_durations.get(next_fixation_id, 0) +
+                    new_movement_durations.get(outlier_id, 0)  # Include outlier duration
+                )
+
+                if combined_duration < server.MAX_FIXATION_DURATION:
+                    # Use the existing ID of the first fixation in merging
+                    merge_id = prev_fixation_id
+
+                    # Efficiently update all relevant points to use the merged fixation ID
+                    new_movement_types[prev_idx:next_idx + 1] = ['fixation'] * (next_idx - prev_idx + 1)
+                    new_eye_movement_ids[prev_idx:next_idx + 1] = [merge_id] * (next_idx - prev_idx + 1)
+
+                    # Efficient replacement with early termination
+                    encountered_control = False
+                    for i in range(prev_idx, len(new_eye_movement_ids)):
+                        if new_eye_movement_ids[i] == next_fixation_id:
+                            new_movement_types[i] = 'fixation'
+                            new_eye_movement_ids[i] = merge_id
+                            encountered_control = True
+                        elif encountered_control:
+                            break
+
+                    encountered_control = False
+                    for i in range(0, next_idx):
+                        if new_eye_movement_ids[i] == prev_fixation_id:
+                            new_movement_types[i] = 'fixation'
+                            new_eye_movement_ids[i] = merge_id
+                            encountered_control = True
+                        elif encountered_control:
+                            break
+
+                    # Update the new duration dictionary
+                    new_movement_durations[merge_id] = combined_duration
+
+                    # Calculate combined amplitude for merged fixation
+                    combined_amplitude = (
+                        (new_movement_amplitudes.get(prev_fixation_id, 0) * new_movement_durations.get(prev_fixation_id, 0) +
+                         new_movement_amplitudes.get(next_fixation_id, 0) * new_movement_durations.get(next_fixation_id, 0) +
+                         new_movement_amplitudes.get(outlier_id, 0) * new_movement_durations.get(outlier_id, 0))
+                        / combined_duration
+                    )
+                    new_movement_amplitudes[merge_id] = combined_amplitude
+
+                    # Combine velocity values for merged fixation
+                    combined_velocities = (
+                        new_movement_velocities.get(prev_fixation_id, []) +
+                        new_movement_velocities.get(next_fixation_id, []) +
+                        new_movement_velocities.get(outlier_id, [])
+                    )
+                    new_movement_velocities[merge_id] = combined_velocities
+
+                    # Remove the old IDs from the duration, amplitude, and velocity dictionaries
+                    if next_fixation_id in new_movement_durations:
+                        del new_movement_durations[next_fixation_id]
+                    if outlier_id in new_movement_durations:
+                        del new_movement_durations[outlier_id]
+
+                    if next_fixation_id in new_movement_amplitudes:
+                        del new_movement_amplitudes[next_fixation_id]
+                    if outlier_id in new_movement_amplitudes:
+                        del new_movement_amplitudes[outlier_id]
+
+                    if next_fixation_id in new_movement_velocities:
+                        del new_movement_velocities[next_fixation_id]
+                    if outlier_id in new_movement_velocities:
+                        del new_movement_velocities[outlier_id]
+
+                    merged_ids.update({prev_fixation_id, next_fixation_id, outlier_id})  # Mark IDs as processed
+
+    # Add remaining unchanged movements to the new lists and dictionary after each loop iteration
+    for movement_id in set(new_eye_movement_ids):
+        if movement_id not in merged_ids and movement_id not in new_movement_durations:
+            # Copy original data for unchanged movements
+            new_movement_durations[movement_id] = movement_durations[movement_id]
+            new_movement_amplitudes[movement_id] = movement_amplitudes[movement_id]
+            new_movement_velocities[movement_id] = movement_velocities[movement_id]
+
+    return new_movement_types, new_eye_movement_ids, new_movement_durations, new_movement_amplitudes, new_movement_velocities
+
+
+def legacy_process_outliers_saccade(movement_types, eye_movement_ids, movement_durations, movement_amplitudes, movement_velocities, tolerance=1):
+    """The process_outliers_saccade the run-table merge replaced, kept as the parity baseline."""
+    new_movement_types = movement_types.copy()
+    new_eye_movement_ids = eye_movement_ids.copy()
+    new_movement_durations = movement_durations.copy()
+    new_movement_amplitudes = movement_amplitudes.copy()
+    new_movement_velocities = movement_velocities.copy()
+
+    merged_ids = set()  # To track IDs that have been merged and should not be added again
+
+    outlier_indices = [i for i, m_type in enumerate(new_movement_types) if m_type == 'outlier']
+
+    for outlier_idx in outlier_indices:
+        # Check the surrounding movement types
+        prev_idx = outlier_idx - 1
+        next_idx = outlier_idx + 1
+
+        if 0 <= prev_idx < len(new_movement_types) and next_idx < len(new_movement_types):
+            if (new_movement_types[prev_idx] == 'saccade_candidate' and new_movement_types[next_idx] == 'saccade_candidate') or \
+                    (new_movement_types[prev_idx] == 'saccade' and new_movement_types[next_idx] == 'saccade_candidate') or \
+                    (new_movement_types[prev_idx] == 'saccade_candidate' and new_movement_types[next_idx] == 'saccade') or \
+                    (new_movement_types[prev_idx] == 'saccade' and new_movement_types[next_idx] == 'saccade'):
+
+                prev_fixation_id = new_eye_movement_ids[prev_idx]
+                next_fixation_id = new_eye_movement_ids[next_idx]
+                outlier_id = new_eye_movement_ids[outlier_idx]  # The ID of the current outlier
+
+                # Calculate combined duration for merged saccade
+                combined_duration = (
+                    new_movement_durations.get(prev_fixation_id, 0) +
+                    new_movement_durations.get(next_fixation_id, 0) +
+                    new_movement_durations.get(outlier_id, 0)  # Include outlier duration
+                )
+
+                if combined_duration < server.MAX_SACCADE_DURATION:
+                    # Use the existing ID of the first saccade in merging
+                    merge_id = prev_fixation_id  # Use the previous saccade ID
+
+                    # Efficiently update all relevant points to use the merged saccade ID
+                    new_movement_types[prev_idx:next_idx + 1] = ['saccade'] * (next_idx - prev_idx + 1)
+                    new_eye_movement_ids[prev_idx:next_idx + 1] = [merge_id] * (next_idx - prev_idx + 1)
+
+                    # Efficient replacement with early termination
+                    encountered_control = False
+                    for i in range(prev_idx, len(new_eye_movement_ids)):
+                        if new_eye_movement_ids[i] == next_fixation_id:
+                            new_movement_types[i] = 'saccade'
+                            new_eye_movement_ids[i] = merge_id
+                            encountered_control = True
+                        elif encountered_control:
+                            break
+
+                    encountered_control = False
+                    for i in range(0, next_idx):
+                        if new_eye_movement_ids[i] == prev_fixation_id:
+                            new_movement_types[i] = 'saccade'
+                            new_eye_movement_ids[i] = merge_id
+                            encountered_control = True
+                        elif encountered_control:
+                            break
+
+                    # Update the new duration dictionary
+                    new_movement_durations[merge_id] = combined_duration
+
+                    # Calculate combined amplitude for merged saccade
+                    combined_amplitude = (
+                        (new_movement_amplitudes.get(prev_fixation_id, 0) * new_movement_durations.get(prev_fixation_id, 0) +
+                         new_movement_amplitudes.get(next_fixation_id, 0) * new_movement_durations.get(next_fixation_id, 0) +
+                         new_movement_amplitudes.get(outlier_id, 0) * new_movement_durations.get(outlier_id, 0))
+                        / combined_duration
+                    )
+                    new_movement_amplitudes[merge_id] = combined_amplitude
+
+                    # Combine velocity values for merged saccade
+                    combined_velocities = (
+                        new_movement_velocities.get(prev_fixation_id, []) +
+                        new_movement_velocities.get(next_fixation_id, []) +
+                        new_movement_velocities.get(outlier_id, [])
+                    )
+                    new_movement_velocities[merge_id] = combined_velocities
+
+                    # Remove the old IDs from the duration, amplitude, and velocity dictionaries
+                    if next_fixation_id in new_movement_durations:
+                        del new_movement_durations[next_fixation_id]
+                    if outlier_id in new_movement_durations:
+                        del new_movement_durations[outlier_id]
+
+                    if next_fixation_id in new_movement_amplitudes:
+                        del new_movement_amplitudes[next_fixation_id]
+                    if outlier_id in new_movement_amplitudes:
+                        del new_movement_amplitudes[outlier_id]
+
+                    if next_fixation_id in new_movement_velocities:
+                        del new_movement_velocities[next_fixation_id]
+                    if outlier_id in new_movement_velocities:
+                        del new_movement_velocities[outlier_id]
+
+                    merged_ids.update({prev_fixation_id, next_fixation_id, outlier_id})  # Mark IDs as processed
+
+    # Add remaining unchanged movements to the new lists and dictionary after each loop iteration
+    for movement_id in set(new_eye_movement_ids):
+        if movement_id not in merged_ids and movement_id not in new_movement_durations:
+            # Copy original data for unchanged movements
+            new_movement_durations[movement_id] = movement_durations[movement_id]
+            new_movement_amplitudes[movement_id] = movement_amplitudes[movement_id]
+            new_movement_velocities[movement_id] = movement_velocities[movement_id]
+
+    # Now check all movements for validity based on duration thresholds
+    for movement_id, duration in new_movement_durations.items():
+        # Get the indices of the points with the current movement ID
+        indices = [i for i, id in enumerate(new_eye_movement_ids) if id == movement_id]
+
+        # Check if the movement type at the first index is 'fixation' or 'saccade'
+        if indices:  # Ensure there are indices found
+            movement_type = new_movement_types[indices[0]]  # Check the type at the first index
+            if (movement_type == 'fixation' and not (server.MIN_FIXATION_DURATION <= duration <= server.MAX_FIXATION_DURATION)) or \
+                    (movement_type == 'saccade' and not (server.MIN_SACCADE_DURATION <= duration <= server.MAX_SACCADE_DURATION)):
+                # If a movement does not have a valid duration, mark all points with this ID as 'outlier'
+                for idx in indices:
+                    new_movement_types[idx] = 'outlier'
+
+    return new_movement_types, new_eye_movement_ids, new_movement_durations, new_movement_amplitudes, new_movement_velocities
+
+
+#def classify_points(df):
+    # Initialize lists with default values corresponding to each row in the DataFrame
+    eye_movement_ids = [None] * len(df)  # Using None as a placeholder
+    last_type_list = ['outlier'] * len(df)  # Default all to 'outlier'
+    movement_durations = {}  # Dictionary to store the duration for each movement ID
+    movement_amplitudes = {}  # Dictionary to store the average speed (amplitude) for each movement ID
+    movement_velocities = {}  # Dictionary to store all velocity values for each movement ID
+    current_id = 1  # Starting ID for movements
+    last_type = 'saccade_candidate'  # Initialize the last movement type as 'saccade'
+    movement_start_time = df['TimeStamp'].iloc[0]  # Initial timestamp for movement start
+
+    # Initialize start index for the first movement
+    movement_start_index = 0
+
+    # Iterate over DataFrame rows
+    for i in range(1, len(df)):
+        gaze_velocity = df['GazeVelocity'].iloc[i]
+        head_velocity = df['HeadVelocity'].iloc[i]
+        timestamp = df['TimeStamp'].iloc[i]
+
+        # Determine the current movement type based on gaze and head velocities
+        if head_velocity < HEAD_VELOCITY_THRESHOLD and gaze_velocity < GAZE_VELOCITY_FIXATION_THRESHOLD:
+            current_type = 'fixation_candidate'
+        elif gaze_velocity > GAZE_VELOCITY_SACCADE_THRESHOLD:
+            current_type = 'saccade_candidate'
+        else:
+            current_type = 'outlier'  # Mark as outlier if it doesn't meet any criteria
+
+        # If movement type changes, calculate duration and update the movement_durations and velocities
+        if current_type != last_type:
+            movement_duration = (timestamp - movement_start_time)  # Duration in seconds
+
+            # Check if the duration is valid for fixation or saccade
+            if (last_type == 'fixation_candidate' and server.MIN_FIXATION_DURATION <= movement_duration <= server.MAX_FIXATION_DURATION) or \
+                    (last_type == 'saccade_candidate' and server.MIN_SACCADE_DURATION <= movement_duration <= server.MAX_SACCADE_DURATION):
+                # If valid, assign indexes to the movement ID
+                for idx in range(movement_start_index, i):
+                    eye_movement_ids[idx] = current_id
+                    last_type_list[idx] = 'fixation' if last_type == 'fixation_candidate' else 'saccade'
+
+                # Store the duration and amplitude of valid movement
+                movement_durations[current_id] = movement_duration
+                movement_amplitudes[current_id] = df['GazeVelocity'].iloc[movement_start_index:i].mean()  # Calculate mean velocity as amplitude
+
+                # Store all velocity values for this movement
+                movement_velocities[current_id] = df['GazeVelocity'].iloc[movement_start_index:i].tolist()
+
+
+def bench_outlier_merge(sizes):
+    """Times both outlier post-processors and reports the cost per point, which stays flat when scaling is linear."""
+    print(f"{'points':>10} {'fixation (s)':>13} {'saccade (s)':>12} {'us/point':>9}")
+    for size in sizes:
+        movements = make_movement_runs(size)
+        fixation_time = time_call(server.process_outliers_fixation, *movements)
+        merged = server.process_outliers_fixation(*movements)
+        saccade_time = time_call(server.process_outliers_saccade, *merged)
+        per_point = (fixation_time + saccade_time) / size * 1e6
+        print(f"{size:>10} {fixation_time:>13.4f} {saccade_time:>12.4f} {per_point:>9.3f}")
+
+
+def legacy_read_gaze_log(file_path):
+    """The text ingest process_log_file used before read_gaze_log, kept as the baseline."""
+    with open(file_path, 'r') as file:
+        lines = file.readlines()
+    rows = [line.strip().split(';') for line in lines]
+    headers = rows[0]
+    data = rows[1:]
+    for i in range(len(data)):
+        if len(data[i]) > len(headers):
+            data[i] = data[i][:-1]
+    df = pd.DataFrame(data, columns=headers)
+    non_digit_columns = ['GazeStatus', 'Condition', 'Scene', 'Task', 'GazedObject', 'ClickedObject', 'QuizAnswer', 'ChatBot']
+    return df.apply(lambda col: col.astype(str).str.replace(',', '.', regex=False).apply(pd.to_numeric, errors='coerce') if col.name not in non_digit_columns else col)
+
+
+def bench_ingest(folder):
+    """Compares the legacy text ingest with read_gaze_log (all columns and analysis columns) over every log in `folder`."""
+    file_paths = sorted(path for path in glob.glob(os.path.join(folder, '*')) if os.path.isfile(path))
+    total_rows = sum(len(server.read_gaze_log(path)) for path in file_paths)
+    readers = (
+        ('legacy', legacy_read_gaze_log),
+        ('columnar', server.read_gaze_log),
+        ('analysis', lambda path: server.read_gaze_log(path, columns='analysis')),
+    )
+
+    print(f"{len(file_paths)} files, {total_rows} rows")
+    print(f"{'reader':>10} {'time (s)':>9} {'rows/s':>10} {'memory (MB)':>12}")
+    legacy_time = None
+    for name, reader in readers:
+        elapsed = sum(time_call(reader, path) for path in file_paths)
+        memory = sum(reader(path).memory_usage(deep=True).sum() for path in file_paths)
+        legacy_time = legacy_time or elapsed
+        print(f"{name:>10} {elapsed:>9.3f} {total_rows / elapsed:>10.0f} {memory / 1e6:>12.2f}"
+              f"  ({legacy_time / elapsed:.1f}x)")
+
+
+def bench_wire_format(folder):
+    """Compares bytes on the wire and server-side parse time of the CSV upload and the binary gaze frame format."""
+    file_paths = sorted(path for path in glob.glob(os.path.join(folder, '*')) if os.path.isfile(path))
+    columns = [column for column, _ in server.GAZE_FRAME_COLUMNS]
+    csv_bytes, binary_bytes, rows = 0, 0, 0
+    csv_time, decode_time, frame_time = 0.0, 0.0, 0.0
+    for path in file_paths:
+        with open(path, 'rb') as file:
+            csv_body = file.read()
+        df = server.read_gaze_log(path, columns=columns)
+        if df.empty:
+            continue
+        binary_body = server.encode_gaze_frames(df)
+        rows += len(df)
+        csv_bytes += len(csv_body)
+        binary_bytes += len(binary_body)
+        csv_time += time_call(lambda: server.read_gaze_log(io.BytesIO(csv_body), columns='analysis'))
+        decode_time += time_call(server.decode_gaze_frames, binary_body)
+        frame_time += time_call(lambda: server.gaze_frames_to_dataframe(*server.decode_gaze_frames(binary_body)))
+
+    print(f"{len(file_paths)} files, {rows} rows")
+    print(f"{'format':>22} {'bytes':>11} {'bytes/row':>10} {'parse (s)':>10} {'rows/s':>11}")
+    for name, size, elapsed in (
+        ('csv (analysis cols)', csv_bytes, csv_time),
+        ('binary decode', binary_bytes, decode_time),
+        ('binary -> DataFrame', binary_bytes, frame_time),
+    ):
+        print(f"{name:>22} {size:>11} {size / rows:>10.1f} {elapsed:>10.4f} {rows / elapsed:>11.0f}")
+
+
+def load_session_frames(folder, repeat):
+    """Concatenates every log in `folder` `repeat` times into one continuous session at 90 Hz."""
+    file_paths = sorted(path for path in glob.glob(os.path.join(folder, '*')) if os.path.isfile(path))
+    frames = [server.read_gaze_log(path, columns='analysis') for path in file_paths]
+    df = pd.concat([frame for frame in frames if not frame.empty] * repeat, ignore_index=True)
+    df['Frame'] = np.arange(len(df))
+    df['TimeStamp'] = np.arange(len(df)) * 11  # Milliseconds
+    return df
+
+
+def _memory_status_kib(field):
+    """Reads a VmRSS/VmHWM style field of /proc/self/status in KiB."""
+    with open('/proc/self/status') as status:
+        for line in status:
+            if line.startswith(field + ':'):
+                return int(line.split()[1])
+    raise KeyError(field)
+
+
+def _request_peak_rss(mode, folder, rows, repeat, results):
+    """Runs one /upload analysis in this (fresh) process and reports how far it raised the RSS above its start."""
+    df = load_session_frames(folder, repeat).iloc[:rows].copy()
+    with open('/proc/self/clear_refs', 'w') as clear_refs:
+        clear_refs.write('5')  # Resets the peak RSS (VmHWM) to the current RSS
+    before = _memory_status_kib('VmRSS')
+    with contextlib.redirect_stdout(io.StringIO()):
+        server.process_eye_tracking_frames(df, mode=mode)
+    results.put((before, _memory_status_kib('VmHWM')))
+
+
+def bench_request_memory(folder, sizes):
+    """
+    Peak RSS growth of one /upload analysis in 'full' mode (the previous behaviour) and in 'summary' mode.
+    Every measurement runs in a fresh process so freed memory of earlier runs cannot hide the growth (Linux only).
+    """
+    context = multiprocessing.get_context('spawn')
+    print(f"{'rows':>9} {'full (MB)':>10} {'summary (MB)':>13} {'saved':>7}")
+    for rows in sizes:
+        repeat = -(-rows // len(load_session_frames(folder, 1)))
+        growth = {}
+        for mode in ('full', 'summary'):
+            results = context.Queue()
+            process = context.Process(target=_request_peak_rss, args=(mode, folder, rows, repeat, results))
+            process.start()
+            before, after = results.get()
+            process.join()
+            growth[mode] = (after - before) / 1024
+        saved = 1 - growth['summary'] / growth['full'] if growth['full'] else 0.0
+        print(f"{rows:>9} {growth['full']:>10.1f} {growth['summary']:>13.1f} {saved:>7.0%}")
+
+
+def make_kinematics_frame(n_points, seed=0):
+    """Builds valid head/gaze samples at 90 Hz with slowly drifting directions and occasional gaze jumps."""
+    rng = np.random.default_rng(seed)
+    columns = {}
+    for prefix, origin in (('CombinedGaze', 'Position'), ('Head', 'Position')):
+        target = 'Forward' if prefix == 'CombinedGaze' else 'Direction'
+        directions = np.cumsum(rng.normal(0, 0.002, (n_points, 3)), axis=0) + (0.0, 0.0, 1.0)
+        if prefix == 'CombinedGaze':
+            jumps = rng.random(n_points) < 0.01
+            directions[jumps] += rng.normal(0, 0.3, (jumps.sum(), 3))
+        origins = rng.normal(0, 0.01, (n_points, 3)) + (0.0, 1.6, 0.0)
+        for axis, column in enumerate('XYZ'):
+            columns[prefix + origin + column] = origins[:, axis]
+            columns[prefix + target + column] = origins[:, axis] + directions[:, axis]
+    df = pd.DataFrame(columns)
+    df.insert(0, 'TimeStamp', np.arange(n_points) / 90.0)
+    return df
+
+
+def legacy_angular_velocities(df):
+    """The DataFrame kinematics detect_fixations_and_saccades used before angular_velocity_kernel."""
+    _, gaze_velocity = server.calculate_angles_and_angular_velocity(server.calculate_gaze_vectors(df), df['TimeStamp'])
+    _, head_velocity = server.calculate_angles_and_angular_velocity(server.calculate_head_direction_vectors(df), df['TimeStamp'])
+    gaze_velocity, _ = server.interpolate_high_angular_velocities(gaze_velocity, threshold=500)
+    return gaze_velocity, head_velocity
+
+
+def bench_kinematics(sizes):
+    """Times the legacy DataFrame kinematics against angular_velocity_kernel in float64 and float32."""
+    print(f"{'points':>9} {'legacy (s)':>11} {'float64 (s)':>12} {'float32 (s)':>12} {'speedup':>8} {'f32 max err':>12}")
+    for size in sizes:
+        df = make_kinematics_frame(size)
+        samples = df[server.KINEMATICS_COLUMNS].to_numpy()
+        timestamps = df['TimeStamp'].to_numpy()
+        legacy_time = time_call(legacy_angular_velocities, df)
+        float64_time = time_call(server.angular_velocity_kernel, samples, timestamps)
+        float32_time = time_call(server.angular_velocity_kernel, samples, timestamps, dtype=np.float32)
+        gaze64, head64, _ = server.angular_velocity_kernel(samples, timestamps)
+        gaze32, head32, _ = server.angular_velocity_kernel(samples, timestamps, dtype=np.float32)
+        error = max(np.nanmax(np.abs(gaze32 - gaze64)), np.nanmax(np.abs(head32 - head64)))
+        print(f"{size:>9} {legacy_time:>11.4f} {float64_time:>12.4f} {float32_time:>12.4f}"
+              f" {legacy_time / float64_time:>7.1f}x {error:>12.3f}")
+
+
+def legacy_interpolate_outliers_time_window(data_series, timestamps, window_duration, threshold):
+    """The O(N^2) isolated outlier filter interpolate_outliers_time_window replaced, kept as the parity baseline."""
+    interpolated_series = data_series.copy()
+
+    for i in range(len(data_series)):
+        # Define the window range based on timestamps
+        current_time = timestamps.iloc[i]
+        window_start = current_time - window_duration / 2
+        window_end = current_time + window_duration / 2
+
+        # Get indices within the window
+        window_indices = (timestamps >= window_start) & (timestamps <= window_end)
+        window_data = data_series[window_indices]
+
+        # Calculate median and MAD within the window
+        median = window_data.median()
+        mad = (window_data - median).abs().median()
+
+        # Identify if the current point is an outlier
+        if abs(data_series.iloc[i] - median) > threshold * mad:
+            # Check if it's an isolated outlier (not part of a group)
+            is_isolated = (
+                    (i == 0 or abs(data_series.iloc[i - 1] - median) <= threshold * mad) and
+                    (i == len(data_series) - 1 or abs(data_series.iloc[i + 1] - median) <= threshold * mad)
+            )
+
+            if is_isolated:
+                interpolated_series.iloc[i] = np.nan
+
+    # Interpolate NaN values (isolated outliers)
+    interpolated_series.interpolate(method='linear', inplace=True)
+    return interpolated_series
+
+
+def bench_outlier_filter(sizes, legacy_limit):
+    """
+    Times interpolate_outliers_time_window against the legacy filter on gaze velocities of make_kinematics_frame
+    and checks that both give the same series. The legacy filter only runs up to `legacy_limit` points.
+    """
+    window, threshold = server.ISOLATED_OUTLIER_WINDOW, server.ISOLATED_OUTLIER_THRESHOLD
+    print(f"{'points':>9} {'legacy (s)':>11} {'rolling (s)':>12} {'speedup':>8} {'us/point':>9} {'parity':>7}")
+    for size in sizes:
+        df = make_kinematics_frame(size)
+        gaze_velocity, _, _ = server.angular_velocity_kernel(df[server.KINEMATICS_COLUMNS].to_numpy(), df['TimeStamp'].to_numpy())
+        velocities, timestamps = pd.Series(gaze_velocity), df['TimeStamp']
+        rolling_time = time_call(server.interpolate_outliers_time_window, velocities, timestamps, window, threshold, repeat=1)
+        legacy, speedup, parity = '-', '', '-'
+        if size <= legacy_limit:
+            legacy_time = time_call(legacy_interpolate_outliers_time_window, velocities, timestamps, window, threshold, repeat=1)
+            expected = legacy_interpolate_outliers_time_window(velocities, timestamps, window, threshold)
+            result = server.interpolate_outliers_time_window(velocities, timestamps, window, threshold)
+            parity = 'ok' if result.equals(expected) else 'FAILED'
+            legacy, speedup = f"{legacy_time:.4f}", f"{legacy_time / rolling_time:.1f}x"
+        print(f"{size:>9} {legacy:>11} {rolling_time:>12.4f} {speedup:>8} {rolling_time / size * 1e6:>9.2f} {parity:>7}")
+
+
+def legacy_get_movement_statistics(movement_types, eye_movement_ids, movement_durations, total_time):
+    """The per-point loop segment_statistics replaced, kept as the parity baseline."""
+    # Initialize dictionaries to store statistics for fixations, saccades, small saccades, long fixations, and outliers
+    stats = {
+        'fixation': {
+            'min': None,
+            'max': None,
+            'mean': None,
+            'count': 0,
+            'percentage': 0.0,
+            'time': 0.0  # Total time for fixation
+        },
+        'saccade': {
+            'min': None,
+            'max': None,
+            'mean': None,
+            'count': 0,
+            'percentage': 0.0,
+            'time': 0.0  # Total time for saccade
+        },
+        'saccade_candidate': {
+            'min': None,
+            'max': None,
+            'mean': None,
+            'count': 0,
+            'percentage': 0.0,
+            'time': 0.0  # Total time for small saccades
+        },
+        'other_saccades': {
+            'min': None,
+            'max': None,
+            'mean': None,
+            'count': 0,
+            'percentage': 0.0,
+            'time': 0.0  # Total time for long fixations
+        },
+        'outlier': {
+            'count': 0,
+            'percentage': 0.0,
+            'time': 0.0  # Total time for outliers
+        }
+    }
+
+    # Separate durations by movement type using a dictionary
+    durations = {'fixation': [], 'saccade': [], 'saccade_candidate': [], 'other_saccades': []}
+    unique_ids = {'fixation': set(), 'saccade': set(), 'saccade_candidate': set(), 'other_saccades': set()}  # To track unique IDs for each movement type
+
+    # Accumulate durations based on unique movement ID
+    for i in range(len(movement_types)):
+        current_id = eye_movement_ids[i]
+        current_type = movement_types[i]
+
+        if current_type in durations and current_id != 0:  # Ignore outliers for duration
+            if current_id in movement_durations and current_id not in unique_ids[current_type]:
+                # Only add duration if this ID hasn't been processed yet for this type
+                durations[current_type].append(movement_durations[current_id])
+                stats[current_type]['time'] += movement_durations[current_id]  # Add to total time
+                unique_ids[current_type].add(current_id)  # Mark this ID as processed
+        elif current_type == 'outlier':
+            stats['outlier']['count'] += 1
+
+    # Calculate total duration across all unique movements
+    total_duration = sum(durations['fixation']) + sum(durations['saccade']) + sum(durations['saccade_candidate']) + sum(durations['other_saccades'])
+
+    # Function to calculate statistics
+    def calculate_stats(type_durations, total_time):
+        if len(type_durations) == 1:
+            # If there's only one duration, min, max, and mean are the same
+            duration = type_durations[0]
+            return {
+                'min': duration,
+                'max': duration,
+                'mean': duration,
+                'count': 1,
+                'percentage': (duration / total_duration) * 100 if total_duration > 0 else 0,
+                'time_percentage': (duration / total_time) * 100 if total_time > 0 else 0
+            }
+        elif len(type_durations) > 1:
+            # Calculate statistics normally
+            total_type_duration = sum(type_durations)
+            return {
+                'min': np.min(type_durations),
+                'max': np.max(type_durations),
+                'mean': np.mean(type_durations),
+                'count': len(type_durations),
+                'percentage': (total_type_duration / total_duration) * 100 if total_duration > 0 else 0,
+                'time_percentage': (total_type_duration / total_time) * 100 if total_time > 0 else 0
+            }
+        else:
+            # If there are no durations, return default stats
+            return {'min': None, 'max': None, 'mean': None, 'count': 0, 'percentage': 0.0, 'time_percentage': 0.0}
+
+    # Assign calculated statistics to the respective movement types
+    stats['fixation'].update(calculate_stats(durations['fixation'], total_time))
+    stats['saccade'].update(calculate_stats(durations['saccade'], total_time))
+    stats['saccade_candidate'].update(calculate_stats(durations['saccade_candidate'], total_time))
+    stats['other_saccades'].update(calculate_stats(durations['other_saccades'], total_time))
+
+    # Calculate percentage of outliers
+    total_points = len(movement_types)
+    if total_points > 0:
+        stats['outlier']['percentage'] = (stats['outlier']['count'] / total_points) * 100
+        stats['outlier']['time'] = total_time - (stats['fixation']['time'] + stats['saccade']['time'] + stats['saccade_candidate']['time'] + stats['other_saccades']['time'])
+        stats['outlier']['time_percentage'] = (stats['outlier']['time'] / total_time) * 100 if total_time > 0 else 0
+
+    return stats
+
+
+def bench_movement_statistics(sizes):
+    """
+    Times get_movement_statistics (building the segment table, then grouped reductions) and
+    segment_statistics on a prebuilt table, as detect_fixations_and_saccades runs it, against the legacy
+    per-point loop on make_movement_runs, and checks that both give the same statistics.
+    """
+    print(f"{'points':>10} {'legacy (s)':>11} {'table+stats (s)':>16} {'stats (s)':>10} {'speedup':>8} {'parity':>7}")
+    for size in sizes:
+        movement_types, eye_movement_ids, movement_durations, _, _ = make_movement_runs(size)
+        total_time = size * 0.01
+        arguments = (movement_types, eye_movement_ids, movement_durations, total_time)
+        legacy_time = time_call(legacy_get_movement_statistics, *arguments)
+        table_time = time_call(server.get_movement_statistics, *arguments)
+        segments = server.MovementSegments.from_points(movement_types, eye_movement_ids, movement_durations)
+        statistics_time = time_call(server.segment_statistics, segments, total_time)
+        parity = 'ok' if legacy_get_movement_statistics(*arguments) == server.get_movement_statistics(*arguments) else 'FAILED'
+        print(f"{size:>10} {legacy_time:>11.4f} {table_time:>16.4f} {statistics_time:>10.4f} "
+              f"{legacy_time / statistics_time:>7.1f}x {parity:>7}")
+
+
+def bench_quantile_sketch(sizes, batch):
+    """
+    Feeds `batch`-value batches of lognormal durations to a QuantileSketch, as a long session's batches
+    arrive, and compares items kept, update time and the rank error of p50/p90/p99 with the exact
+    quantiles of every value. The sketch is also built from two halves and merged.
+    """
+    fractions = np.array(server.SKETCH_PERCENTILES) / 100
+    print(f"{'values':>10} {'items kept':>10} {'update (s)':>11} {'max rank err':>13} {'merged err':>11}")
+    for size in sizes:
+        values = np.random.default_rng(0).lognormal(-1.5, 0.5, size)
+        sketch = server.QuantileSketch()
+        start = time.perf_counter()
+        for first in range(0, size, batch):
+            sketch.update(values[first:first + batch])
+        update_time = time.perf_counter() - start
+        halves = [server.QuantileSketch(), server.QuantileSketch()]
+        halves[0].update(values[:size // 2])
+        halves[1].update(values[size // 2:])
+        merged = halves[0].merge(halves[1])
+
+        ordered = np.sort(values)
+        errors = [np.max(np.abs(np.searchsorted(ordered, estimator.quantiles(fractions), side='right') / size - fractions))
+                  for estimator in (sketch, merged)]
+        print(f"{size:>10} {len(sketch):>10} {update_time:>11.4f} {errors[0]:>13.4f} {errors[1]:>11.4f}")
+
+
+def bench_archive(folder):
+    """
+    Transcodes every log in `folder` into each archive format and compares disk footprint and load time
+    (all columns and analysis columns) with the CSV corpus. Parquet and Arrow need pyarrow, the binary
+    gaze frame format is listed for reference and only holds the GAZE_FRAME_COLUMNS.
+    """
+    file_paths = sorted(path for path in glob.glob(os.path.join(folder, '*')) if os.path.isfile(path))
+    frames = {path: server.read_gaze_log(path) for path in file_paths}
+    total_rows = sum(len(df) for df in frames.values())
+    gaze_frame_columns = [column for column, _ in server.GAZE_FRAME_COLUMNS]
+
+    def read_gaze_frame_file(path):
+        with open(path, 'rb') as file:
+            return server.gaze_frames_to_dataframe(*server.decode_gaze_frames(file.read()))
+
+    formats = [('csv', '.csv', None, lambda path, columns: server.read_gaze_log(path, columns))]
+    if server.pyarrow is None:
+        print("pyarrow is not installed, skipping the parquet and arrow formats")
+    else:
+        formats += [(name, extension, lambda df, path, name=name: server.write_gaze_archive(df, path, name),
+                     server.read_gaze_archive) for extension, name in server.GAZE_ARCHIVE_FORMATS.items()]
+    formats.append(('gaze frames', '.gzf',
+                    lambda df, path: open(path, 'wb').write(server.encode_gaze_frames(df[gaze_frame_columns])),
+                    lambda path, columns: read_gaze_frame_file(path)))
+
+    print(f"{len(file_paths)} files, {total_rows} rows")
+    print(f"{'format':>12} {'disk (MB)':>10} {'bytes/row':>10} {'load all (s)':>13} {'load analysis (s)':>18}")
+    archive_folder = tempfile.mkdtemp()
+    try:
+        for name, extension, write, read in formats:
+            paths = []
+            for index, (path, df) in enumerate(frames.items()):
+                if write is None or df.empty:
+                    paths.append(path)
+                    continue
+                paths.append(os.path.join(archive_folder, f'{index}{extension}'))
+                write(df, paths[-1])
+            size = sum(os.path.getsize(path) for path in paths)
+            load_all = sum(time_call(read, path, 'all') for path in paths)
+            load_analysis = sum(time_call(read, path, 'analysis') for path in paths)
+            print(f"{name:>12} {size / 1e6:>10.2f} {size / total_rows:>10.1f} {load_all:>13.3f} {load_analysis:>18.3f}")
+    finally:
+        shutil.rmtree(archive_folder)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+
+    outlier_merge = subparsers.add_parser('outlier-merge', help='Scaling of the outlier post-processors')
+    outlier_merge.add_argument('--sizes', type=int, nargs='+', default=[2400, 24000, 240000, 1000000])
+
+    ingest = subparsers.add_parser('ingest', help='Legacy text ingest vs. read_gaze_log')
+    ingest.add_argument('--folder', default='uploads')
+
+    wire_format = subparsers.add_parser('wire-format', help='CSV upload vs. binary gaze frames')
+    wire_format.add_argument('--folder', default='uploads')
+
+    request_memory = subparsers.add_parser('request-memory', help='Peak RSS per /upload request, full vs. summary mode')
+    request_memory.add_argument('--folder', default='uploads')
+    request_memory.add_argument('--sizes', type=int, nargs='+', default=[240, 2400, 20000, 200000])
+
+    kinematics = subparsers.add_parser('kinematics', help='Legacy DataFrame kinematics vs. angular_velocity_kernel')
+    kinematics.add_argument('--sizes', type=int, nargs='+', default=[240, 2400, 24000, 240000, 1000000])
+
+    outlier_filter = subparsers.add_parser('outlier-filter', help='Legacy vs. rolling median/MAD isolated outlier filter')
+    outlier_filter.add_argument('--sizes', type=int, nargs='+', default=[240, 2400, 24000, 240000, 1000000])
+    outlier_filter.add_argument('--legacy-limit', type=int, default=24000, help='Largest size the O(N^2) legacy filter runs on')
+
+    movement_statistics = subparsers.add_parser('movement-statistics', help='Legacy per-point loop vs. segment table statistics')
+    movement_statistics.add_argument('--sizes', type=int, nargs='+', default=[2400, 24000, 240000, 1000000])
+
+    quantile_sketch = subparsers.add_parser('quantile-sketch', help='Memory and accuracy of the KLL quantile sketch')
+    quantile_sketch.add_argument('--sizes', type=int, nargs='+', default=[2400, 240000, 10000000])
+    quantile_sketch.add_argument('--batch', type=int, default=240, help='Values per update')
+
+    archive = subparsers.add_parser('archive', help='Disk footprint and load time of CSV vs. the columnar archive formats')
+    archive.add_argument('--folder', default='uploads')
+
+    args = parser.parse_args()
+    if args.benchmark == 'outlier-merge':
+        bench_outlier_merge(args.sizes)
+    elif args.benchmark == 'ingest':
+        bench_ingest(args.folder)
+    elif args.benchmark == 'wire-format':
+        bench_wire_format(args.folder)
+    elif args.benchmark == 'request-memory':
+        bench_request_memory(args.folder, args.sizes)
+    elif args.benchmark == 'kinematics':
+        bench_kinematics(args.sizes)
+    elif args.benchmark == 'archive':
+        bench_archive(args.folder)
+    elif args.benchmark == 'outlier-filter':
+        bench_outlier_filter(args.sizes, args.legacy_limit)
+    elif args.benchmark == 'movement-statistics':
+        bench_movement_statistics(args.sizes)
+    elif args.benchmark == 'quantile-sketch':
+        bench_quantile_sketch(args.sizes, args.batch)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,265 @@
+"""
+Load test that replays the study logs as a classroom of Unity clients.
+
+Every simulated user behaves like ServerCommunicationManager: it posts its user id to /start_session, then
+uploads the frames of each completed window to /upload as GazeData.csv, one window every `window / fps`
+seconds. Like the client's coroutines, uploads go out on schedule whether or not the previous one has been
+answered. The frames come from the logs in the uploads folder, renumbered per user so that no two users
+send the same window (identical windows would be answered from the result cache).
+
+Each window size is run as its own phase, and latency percentiles, throughput and error rates are reported
+per size. Start the server first (python server.py), then run from the ServerSide folder, e.g.:
+    python loadtest.py --users 30 --duration 60
+    python loadtest.py --users 10 --windows 240 2400 --fps 90 --speedup 4 --json loadtest.json
+"""
+import argparse
+import glob
+import http.cookiejar
+import json
+import os
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+WINDOW_SIZES = (240, 600, 1200, 2400)  # Frames per upload, as in the names of the logs in uploads/
+
+
+def load_frame_lines(folder):
+    """
+    Reads the data lines of every log in `folder`. Logs whose header differs from the first one are skipped.
+
+    Returns:
+    - tuple: (header line, list of the data lines without Frame and TimeStamp, median frame interval in ms).
+    """
+    header, lines, intervals = None, [], []
+    for file_path in sorted(glob.glob(os.path.join(folder, '*.csv'))):
+        with open(file_path, encoding='utf-8-sig') as file:
+            file_header = file.readline().rstrip('\r\n')
+            if header is None:
+                header = file_header
+            elif file_header != header:
+                print(f"Skipping {file_path}: its header differs from the other logs")
+                continue
+            timestamps = []
+            for line in file:
+                fields = line.rstrip('\r\n').split(';', 2)
+                if len(fields) < 3 or not fields[1].isdigit():
+                    continue
+                timestamps.append(int(fields[1]))
+                lines.append(fields[2])
+        differences = np.diff(timestamps)
+        intervals.extend(differences[differences > 0])
+    if not lines:
+        raise ValueError(f"No gaze logs in {folder}")
+    return header, lines, float(np.median(intervals)) if intervals else 1000 / 90
+
+
+class FrameStream:
+    """
+    The endless frame sequence of one simulated user: the corpus lines from `offset` on, looping around,
+    with Frame and TimeStamp rewritten to count up from the user's own start.
+    """
+    def __init__(self, header, lines, offset, frame_interval_ms, first_frame=1, first_timestamp=None):
+        self.header = header
+        self.lines = lines
+        self.offset = offset
+        self.frame_interval_ms = frame_interval_ms
+        self.first_frame = first_frame
+        self.first_timestamp = int(time.time() * 1000) if first_timestamp is None else first_timestamp
+
+    def window(self, start, size):
+        """Returns frames [start, start + size) as the CSV text the client uploads."""
+        rows = [self.header]
+        for index in range(start, start + size):
+            timestamp = self.first_timestamp + round(index * self.frame_interval_ms)
+            rest = self.lines[(self.offset + index) % len(self.lines)]
+            rows.append(f"{self.first_frame + index};{timestamp};{rest}")
+        return ('\n'.join(rows) + '\n').encode('utf-8')
+
+
+def multipart_body(field, filename, data, content_type='text/csv'):
+    """
+    Encodes one file as multipart/form-data, like UnityWebRequest.Post with a WWWForm.
+
+    Returns:
+    - tuple: (body bytes, Content-Type header value).
+    """
+    boundary = uuid.uuid4().hex
+    head = (f'--{boundary}\r\nContent-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+            f'Content-Type: {content_type}\r\n\r\n').encode()
+    return head + data + f'\r\n--{boundary}--\r\n'.encode(), f'multipart/form-data; boundary={boundary}'
+
+
+def post(opener, url, body, content_type, timeout):
+    """
+    Posts `body` and reads the response.
+
+    Returns:
+    - tuple: (HTTP status or None if no response arrived, decoded JSON or None, latency in seconds).
+    """
+    request = urllib.request.Request(url, data=body, headers={'Content-Type': content_type}, method='POST')
+    start = time.perf_counter()
+    try:
+        with opener.open(request, timeout=timeout) as response:
+            status, payload = response.status, response.read()
+    except urllib.error.HTTPError as e:
+        status, payload = e.code, e.read()
+    except OSError:
+        return None, None, time.perf_counter() - start
+    latency = time.perf_counter() - start
+    try:
+        return status, json.loads(payload), latency
+    except ValueError:
+        return status, None, latency
+
+
+class SimulatedUser:
+    """One Unity client: its own cookie session and frame stream, uploading a window every `interval` seconds."""
+    def __init__(self, base_url, user_id, stream, window, interval, timeout):
+        self.base_url = base_url
+        self.user_id = user_id
+        self.stream = stream
+        self.window = window
+        self.interval = interval
+        self.timeout = timeout
+        # The Flask session cookie set by /start_session identifies the user on /upload
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+
+    def start_session(self):
+        body = urllib.parse.urlencode({'user_id': self.user_id}).encode()
+        status, _, _ = post(self.opener, self.base_url + '/start_session', body,
+                            'application/x-www-form-urlencoded', self.timeout)
+        return status == 200
+
+    def upload(self, window_index):
+        """Uploads one window. Returns a result record for the report."""
+        data = self.stream.window(window_index * self.window, self.window)
+        body, content_type = multipart_body('file', 'GazeData.csv', data)
+        status, response, latency = post(self.opener, self.base_url + '/upload', body, content_type, self.timeout)
+        response = response if isinstance(response, dict) else {}
+        return {'status': status, 'latency': latency, 'finished': time.perf_counter(),
+                'coalesced': bool(response.get('Coalesced')), 'cached': bool(response.get('Cached'))}
+
+    def run(self, executor, start, deadline, futures, lock):
+        """Submits an upload to `executor` at every window boundary until `deadline`, without waiting for answers."""
+        window_index = 0
+        while True:
+            # The first window is complete one interval after the session starts
+            send_at = start + (window_index + 1) * self.interval
+            if send_at > deadline:
+                return
+            time.sleep(max(0.0, send_at - time.perf_counter()))
+            future = executor.submit(self.upload, window_index)
+            with lock:
+                futures.append(future)
+            window_index += 1
+
+
+def run_phase(base_url, header, lines, frame_interval_ms, users, window, duration, speedup, timeout):
+    """
+    Runs `users` simulated users uploading `window`-frame windows for `duration` seconds.
+
+    Returns:
+    - dict: The phase report, see summarize.
+    """
+    interval = window * frame_interval_ms / 1000 / speedup
+    simulated = [SimulatedUser(base_url, f'loadtest-{index + 1}',
+                               FrameStream(header, lines, index * len(lines) // users, frame_interval_ms),
+                               window, interval, timeout)
+                 for index in range(users)]
+    session_errors = sum(not user.start_session() for user in simulated)
+    if session_errors == users:
+        raise ConnectionError(f"No simulated user could start a session at {base_url}, is the server running?")
+
+    futures, lock = [], threading.Lock()
+    # Enough threads for every user to have a few uploads in flight, as the client's coroutines allow
+    with ThreadPoolExecutor(max_workers=users * 4) as executor:
+        start = time.perf_counter()
+        deadline = start + duration
+        threads = [threading.Thread(target=user.run, args=(executor, start, deadline, futures, lock), daemon=True)
+                   for user in simulated]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    records = [future.result() for future in futures]
+    return summarize(records, window, users, interval, start, session_errors)
+
+
+def summarize(records, window, users, interval, start, session_errors=0):
+    """
+    Reduces the upload records of one phase.
+
+    Returns:
+    - dict: Request counts, error rate, latency percentiles in ms, throughput in windows and frames per
+      second, and the share of uploads answered later than the next upload was due ('late').
+    """
+    succeeded = [record for record in records if record['status'] == 200]
+    latencies = np.array([record['latency'] for record in succeeded])
+    elapsed = max((record['finished'] for record in records), default=start) - start
+    report = {
+        'window': window, 'users': users, 'interval_seconds': interval,
+        'requests': len(records), 'errors': len(records) - len(succeeded), 'session_errors': session_errors,
+        'error_rate': (len(records) - len(succeeded)) / len(records) if records else 0.0,
+        'coalesced': sum(record['coalesced'] for record in succeeded),
+        'cached': sum(record['cached'] for record in succeeded),
+        'late_rate': float(np.mean(latencies > interval)) if len(latencies) else 0.0,
+        'windows_per_second': len(succeeded) / elapsed if elapsed > 0 else 0.0,
+        'frames_per_second': len(succeeded) * window / elapsed if elapsed > 0 else 0.0,
+    }
+    for percentile in (50, 95, 99):
+        report[f'p{percentile}_ms'] = float(np.percentile(latencies, percentile) * 1000) if len(latencies) else None
+    return report
+
+
+def print_report(reports):
+    print(f"{'window':>6} {'users':>5} {'requests':>8} {'errors':>6} {'err %':>6} {'p50 ms':>8} {'p95 ms':>8} "
+          f"{'p99 ms':>8} {'win/s':>7} {'frames/s':>9} {'late %':>6} {'coal.':>5} {'no session':>10}")
+    for report in reports:
+        percentiles = ' '.join(f"{report[name]:8.1f}" if report[name] is not None else f"{'-':>8}"
+                               for name in ('p50_ms', 'p95_ms', 'p99_ms'))
+        print(f"{report['window']:>6} {report['users']:>5} {report['requests']:>8} {report['errors']:>6} "
+              f"{report['error_rate'] * 100:6.1f} {percentiles} {report['windows_per_second']:7.2f} "
+              f"{report['frames_per_second']:9.0f} {report['late_rate'] * 100:6.1f} {report['coalesced']:>5} {report['session_errors']:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://127.0.0.1:5000', help='Server address, as serverURL in Unity')
+    parser.add_argument('--users', type=int, default=30, help='Concurrent simulated users')
+    parser.add_argument('--windows', type=int, nargs='+', default=list(WINDOW_SIZES), help='Frames per upload')
+    parser.add_argument('--duration', type=float, default=60, help='Seconds each window size is run')
+    parser.add_argument('--fps', type=float, default=None,
+                        help='Frames per second of the headsets (default: the median rate of the logs)')
+    parser.add_argument('--speedup', type=float, default=1.0, help='Upload this many times faster than real time')
+    parser.add_argument('--timeout', type=float, default=60, help='Seconds before an upload counts as failed')
+    parser.add_argument('--folder', default='uploads', help='Logs to replay')
+    parser.add_argument('--json', help='Also write the reports to this JSON file')
+    args = parser.parse_args()
+
+    header, lines, frame_interval_ms = load_frame_lines(args.folder)
+    if args.fps:
+        frame_interval_ms = 1000 / args.fps
+    print(f"Replaying {len(lines)} frames at {1000 / frame_interval_ms:.0f} fps, {args.users} users, "
+          f"{args.duration:g} s per window size against {args.url}")
+
+    reports = []
+    for window in args.windows:
+        reports.append(run_phase(args.url.rstrip('/'), header, lines, frame_interval_ms, args.users, window,
+                                 args.duration, args.speedup, args.timeout))
+        print(f"{window}-frame windows: {reports[-1]['requests']} uploads, {reports[-1]['errors']} errors")
+    print()
+    print_report(reports)
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(reports, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,15 +1,41 @@
 import os
 import pandas as pd
 import numpy as np
-from collections import defaultdict
+from collections import Counter, OrderedDict, defaultdict, deque
+from collections.abc import Mapping
 import json
-from scipy.signal import savgol_filter
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy.signal import savgol_coeffs, savgol_filter
 import matplotlib.pyplot as plt
 import pickle
-from flask import Flask, request, session, jsonify
+import hashlib
+import queue
+import struct
+import threading
+import time
+import atexit
+import bisect
+import contextlib
+import copy
+import io
+import logging
+import sys
+import multiprocessing
+from concurrent.futures import CancelledError, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from flask import Flask, Response, g, request, session, jsonify
 from werkzeug.utils import secure_filename
 from datetime import timedelta
-
+try:
+    import pyarrow  # Optional, needed for the Parquet/Arrow upload archive
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+try:
+    import resource  # Peak memory gauges, not available on Windows
+except ImportError:
+    resource = None
 
 
 # Global Parameters
@@ -29,6 +55,279 @@ HEAD_VELOCITY_THRESHOLD = 7  # Head velocity threshold for fixation
 GAZE_VELOCITY_FIXATION_THRESHOLD = 30  # Gaze velocity threshold for fixation
 GAZE_VELOCITY_SACCADE_THRESHOLD = 40  # Gaze velocity threshold for saccade
 
+ISOLATED_OUTLIER_WINDOW = 0.2  # Centered window (seconds) of the isolated velocity outlier filter, None disables it
+ISOLATED_OUTLIER_THRESHOLD = 5  # Velocities more than this many MADs from their window median are outliers
+UPLOAD_OUTLIER_FILTER = False  # Also apply the outlier filter in 'summary' mode (/upload, /timeline_analysis)
+
+#BLINK & TRACKING LOSS PARAMETERS
+EYE_CLOSED_OPENNESS = 0.1  # Eye openness below which an eye counts as closed
+BLINK_MIN_DURATION = 0.05  # Shortest gap (seconds) counted as a blink, shorter gaps are tracking glitches
+BLINK_MAX_DURATION = 0.5  # Longest gap (seconds) counted as a blink, longer gaps are tracking loss
+MAX_FRAME_GAP = 0.1  # Time step (seconds) between frames beyond which frames are missing, kinematics break there
+
+#QUANTILE SKETCH PARAMETERS
+SKETCH_K = 200  # Compactor size of the quantile sketches, quantiles are off by about 1.7 / SKETCH_K in rank
+SKETCH_PERCENTILES = (50, 90, 99)  # Percentiles reported from the sketches
+
+# Movement type codes used by the run-length classifier, MOVEMENT_TYPES maps them back to labels
+OUTLIER, FIXATION_CANDIDATE, SACCADE_CANDIDATE, FIXATION, SACCADE = range(5)
+MOVEMENT_TYPES = np.array(['outlier', 'fixation_candidate', 'saccade_candidate', 'fixation', 'saccade'], dtype=object)
+
+# Column types of the ';'-separated GazeData log written by Unity. Numeric fields use decimal commas.
+GAZE_LOG_CATEGORICAL_COLUMNS = ['GazeStatus', 'LeftEyeStatus', 'RightEyeStatus', 'Condition', 'Scene', 'Task',
+                                'GazedObject', 'ClickedObject', 'QuizAnswer', 'ChatBot']
+GAZE_LOG_SCHEMA = {
+    'Frame': 'int64',
+    'TimeStamp': 'int64',  # Milliseconds (ticks in some older logs)
+    'LogTime': 'float64',
+    'HeadPositionX': 'float64', 'HeadPositionY': 'float64', 'HeadPositionZ': 'float64',
+    'HeadDirectionX': 'float64', 'HeadDirectionY': 'float64', 'HeadDirectionZ': 'float64',
+    'GazeStatus': 'category',
+    'CombinedGazeForwardX': 'float64', 'CombinedGazeForwardY': 'float64', 'CombinedGazeForwardZ': 'float64',
+    'CombinedGazePositionX': 'float64', 'CombinedGazePositionY': 'float64', 'CombinedGazePositionZ': 'float64',
+    'InterPupillaryDistanceInMM': 'float64',
+    'LeftEyeStatus': 'category',
+    'LeftGazeDirectionX': 'float64', 'LeftGazeDirectionY': 'float64', 'LeftGazeDirectionZ': 'float64',
+    'LeftEyePositionX': 'float64', 'LeftEyePositionY': 'float64', 'LeftEyePositionZ': 'float64',
+    'LeftPupilIrisDiameterRatio': 'float64', 'LeftPupilDiameterInMM': 'float64', 'LeftIrisDiameterInMM': 'float64',
+    'LeftEyeOpenness': 'float64',
+    'RightEyeStatus': 'category',
+    'RightGazeDirectionX': 'float64', 'RightGazeDirectionY': 'float64', 'RightGazeDirectionZ': 'float64',
+    'RightEyePositionX': 'float64', 'RightEyePositionY': 'float64', 'RightEyePositionZ': 'float64',
+    'RightPupilIrisDiameterRatio': 'float64', 'RightPupilDiameterInMM': 'float64', 'RightIrisDiameterInMM': 'float64',
+    'RightEyeOpenness': 'float64',
+    'FocusDistance': 'float64', 'FocusStability': 'float64',
+    'Condition': 'category', 'Scene': 'category', 'Task': 'category', 'GazedObject': 'category',
+    'ClickedObject': 'category', 'QuizAnswer': 'category', 'ChatBot': 'category'
+}
+# An empty numeric field is a missing value, an empty string field (e.g. no GazedObject) stays an empty string
+GAZE_LOG_NA_VALUES = {column: [''] for column in GAZE_LOG_SCHEMA if column not in GAZE_LOG_CATEGORICAL_COLUMNS}
+
+# Columns the /upload analysis reads. The remaining eye position/iris/focus columns are only needed for research exports.
+ANALYSIS_COLUMNS = [
+    'Frame', 'TimeStamp', 'GazeStatus',
+    'HeadPositionX', 'HeadPositionY', 'HeadPositionZ', 'HeadDirectionX', 'HeadDirectionY', 'HeadDirectionZ',
+    'CombinedGazeForwardX', 'CombinedGazeForwardY', 'CombinedGazeForwardZ',
+    'CombinedGazePositionX', 'CombinedGazePositionY', 'CombinedGazePositionZ',
+    'LeftPupilDiameterInMM', 'RightPupilDiameterInMM', 'Task', 'GazedObject',
+    'LeftEyeStatus', 'RightEyeStatus', 'LeftEyeOpenness', 'RightEyeOpenness'  # Blink and tracking loss segmentation
+]
+
+# Binary gaze frame upload format (all fields little-endian):
+#   header        magic 'GZF1', uint16 version, uint16 reserved, uint32 frame count, uint32 string table size
+#   string table  UTF-8 strings separated by NUL bytes, referenced by index from the string columns
+#   columns       one block per GAZE_FRAME_COLUMNS entry holding frame-count values, each block padded to 8 bytes
+# String columns store uint16 indices into the string table, GAZE_FRAME_MISSING marks an empty field.
+GAZE_FRAME_MAGIC = b'GZF1'
+GAZE_FRAME_VERSION = 2  # 2 added the eye status and openness columns
+GAZE_FRAME_HEADER = struct.Struct('<4sHHII')
+GAZE_FRAME_MISSING = 0xFFFF
+GAZE_FRAME_STRING_COLUMNS = ['GazeStatus', 'Scene', 'Task', 'GazedObject', 'LeftEyeStatus', 'RightEyeStatus']
+GAZE_FRAME_COLUMNS = [
+    ('Frame', '<i8'), ('TimeStamp', '<f8'),
+    ('HeadPositionX', '<f4'), ('HeadPositionY', '<f4'), ('HeadPositionZ', '<f4'),
+    ('HeadDirectionX', '<f4'), ('HeadDirectionY', '<f4'), ('HeadDirectionZ', '<f4'),
+    ('CombinedGazeForwardX', '<f4'), ('CombinedGazeForwardY', '<f4'), ('CombinedGazeForwardZ', '<f4'),
+    ('CombinedGazePositionX', '<f4'), ('CombinedGazePositionY', '<f4'), ('CombinedGazePositionZ', '<f4'),
+    ('LeftPupilDiameterInMM', '<f4'), ('RightPupilDiameterInMM', '<f4'),
+    ('LeftEyeOpenness', '<f4'), ('RightEyeOpenness', '<f4'),
+] + [(column, '<u2') for column in GAZE_FRAME_STRING_COLUMNS]
+
+# Typed columnar archive formats (need pyarrow), by file extension. Categorical columns are stored dictionary-encoded.
+GAZE_ARCHIVE_FORMATS = {'.parquet': 'parquet', '.arrow': 'arrow'}
+# Per-user gaze timeline files, see GazeTimeline. The record layout version is part of the name, so a timeline
+# written with other GAZE_FRAME_COLUMNS is never read with the current layout.
+GAZE_TIMELINE_EXTENSION = f'.v{GAZE_FRAME_VERSION}.gzt'
+
+# Sample layout of angular_velocity_kernel: gaze target/origin, then head target/origin, each as x, y, z
+KINEMATICS_COLUMNS = [
+    'CombinedGazeForwardX', 'CombinedGazeForwardY', 'CombinedGazeForwardZ',
+    'CombinedGazePositionX', 'CombinedGazePositionY', 'CombinedGazePositionZ',
+    'HeadDirectionX', 'HeadDirectionY', 'HeadDirectionZ',
+    'HeadPositionX', 'HeadPositionY', 'HeadPositionZ'
+]
+
+# Analysis modes: 'full' builds every per-row payload for research exports, 'features' the per-session statistics of
+# the cohort pipeline (batch.py), 'summary' only what the /upload results need
+ANALYSIS_MODES = ('full', 'features', 'summary')
+
+# Server messages go through this logger, its level and rate limit are set from app.config
+logger = logging.getLogger('eye_tracking')
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Lets at most `burst` records with the same level and message template through per `interval` seconds,
+    so a message logged on every request cannot flood the output under load. The first record after a
+    suppressed stretch reports how many were dropped.
+    """
+
+    def __init__(self, burst=10, interval=60.0):
+        super().__init__()
+        self.burst = burst
+        self.interval = interval
+        self._windows = {}  # (level, template) -> [window start, records let through, records suppressed]
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        key = (record.levelno, record.msg)
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.setdefault(key, [now, 0, 0])
+            if now - window[0] >= self.interval:
+                window[0], window[1] = now, 0
+            if window[1] >= self.burst:
+                window[2] += 1
+                return False
+            window[1] += 1
+            suppressed, window[2] = window[2], 0
+        if suppressed:
+            record.msg = f"{record.msg} ({suppressed} similar messages suppressed)"
+        return True
+
+
+# Metrics exposed at /metrics: name -> (type, help)
+METRICS = {
+    'gaze_stage_seconds': ('histogram', 'Time spent in each analysis stage'),
+    'gaze_stage_rows_total': ('counter', 'Rows processed by each analysis stage'),
+    'gaze_stage_seconds_total': ('counter', 'Total time spent in each analysis stage'),
+    'gaze_stage_rows_per_second': ('gauge', 'Rows per second of each analysis stage since the server started'),
+    'gaze_request_seconds': ('histogram', 'Request latency by endpoint'),
+    'gaze_requests_total': ('counter', 'Requests by endpoint and status code'),
+    'gaze_analysis_seconds': ('histogram', 'Compute time of an /upload analysis in its worker'),
+    'gaze_queue_wait_seconds': ('histogram', 'Time an /upload window waited for an analysis worker'),
+    'gaze_uploads_total': ('counter', 'Analyzed /upload windows by outcome (cached, coalesced, analyzed)'),
+    'gaze_peak_memory_bytes': ('gauge', 'Peak resident memory of the server and of the largest analysis worker'),
+}
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class MetricsRegistry:
+    """
+    Thread-safe counters, gauges and latency histograms of the names in METRICS, rendered in the
+    Prometheus text exposition format. Every metric holds one series per set of label values.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._series = defaultdict(dict)  # name -> {labels: value, or [bucket counts, sum, count] for histograms}
+        self._lock = threading.Lock()
+
+    def inc(self, name, value=1.0, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._series[name][key] = self._series[name].get(key, 0.0) + value
+
+    def set(self, name, value, **labels):
+        with self._lock:
+            self._series[name][tuple(sorted(labels.items()))] = value
+
+    def set_max(self, name, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._series[name][key] = max(self._series[name].get(key, value), value)
+
+    def observe(self, name, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series[name].get(key)
+            if series is None:
+                series = self._series[name][key] = [[0] * len(self.buckets), 0.0, 0]
+            bucket = bisect.bisect_left(self.buckets, value)  # First bound >= value, values above all bounds only count in +Inf
+            if bucket < len(self.buckets):
+                series[0][bucket] += 1
+            series[1] += value
+            series[2] += 1
+
+    def get(self, name, **labels):
+        """Returns the value of a counter or gauge series, None if it was never set."""
+        with self._lock:
+            return self._series[name].get(tuple(sorted(labels.items())))
+
+    def render(self):
+        """Returns every metric in the Prometheus text format."""
+        def label_text(labels, extra=()):
+            pairs = [f'{name}="{value}"' for name, value in labels + tuple(extra)]
+            return '{' + ','.join(pairs) + '}' if pairs else ''
+
+        lines = []
+        with self._lock:
+            for name, (kind, help_text) in METRICS.items():
+                series = self._series.get(name)
+                if not series:
+                    continue
+                lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+                for labels, value in sorted(series.items()):
+                    if kind != 'histogram':
+                        lines.append(f'{name}{label_text(labels)} {value}')
+                        continue
+                    bucket_counts, total, count = value
+                    cumulative = 0
+                    for bound, bucket_count in zip(self.buckets, bucket_counts):
+                        cumulative += bucket_count
+                        lines.append(f'{name}_bucket{label_text(labels, [("le", bound)])} {cumulative}')
+                    lines.append(f'{name}_bucket{label_text(labels, [("le", "+Inf")])} {count}')
+                    lines.append(f'{name}_sum{label_text(labels)} {total}')
+                    lines.append(f'{name}_count{label_text(labels)} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+metrics = MetricsRegistry()
+_stage_collector = threading.local()
+
+
+def peak_memory_bytes():
+    """Returns the peak resident memory of this process, None where the resource module is missing."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024  # Kilobytes on Linux, bytes on macOS
+
+
+def observe_stages(samples):
+    """Adds (stage, seconds, rows) timings to the stage metrics."""
+    for stage, seconds, rows in samples:
+        metrics.observe('gaze_stage_seconds', seconds, stage=stage)
+        metrics.inc('gaze_stage_seconds_total', seconds, stage=stage)
+        metrics.inc('gaze_stage_rows_total', rows, stage=stage)
+        total_rows = metrics.get('gaze_stage_rows_total', stage=stage)
+        total_seconds = metrics.get('gaze_stage_seconds_total', stage=stage)
+        if total_rows and total_seconds:  # Stages without rows (serialization) have no throughput
+            metrics.set('gaze_stage_rows_per_second', total_rows / total_seconds, stage=stage)
+
+
+@contextlib.contextmanager
+def stage_timer(stage, rows=0):
+    """
+    Times the enclosed block as analysis stage `stage`, which processed `rows` rows. Yields a dict whose
+    'rows' entry can be set inside the block when the row count is only known there.
+    """
+    start = time.perf_counter()
+    timing = {'rows': rows}
+    try:
+        yield timing
+    finally:
+        sample = (stage, time.perf_counter() - start, timing['rows'])
+        samples = getattr(_stage_collector, 'samples', None)
+        if samples is not None:
+            samples.append(sample)
+        else:
+            observe_stages([sample])
+
+
+@contextlib.contextmanager
+def collect_stages():
+    """
+    Collects the stage timings of the enclosed block in a list instead of adding them to the metrics,
+    so an analysis worker process can send them back to the server.
+    """
+    previous = getattr(_stage_collector, 'samples', None)
+    _stage_collector.samples = samples = []
+    try:
+        yield samples
+    finally:
+        _stage_collector.samples = previous
+
 # Correct answers for the video games questionnaire
 video_games_correct_answers = {
     '1': 'Tennis for Two',
@@ -102,83 +401,263 @@ def calculate_scores(results, correct_answers):
 
     return scores
 
-def process_pupil_diameter_data(df):
+class IncrementalPupilProcessor:
+    """
+    Causal pupil diameter pipeline for streaming sessions (/ingest) that processes each sample once, as it arrives.
+    Offline analysis, where the whole recording is at hand, smooths with the centered filter instead.
+
+    - Smoothing: a Savitzky-Golay filter (WINDOW_LENGTH, POLYORDER) whose convolution coefficients are
+      computed once. Each sample is the polynomial fit of itself and the previous WINDOW_LENGTH - 1
+      samples, evaluated at its own time, kept in a ring buffer. The first sample fills the buffer, like
+      savgol_filter's 'nearest' mode at the start.
+    - Baseline: the mean smoothed diameter over the first BASELINE_DURATION seconds of the session,
+      captured once. It stays fixed afterwards, so baseline-corrected values can be compared between uploads.
+    - Statistics: running count, min, max, mean and variance (Welford, each batch combined with Chan's
+      formula) of the smoothed diameter. Baseline-corrected and min-max normalized statistics follow from
+      them, as dividing by the baseline and normalizing are linear.
+
+    Each sample costs O(WINDOW_LENGTH), and samples at or before the last processed time are skipped, so
+    overlapping uploads are not counted twice.
+    """
+
+    def __init__(self, window_length=WINDOW_LENGTH, polyorder=POLYORDER, baseline_duration=BASELINE_DURATION):
+        self.coefficients = savgol_coeffs(window_length, polyorder, pos=window_length - 1, use='dot')
+        self.ring = np.zeros(window_length)
+        self.position = 0  # Oldest sample of the ring, overwritten next
+        self.last_time = None
+
+        self.baseline_duration = baseline_duration
+        self.baseline_end = None
+        self.baseline_sum = 0.0
+        self.baseline_count = 0
+
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0  # Sum of squared differences from the mean
+        self.min = np.inf
+        self.max = -np.inf
+
+    def update(self, timestamps, diameters):
+        """
+        Smooths new samples and adds them to the baseline and the statistics.
+
+        Parameters:
+        - timestamps (array-like): Sample times in seconds, ascending.
+        - diameters (array-like): Pupil diameters, NaN where not measured.
+
+        Returns:
+        - ndarray: Smoothed diameter of every sample, NaN for unmeasured and already processed samples.
+        """
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+        diameters = np.asarray(diameters, dtype=np.float64)
+        smoothed = np.full(len(diameters), np.nan)
+        new = ~np.isnan(diameters)
+        if self.last_time is not None:
+            new &= timestamps > self.last_time
+        samples = np.flatnonzero(new)
+        if not len(samples):
+            return smoothed
+        values, times = diameters[samples], timestamps[samples]
+
+        window_length = len(self.coefficients)
+        if self.last_time is None:
+            self.ring[:] = values[0]
+        history = self.ring[(self.position + np.arange(1, window_length)) % window_length]
+        windows = sliding_window_view(np.concatenate((history, values)), window_length)
+        values_smoothed = windows @ self.coefficients
+        smoothed[samples] = values_smoothed
+
+        newest = values[-window_length:]
+        self.ring[(self.position + np.arange(len(newest))) % window_length] = newest
+        self.position = (self.position + len(newest)) % window_length
+        self._accumulate(times, values_smoothed)
+        return smoothed
+
+    def add_smoothed(self, timestamps, smoothed):
+        """
+        Adds diameters smoothed elsewhere, e.g. by the centered filter of an /upload window, to the baseline
+        and the statistics. Like update it skips unmeasured samples and those at or before the last processed time.
+
+        Parameters:
+        - timestamps (array-like): Sample times in seconds, ascending.
+        - smoothed (array-like): Smoothed pupil diameters, NaN where not measured.
+        """
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+        smoothed = np.asarray(smoothed, dtype=np.float64)
+        new = ~np.isnan(smoothed)
+        if self.last_time is not None:
+            new &= timestamps > self.last_time
+        if new.any():
+            self._accumulate(timestamps[new], smoothed[new])
+
+    def _accumulate(self, times, values_smoothed):
+        """Adds new smoothed samples to the baseline and the running statistics."""
+        if self.last_time is None:
+            self.baseline_end = times[0] + self.baseline_duration
+        self.last_time = times[-1]
+
+        in_baseline = times <= self.baseline_end
+        self.baseline_sum += values_smoothed[in_baseline].sum()
+        self.baseline_count += int(in_baseline.sum())
+
+        batch_count = len(values_smoothed)
+        batch_mean = values_smoothed.mean()
+        total = self.count + batch_count
+        delta = batch_mean - self.mean
+        self.mean += delta * batch_count / total
+        self.m2 += np.square(values_smoothed - batch_mean).sum() + delta ** 2 * self.count * batch_count / total
+        self.count = total
+        self.min = min(self.min, values_smoothed.min())
+        self.max = max(self.max, values_smoothed.max())
+
+    @property
+    def baseline(self):
+        """Mean smoothed diameter of the baseline period, NaN before the first sample."""
+        return self.baseline_sum / self.baseline_count if self.baseline_count else np.nan
+
+    @property
+    def baseline_final(self):
+        """Whether the baseline period is over and the baseline no longer changes."""
+        return self.last_time is not None and self.last_time > self.baseline_end
+
+    def normalize(self, smoothed):
+        """Min-max normalizes smoothed diameters with the running min and max."""
+        return (np.asarray(smoothed) - self.min) / (self.max - self.min)
+
+    def statistics(self):
+        """
+        Returns the statistics of every sample so far.
+
+        Returns:
+        - dict: 'baseline_pupil_diameter', 'baseline_corrected_statistics' (smoothed diameter divided by
+          the baseline) and, as process_pupil_diameter_data reports them, the min-max normalized
+          'normalized_statistics' and 'normalized_corrected_statistics'. Each statistics dict has
+          min_pupil_diameter, max_pupil_diameter, mean_pupil_diameter, std_pupil_diameter and count.
+        """
+        std = np.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else np.nan
+        baseline = self.baseline
+        if self.count:
+            corrected = {'min_pupil_diameter': self.min / baseline, 'max_pupil_diameter': self.max / baseline,
+                         'mean_pupil_diameter': self.mean / baseline, 'std_pupil_diameter': std / baseline,
+                         'count': self.count}
+        else:
+            corrected = {'min_pupil_diameter': np.nan, 'max_pupil_diameter': np.nan, 'mean_pupil_diameter': np.nan,
+                         'std_pupil_diameter': np.nan, 'count': 0}
+
+        value_range = self.max - self.min
+        if self.count and value_range > 0:
+            normalized = {'min_pupil_diameter': 0.0, 'max_pupil_diameter': 1.0,
+                          'mean_pupil_diameter': (self.mean - self.min) / value_range,
+                          'std_pupil_diameter': std / value_range, 'count': self.count}
+        else:
+            normalized = {'min_pupil_diameter': np.nan, 'max_pupil_diameter': np.nan, 'mean_pupil_diameter': np.nan,
+                          'std_pupil_diameter': np.nan, 'count': self.count}
+        return {
+            'baseline_pupil_diameter': baseline,
+            'baseline_corrected_statistics': corrected,
+            # The baseline scales every value alike, min-max normalization removes it again
+            'normalized_corrected_statistics': normalized,
+            'normalized_statistics': dict(normalized)
+        }
+
+
+def process_pupil_diameter_data(df, mode='full', sketches=None, processor=None):
     """
     Processes pupil diameter data, including smoothing, baseline correction,
     normalization (with and without baseline correction), and calculating statistics.
 
+    Without a `processor` the frames are a whole recording or upload window, analyzed offline: centered
+    Savitzky-Golay smoothing, a baseline over the first BASELINE_DURATION seconds of the frames and
+    statistics of the frames alone. /upload windows are analyzed statelessly, so their baselines are
+    per window. With a session's `processor` (streaming /ingest) the frames run through the
+    IncrementalPupilProcessor instead: causal smoothing, and the baseline, the min-max range and the
+    statistics of the whole session so far, so they stay consistent between batches.
+
     Parameters:
-    - df (DataFrame): DataFrame containing TimeStamp and AvgPupilDiameter columns.
+    - df (DataFrame): Frames with TimeStamp (seconds), GazeStatus and the pupil diameter columns.
+    - mode (str): 'full' or 'summary', see ANALYSIS_MODES. 'summary' returns only the statistics.
+    - sketches (MetricSketches or None): If given, the average pupil diameters (mm) are added to its
+      'pupil_diameter' sketch.
+    - processor (IncrementalPupilProcessor or None): Session processor to continue, offline analysis if None.
 
     Returns:
-    - pupil_data_dict (dict): Dictionary containing processed pupil data and statistics.
+    - pupil_data_dict (dict): Dictionary containing processed pupil data and the statistics, with the
+      keys of IncrementalPupilProcessor.statistics.
     """
 
     # Extract pupil diameter data
     pupil_df = get_pupil_diameter_data(df)
-    pupil_df.fillna(value=0)
-    # Step 1: Smooth Pupil Diameter Data
-    window_length = WINDOW_LENGTH  # Example window length for smoothing
-    polyorder = POLYORDER  # Example polynomial order for smoothing
-    pupil_df['SmoothedPupilDiameter'] = savgol_filter(pupil_df['AvgPupilDiameter'], window_length, polyorder,
-                                                      0, 1.0,
-                                                    -1, 'nearest', 0.0)
-
-    # Step 2: Baseline Correction (Subtractive)
-    baseline_duration = BASELINE_DURATION  # in seconds
-    baseline_end_time = pupil_df['TimeStamp'].iloc[0] + baseline_duration
-    baseline_data = pupil_df[pupil_df['TimeStamp'] <= baseline_end_time]
-    baseline_value = baseline_data['SmoothedPupilDiameter'].mean()
-
-    pupil_df['BaselineCorrectedPupilDiameter'] = pupil_df['SmoothedPupilDiameter'] / baseline_value
-
-    # Step 3: Normalize Baseline-Corrected Pupil Diameter
-    min_corrected = pupil_df['BaselineCorrectedPupilDiameter'].min()
-    max_corrected = pupil_df['BaselineCorrectedPupilDiameter'].max()
-    pupil_df['NormalizedCorrectedPupilDiameter'] = (
-        pupil_df['BaselineCorrectedPupilDiameter'] - min_corrected
-    ) / (max_corrected - min_corrected)
-
-    # Step 4: Normalize Pupil Diameter Without Baseline Correction
-    min_original = pupil_df['SmoothedPupilDiameter'].min()
-    max_original = pupil_df['SmoothedPupilDiameter'].max()
-    pupil_df['NormalizedPupilDiameter'] = (
-        pupil_df['SmoothedPupilDiameter'] - min_original
-    ) / (max_original - min_original)
-
-    # Analyze statistics for normalized corrected data
-    normalized_corrected_stats = {
-        'min_pupil_diameter': pupil_df['NormalizedCorrectedPupilDiameter'].min(),
-        'max_pupil_diameter': pupil_df['NormalizedCorrectedPupilDiameter'].max(),
-        'mean_pupil_diameter': pupil_df['NormalizedCorrectedPupilDiameter'].mean(),
-        'std_pupil_diameter': pupil_df['NormalizedCorrectedPupilDiameter'].std(),
-        'count': pupil_df['NormalizedCorrectedPupilDiameter'].count()
-    }
-
-    # Analyze statistics for normalized data without baseline correction
-    normalized_stats = {
-        'min_pupil_diameter': pupil_df['NormalizedPupilDiameter'].min(),
-        'max_pupil_diameter': pupil_df['NormalizedPupilDiameter'].max(),
-        'mean_pupil_diameter': pupil_df['NormalizedPupilDiameter'].mean(),
-        'std_pupil_diameter': pupil_df['NormalizedPupilDiameter'].std(),
-        'count': pupil_df['NormalizedPupilDiameter'].count()
-    }
+    if sketches is not None:
+        sketches.update('pupil_diameter', pupil_df['AvgPupilDiameter'].to_numpy(dtype=float))
+
+    if processor is not None:
+        # Streaming: smooth the new samples causally, then derive the baseline-corrected and normalized values
+        smoothed = processor.update(pupil_df['TimeStamp'].to_numpy(dtype=float),
+                                    pupil_df['AvgPupilDiameter'].to_numpy(dtype=float))
+        pupil_data_dict = processor.statistics()
+        if mode == 'summary':
+            return pupil_data_dict
+        pupil_df['SmoothedPupilDiameter'] = smoothed
+        pupil_df['BaselineCorrectedPupilDiameter'] = smoothed / processor.baseline
+        pupil_df['NormalizedPupilDiameter'] = processor.normalize(smoothed)
+        pupil_df['NormalizedCorrectedPupilDiameter'] = pupil_df['NormalizedPupilDiameter']
+    else:
+        # Step 1: Smooth Pupil Diameter Data, centered as the whole recording is at hand
+        pupil_df['SmoothedPupilDiameter'] = smooth_pupil_diameter(pupil_df['AvgPupilDiameter'])
+
+        # Step 2: Baseline Correction over the first BASELINE_DURATION seconds
+        baseline_value = np.nan
+        if len(pupil_df):
+            baseline_end_time = pupil_df['TimeStamp'].iloc[0] + BASELINE_DURATION
+            baseline_value = pupil_df.loc[pupil_df['TimeStamp'] <= baseline_end_time, 'SmoothedPupilDiameter'].mean()
+        pupil_df['BaselineCorrectedPupilDiameter'] = pupil_df['SmoothedPupilDiameter'] / baseline_value
+
+        # Step 3: Min-max normalize with and without baseline correction
+        for column, source in (('NormalizedCorrectedPupilDiameter', 'BaselineCorrectedPupilDiameter'),
+                               ('NormalizedPupilDiameter', 'SmoothedPupilDiameter')):
+            pupil_df[column] = (pupil_df[source] - pupil_df[source].min()) / (pupil_df[source].max() - pupil_df[source].min())
+
+        pupil_data_dict = {
+            'baseline_pupil_diameter': baseline_value,
+            'baseline_corrected_statistics': get_pupil_statistics(pupil_df['BaselineCorrectedPupilDiameter']),
+            'normalized_corrected_statistics': get_pupil_statistics(pupil_df['NormalizedCorrectedPupilDiameter']),
+            'normalized_statistics': get_pupil_statistics(pupil_df['NormalizedPupilDiameter'])
+        }
+        if mode == 'summary':
+            return pupil_data_dict
 
-    # Prepare the result dictionary
-    pupil_data_dict = {
+    # Add the series to the statistics
+    pupil_data_dict.update({
         'smoothed_pupil_data': pupil_df[['TimeStamp', 'SmoothedPupilDiameter']].to_dict(orient='list'),
         'baseline_corrected_pupil_data': pupil_df[['TimeStamp', 'BaselineCorrectedPupilDiameter']].to_dict(orient='list'),
         'normalized_corrected_pupil_data': pupil_df[['TimeStamp', 'NormalizedCorrectedPupilDiameter']].to_dict(orient='list'),
-        'normalized_pupil_data': pupil_df[['TimeStamp', 'NormalizedPupilDiameter']].to_dict(orient='list'),
-        'normalized_corrected_statistics': normalized_corrected_stats,
-        'normalized_statistics': normalized_stats
-    }
-
+        'normalized_pupil_data': pupil_df[['TimeStamp', 'NormalizedPupilDiameter']].to_dict(orient='list')
+    })
     return pupil_data_dict
 
 
+def smooth_pupil_diameter(diameters):
+    """Smooths a whole recording of pupil diameters with the centered Savitzky-Golay filter (WINDOW_LENGTH, POLYORDER)."""
+    return savgol_filter(np.asarray(diameters, dtype=float), WINDOW_LENGTH, POLYORDER, mode='nearest')
+
 
+def get_pupil_statistics(values):
+    """
+    Returns the min, max, mean, standard deviation and count of pupil diameter values, skipping NaN.
 
+    Parameters:
+    - values (Series): Pupil diameter values.
+
+    Returns:
+    - dict: min_pupil_diameter, max_pupil_diameter, mean_pupil_diameter, std_pupil_diameter and count.
+    """
+    return {
+        'min_pupil_diameter': values.min(),
+        'max_pupil_diameter': values.max(),
+        'mean_pupil_diameter': values.mean(),
+        'std_pupil_diameter': values.std(),
+        'count': int(values.count())
+    }
 
 
 def get_pupil_diameter_data(df):
@@ -281,171 +760,459 @@ def get_valid_head_and_gaze_movements(df):
 
 
 def analyze_eye_movements(eye_movement_df):
+    """
+    Fixation and saccade statistics over the frames of an eye_movement_df, from the FrameDuration of
+    every frame labeled with the type (grouped reductions, see grouped_duration_totals).
+
+    Returns:
+    - dict: 'fixation_stats' and 'saccade_stats' with min/max/mean/total frame duration, frame count and
+      percentage_time, and the 'total_time' of all frames.
+    """
     # Ensure the 'MovementType' and 'FrameDuration' columns exist in the DataFrame
     if 'MovementType' not in eye_movement_df.columns or 'FrameDuration' not in eye_movement_df.columns:
         raise ValueError("The DataFrame must contain 'MovementType' and 'FrameDuration' columns.")
 
-    # Filter fixations and saccades
-    fixations = eye_movement_df[eye_movement_df['MovementType'] == 'fixation']
-    saccades = eye_movement_df[eye_movement_df['MovementType'] == 'saccade']
-
-    # Calculate statistics for fixations
-    fixation_durations = fixations['FrameDuration']
-    fixation_stats = {
-        'min_duration': fixation_durations.min(),
-        'max_duration': fixation_durations.max(),
-        'mean_duration': fixation_durations.mean(),
-        'total_duration': fixation_durations.sum(),
-        'count': fixation_durations.count()
-    }
-
-    # Calculate statistics for saccades
-    saccade_durations = saccades['FrameDuration']
-    saccade_stats = {
-        'min_duration': saccade_durations.min(),
-        'max_duration': saccade_durations.max(),
-        'mean_duration': saccade_durations.mean(),
-        'total_duration': saccade_durations.sum(),
-        'count': saccade_durations.count()
-    }
+    movement_types = ['fixation', 'saccade']
+    codes = pd.Categorical(eye_movement_df['MovementType'], categories=movement_types).codes
+    frame_durations = eye_movement_df['FrameDuration'].to_numpy(dtype=float)
+    # Like Series.min/max/mean/sum/count, frames without a duration are skipped
+    counted = (codes >= 0) & ~np.isnan(frame_durations)
+    counts, totals, minimums, maximums = grouped_duration_totals(codes[counted], frame_durations[counted],
+                                                                 len(movement_types))
 
     # Total time in the DataFrame
     total_time = eye_movement_df['FrameDuration'].sum()
 
-    # Calculate percentages
-    fixation_percentage = fixation_stats['total_duration'] / total_time * 100
-    saccade_percentage = saccade_stats['total_duration'] / total_time * 100
+    statistics = {}
+    for code, movement_type in enumerate(movement_types):
+        statistics[f'{movement_type}_stats'] = {
+            'min_duration': minimums[code],
+            'max_duration': maximums[code],
+            'mean_duration': totals[code] / counts[code] if counts[code] else np.nan,
+            'total_duration': totals[code],
+            'count': int(counts[code]),
+            'percentage_time': np.float64(totals[code]) / total_time * 100
+        }
+    statistics['total_time'] = total_time
 
-    # Add percentage information
-    fixation_stats['percentage_time'] = fixation_percentage
-    saccade_stats['percentage_time'] = saccade_percentage
+    return statistics
 
-    # Combine results
-    statistics = {
-        'fixation_stats': fixation_stats,
-        'saccade_stats': saccade_stats,
-        'total_time': total_time
-    }
 
-    return statistics
+def read_gaze_log(source, columns='all'):
+    """
+    Reads a Unity GazeData log straight into typed columns.
+
+    Decimal-comma numerics are parsed into float64/int64 columns and the string columns are kept
+    categorical, following GAZE_LOG_SCHEMA. Empty numeric fields become NaN, empty string fields stay
+    empty strings (GAZE_LOG_NA_VALUES). Rows with more fields than the header lose the trailing
+    fields, and rows with fewer fields are padded with NaN. If a value does not fit its declared type,
+    the file is parsed again as text and the numeric columns are coerced (invalid values become NaN).
+
+    Only the requested columns are parsed, the others are skipped by the tokenizer and never converted.
+
+    Parameters:
+    - source (str or file-like): Path of the log file or an open binary/text stream.
+    - columns (str or list): 'all' for every header field, 'analysis' for ANALYSIS_COLUMNS,
+      or an explicit list of column names.
+
+    Returns:
+    - df (DataFrame): The log with one column per selected header field.
+    """
+    if columns == 'all':
+        selected = None
+    else:
+        selected = set(ANALYSIS_COLUMNS if columns == 'analysis' else columns)
+
+    # A usecols callable makes the parser drop extra trailing fields instead of failing on them
+    read_options = {'sep': ';', 'decimal': ',', 'keep_default_na': False, 'na_values': GAZE_LOG_NA_VALUES,
+                    'usecols': lambda column: selected is None or column in selected}
+    try:
+        return pd.read_csv(source, dtype=GAZE_LOG_SCHEMA, **read_options)
+    except pd.errors.EmptyDataError:
+        return pd.DataFrame()
+    except ValueError:
+        if hasattr(source, 'seek'):
+            source.seek(0)
+
+    df = pd.read_csv(source, dtype=str, **read_options)
+    for column in df.columns:
+        if column in GAZE_LOG_CATEGORICAL_COLUMNS:
+            df[column] = df[column].astype('category')
+        else:
+            df[column] = pd.to_numeric(df[column].str.replace(',', '.', regex=False), errors='coerce')
+    return df
+
+
+def _pad8(size):
+    """Rounds a byte count up to the next multiple of 8."""
+    return (size + 7) & ~7
+
+
+def encode_gaze_frames(df):
+    """
+    Encodes frames into the binary gaze frame format described at GAZE_FRAME_COLUMNS.
+
+    Values are written with the Unity float32 precision, TimeStamp stays in milliseconds.
+
+    Parameters:
+    - df (DataFrame): Frames as returned by read_gaze_log. GAZE_FRAME_COLUMNS columns it lacks (e.g. the eye
+      status and openness of older logs) are written as missing: GAZE_FRAME_MISSING or NaN.
+
+    Returns:
+    - bytes: The encoded frames.
+    """
+    strings, string_index = [], {}
+    codes = {}
+    for column in GAZE_FRAME_STRING_COLUMNS:
+        if column not in df.columns:
+            codes[column] = np.full(len(df), GAZE_FRAME_MISSING, dtype='<u2')
+            continue
+        column_codes, uniques = pd.factorize(df[column])
+        table_codes = np.array([string_index.setdefault(str(value), len(string_index)) for value in uniques] + [GAZE_FRAME_MISSING], dtype='<u2')
+        codes[column] = table_codes[column_codes]  # factorize marks missing values with -1, the last entry
+    strings = list(string_index)
+    if len(strings) >= GAZE_FRAME_MISSING:
+        raise ValueError(f"Too many distinct strings for the gaze frame format: {len(strings)}")
+
+    string_table = '\0'.join(strings).encode('utf-8')
+    header = GAZE_FRAME_HEADER.pack(GAZE_FRAME_MAGIC, GAZE_FRAME_VERSION, 0, len(df), len(string_table))
+    parts = [header, string_table, bytes(_pad8(len(string_table)) - len(string_table))]
+    for column, dtype in GAZE_FRAME_COLUMNS:
+        if column in codes:
+            values = codes[column]
+        elif column in df.columns:
+            values = df[column].to_numpy(dtype=dtype)
+        else:
+            values = np.full(len(df), np.nan, dtype=dtype)
+        block = values.tobytes()
+        parts += [block, bytes(_pad8(len(block)) - len(block))]
+    return b''.join(parts)
+
+
+def decode_gaze_frames(buffer):
+    """
+    Decodes the binary gaze frame format without copying the column data.
+
+    Parameters:
+    - buffer (bytes-like): An encoded upload, see encode_gaze_frames.
+
+    Returns:
+    - tuple: (columns, strings) where columns maps each GAZE_FRAME_COLUMNS name to a read-only
+      array viewing `buffer`, and strings is the string table the string column codes index into.
+    """
+    buffer = memoryview(buffer)
+    if len(buffer) < GAZE_FRAME_HEADER.size:
+        raise ValueError("Gaze frame upload is shorter than its header")
+    magic, version, _, frame_count, string_table_size = GAZE_FRAME_HEADER.unpack_from(buffer)
+    if magic != GAZE_FRAME_MAGIC or version != GAZE_FRAME_VERSION:
+        raise ValueError(f"Unsupported gaze frame upload (magic {magic!r}, version {version})")
+
+    offset = GAZE_FRAME_HEADER.size
+    string_table = bytes(buffer[offset:offset + string_table_size]).decode('utf-8')
+    strings = string_table.split('\0') if string_table_size else []
+    offset = _pad8(offset + string_table_size)
+
+    columns = {}
+    for column, dtype in GAZE_FRAME_COLUMNS:
+        dtype = np.dtype(dtype)
+        columns[column] = np.frombuffer(buffer, dtype=dtype, count=frame_count, offset=offset)
+        offset += _pad8(dtype.itemsize * frame_count)
+    return columns, strings
+
+
+def gaze_frames_to_dataframe(columns, strings):
+    """
+    Builds the analysis DataFrame from decoded gaze frames.
+
+    Float32 fields are widened to float64 so the angle computations keep their precision, and the
+    string columns become categoricals over the string table.
+
+    Parameters:
+    - columns (dict): Column arrays as returned by decode_gaze_frames.
+    - strings (list): The string table of the upload.
+
+    Returns:
+    - df (DataFrame): Frames in the layout read_gaze_log produces, TimeStamp in milliseconds.
+    """
+    categories = pd.Index(strings, dtype=object)
+    data = {}
+    for column, dtype in GAZE_FRAME_COLUMNS:
+        values = columns[column]
+        if column in GAZE_FRAME_STRING_COLUMNS:
+            codes = np.where(values == GAZE_FRAME_MISSING, -1, values.astype(np.int32))
+            data[column] = pd.Categorical.from_codes(codes, categories=categories).remove_unused_categories()
+        elif column == 'Frame':
+            data[column] = values.astype(np.int64)
+        else:
+            data[column] = values.astype(np.float64)
+    return pd.DataFrame(data)
+
 
+def gaze_archive_format(file_path):
+    """Returns 'parquet' or 'arrow' for a columnar archive file, None for anything else (e.g. a CSV log)."""
+    return GAZE_ARCHIVE_FORMATS.get(os.path.splitext(file_path)[1].lower())
 
-def process_log_file(file_path):
+
+def write_gaze_archive(df, file_path, archive_format='parquet'):
+    """
+    Writes frames as a zstd-compressed typed columnar file, Parquet or Arrow IPC. Needs pyarrow.
+    Values keep their read_gaze_log dtypes, so an archived log analyzes exactly like its CSV.
+
+    Parameters:
+    - df (DataFrame): Frames as returned by read_gaze_log.
+    - file_path (str): Destination path, the extension is not checked.
+    - archive_format (str): 'parquet' or 'arrow', see GAZE_ARCHIVE_FORMATS.
+    """
+    if pyarrow is None:
+        raise ImportError("The columnar gaze archive needs pyarrow (pip install pyarrow)")
+    table = pyarrow.Table.from_pandas(df, preserve_index=False)
+    if archive_format == 'parquet':
+        pyarrow.parquet.write_table(table, file_path, compression='zstd')
+    else:
+        options = pyarrow.ipc.IpcWriteOptions(compression='zstd')
+        with pyarrow.OSFile(file_path, 'wb') as sink, pyarrow.ipc.new_file(sink, table.schema, options=options) as writer:
+            writer.write_table(table)
+
+
+def read_gaze_archive(file_path, columns='all'):
+    """
+    Reads a Parquet or Arrow IPC file written by write_gaze_archive. Needs pyarrow.
+
+    Parameters:
+    - file_path (str): Path of the archive file, the format follows its extension.
+    - columns (str or list): 'all', 'analysis' or a list of column names, see read_gaze_log.
+      Only the selected columns are read from disk.
+
+    Returns:
+    - df (DataFrame): The frames with the dtypes read_gaze_log produces.
+    """
+    if pyarrow is None:
+        raise ImportError("The columnar gaze archive needs pyarrow (pip install pyarrow)")
+    if gaze_archive_format(file_path) == 'parquet':
+        reader = pyarrow.parquet.ParquetFile(file_path)
+        schema = reader.schema_arrow
+    else:
+        reader = pyarrow.ipc.open_file(pyarrow.memory_map(file_path))
+        schema = reader.schema
+    selected = None
+    if columns != 'all':
+        wanted = set(ANALYSIS_COLUMNS if columns == 'analysis' else columns)
+        selected = [name for name in schema.names if name in wanted]
+
+    if gaze_archive_format(file_path) == 'parquet':
+        table = reader.read(columns=selected)
+    else:
+        table = reader.read_all()
+        if selected is not None:
+            table = table.select(selected)
+    return table.to_pandas()
+
+
+def load_gaze_frames(file_path, columns='all'):
+    """
+    Reads a GazeData log from its CSV text, a columnar archive file or a gaze timeline, see read_gaze_log.
+    Gaze timelines only hold the GAZE_FRAME_COLUMNS.
+    """
+    if gaze_archive_format(file_path):
+        return read_gaze_archive(file_path, columns)
+    if file_path.endswith(GAZE_TIMELINE_EXTENSION):
+        df = GazeTimeline(file_path).range()
+        if columns != 'all':
+            wanted = set(ANALYSIS_COLUMNS if columns == 'analysis' else columns)
+            df = df[[column for column in df.columns if column in wanted]]
+        return df
+    return read_gaze_log(file_path, columns)
+
+
+def add_fixations_to_dwell_index(gaze_dwell, df, object_ids, segments):
+    """
+    Adds the fixation samples of classified frames to a gaze dwell index.
+
+    Parameters:
+    - gaze_dwell (GazeDwellIndex): Index the frames were added to.
+    - df (DataFrame): The frames, with TimeStamp and GazeStatus.
+    - object_ids (ndarray): Object index of every frame, as returned by GazeDwellIndex.update.
+    - segments (MovementSegments): Movements of the valid frames, in sample order.
+    """
+    valid = (df['GazeStatus'] == 'VALID').to_numpy()
+    fixation = segments.sample_mask(FIXATION, int(valid.sum()))
+    gaze_dwell.add_fixations(df['TimeStamp'].to_numpy(dtype=float)[valid][fixation], object_ids[valid][fixation])
+
+
+def process_log_file(file_path, columns='all', mode='full'):
+    """
+    Loads a GazeData log and runs the eye-tracking analysis on it.
+
+    Parameters:
+    - file_path (str): Path of the log file, a CSV log or a Parquet/Arrow archive file.
+    - columns (str or list): Columns to load, see read_gaze_log. Use 'all' for research exports
+      and 'analysis' when only the /upload results are needed.
+    - mode (str): 'full', 'features' or 'summary', see process_log_dataframe.
+
+    Returns:
+    - tuple: (result_dict, df), or None if the file cannot be analyzed.
+    """
     if os.path.isfile(file_path):
-        with open(file_path, 'r') as file:
-            lines = file.readlines()
+        df = load_gaze_frames(file_path, columns)
+        return process_log_dataframe(df, file_path, mode)
+    else:
+        logger.warning("File %s does not exist.", file_path)
+        return None
 
-        rows = [line.strip().split(';') for line in lines]
-        headers = rows[0]
-        data = rows[1:]
-        for i in range(len(data)):
-            if len(data[i]) > len(headers):
-                data[i] = data[i][:-1]
 
-        df = pd.DataFrame(data, columns=headers)
+def process_log_dataframe(df, source='<memory>', mode='full'):
+    """
+    Runs the eye-tracking analysis on frames that are already loaded.
 
-        if df.empty:
-            print(f"File {file_path} is empty.")
-            return None
+    In 'summary' mode only what the /upload results need is computed: total durations, average_fps,
+    gazed_object_durations, eye_movement_statistics and the pupil statistics. 'features' adds the per-session
+    statistics of the cohort pipeline: gaze_dwell, quantile_sketches (a MetricSketches of the movements and
+    pupil diameters), tracking_gaps and tracking_quality (see find_tracking_gaps and tracking_quality). The
+    per-row payloads (first_rows, gazed_object_column, head_and_gaze_df, eye_movement_df, eye_movement_dict,
+    movement_segments, combined_df and the pupil series) are only built in 'full' mode. The isolated velocity
+    outlier filter runs in 'summary' mode only with UPLOAD_OUTLIER_FILTER.
 
-        # Check if 'TimeStamp' column exists
-        if 'TimeStamp' not in df.columns:
-            print(f"The 'TimeStamp' column is missing in the file {file_path}.")
-            return None
-        
-        # Check if 'TimeStamp' column exists
-        if df['GazeStatus'].all == 'INVALID':
-            print(f"The GazeStatus column is missing in the file {file_path}.")
-            return None
+    Parameters:
+    - df (DataFrame): Frames as returned by read_gaze_log or gaze_frames_to_dataframe, TimeStamp in milliseconds.
+    - source (str): Name of the frames' origin used in messages.
+    - mode (str): 'full', 'features' or 'summary', see ANALYSIS_MODES.
 
-        
-        # Convert 'TimeStamp' to numeric and handle errors
-        df['TimeStamp'] = df['TimeStamp'].astype(str).str.replace(',', '.', regex=False)
-        df['TimeStamp'] = pd.to_numeric(df['TimeStamp'], errors='coerce') / 1000.0  # Convert to seconds
-        non_digit_columns = ['GazeStatus', 'Condition', 'Scene', 'Task', 'GazedObject', 'ClickedObject', 'QuizAnswer', 'ChatBot']
-        # Apply conversion only to columns that are not in non_digit_columns
-        df = df.apply(lambda col: col.astype(str).str.replace(',', '.', regex=False).apply(pd.to_numeric, errors='coerce') if col.name not in non_digit_columns else col)
-        
-        
-        # Check if 'TimeStamp' column has valid data
-        if df['TimeStamp'].isnull().all():
-            print(f"All 'TimeStamp' values are invalid in the file {file_path}.")
-            return None
+    Returns:
+    - tuple: (result_dict, df), or None if the frames cannot be analyzed.
+    """
 
-        if df['TimeStamp'].isnull().any() or df['GazedObject'].isnull().any():
-            print("Error: Missing data in 'TimeStamp' or 'GazedObject' columns")
-            return None
-        
-        total_duration_seconds = df['TimeStamp'].iloc[-1] - df['TimeStamp'].iloc[0]
-        print(f"Total Duration (Seconds): {total_duration_seconds}")
+    if df.empty:
+        logger.warning("File %s is empty.", source)
+        return None
 
-        total_duration_minutes = total_duration_seconds / 60.0
-        print(f"Total Duration (Minutes): {total_duration_minutes}")
+    # Check if 'TimeStamp' column exists
+    if 'TimeStamp' not in df.columns:
+        logger.warning("The 'TimeStamp' column is missing in the file %s.", source)
+        return None
+    
+    # Check if 'TimeStamp' column exists
+    if df['GazeStatus'].all == 'INVALID':
+        logger.warning("The GazeStatus column is missing in the file %s.", source)
+        return None
 
-        total_frames = df.shape[0]
-        average_fps = total_frames / total_duration_seconds if total_duration_seconds > 0 else 0
-        print(f"Average FPS: {average_fps}")
+    df['TimeStamp'] = df['TimeStamp'] / 1000.0  # Convert to seconds
 
-        df['FrameDuration'] = df['TimeStamp'].diff().fillna(0)
-        df['GazeObjectDuration'] = df.groupby('GazedObject')['FrameDuration'].transform('sum')
-        total_gaze_duration = df['GazeObjectDuration'].sum()
-        normalized_durations = df.groupby('GazedObject')['GazeObjectDuration'].sum() / total_gaze_duration
-
-        result_dict = {}
-        result_dict['total_duration_minutes'] = total_duration_minutes
-        result_dict['total_duration_seconds'] = total_duration_seconds
-        result_dict['column_names'] = df.columns.tolist()
-        result_dict['first_rows'] = df.head().to_dict(orient='records')
-
-        if 'GazedObject' in df.columns:
-            result_dict['gazed_object_column'] = df['GazedObject'].tolist()
-            result_dict['unique_gazed_objects'] = df['GazedObject'].unique().tolist()
-            gazed_object_counts = df['GazedObject'].value_counts()
-            total_count = gazed_object_counts.sum()
-            result_dict['gazed_object_ratios'] = (gazed_object_counts / total_count).to_dict()
-            gazed_object_duration = df.groupby('GazedObject')['FrameDuration'].sum().to_dict()
-            result_dict['gazed_object_durations'] = gazed_object_duration
-            result_dict['normalized_gazed_object_durations'] = normalized_durations.to_dict()
+    # Check if 'TimeStamp' column has valid data
+    if df['TimeStamp'].isnull().all():
+        logger.warning("All 'TimeStamp' values are invalid in the file %s.", source)
+        return None
+
+    if df['TimeStamp'].isnull().any() or df['GazedObject'].isnull().any():
+        logger.warning("Missing data in 'TimeStamp' or 'GazedObject' columns of %s", source)
+        return None
+    
+    total_duration_seconds = df['TimeStamp'].iloc[-1] - df['TimeStamp'].iloc[0]
+    logger.debug("Total Duration (Seconds): %s", total_duration_seconds)
+
+    total_duration_minutes = total_duration_seconds / 60.0
+    logger.debug("Total Duration (Minutes): %s", total_duration_minutes)
 
+    total_frames = df.shape[0]
+    average_fps = total_frames / total_duration_seconds if total_duration_seconds > 0 else 0
+    logger.debug("Average FPS: %s", average_fps)
+
+    df['FrameDuration'] = df['TimeStamp'].diff().fillna(0)
+
+    result_dict = {}
+    result_dict['total_duration_minutes'] = total_duration_minutes
+    result_dict['total_duration_seconds'] = total_duration_seconds
+
+    gaze_dwell = GazeDwellIndex()
+    object_ids = gaze_dwell.update(df)
+
+    # The kinematics break at every gap in the valid samples
+    breaks = find_gap_breaks(df['GazeStatus'] == 'VALID', df['TimeStamp'])
+    if mode != 'summary':
+        # Blinks and tracking loss
+        with stage_timer('tracking_gaps', len(df)):
+            result_dict['tracking_gaps'] = find_tracking_gaps(df)
+            result_dict['tracking_quality'] = tracking_quality(df, result_dict['tracking_gaps'])
+
+    if mode != 'full':
+        result_dict['gazed_object_durations'] = gaze_dwell.dwell_durations()
         result_dict['average_fps'] = average_fps
-        head_and_gaze_df = get_valid_head_and_gaze_movements(df)
-        result_dict['head_and_gaze_df'] = head_and_gaze_df
+        stats, _, eye_movement_dict = detect_fixations_and_saccades(
+            get_valid_head_and_gaze_movements(df), 'summary', breaks, outlier_filter=mode == 'features' or UPLOAD_OUTLIER_FILTER)
+        result_dict['eye_movement_statistics'] = stats
+        sketches = None
+        if mode == 'features':
+            add_fixations_to_dwell_index(gaze_dwell, df, object_ids, eye_movement_dict.segments)
+            result_dict['gaze_dwell'] = gaze_dwell.to_dict()
+            sketches = result_dict['quantile_sketches'] = MetricSketches()
+            sketches.add_segments(eye_movement_dict.segments)
+        with stage_timer('pupil', len(df)):
+            result_dict['pupil_data'] = process_pupil_diameter_data(df, 'summary', sketches)
+        return result_dict,df
+
+    result_dict['column_names'] = df.columns.tolist()
+    result_dict['first_rows'] = df.head().to_dict(orient='records')
+
+    if 'GazedObject' in df.columns:
+        result_dict['gazed_object_column'] = df['GazedObject'].tolist()
+        result_dict['unique_gazed_objects'] = df['GazedObject'].unique().tolist()
+        result_dict['gazed_object_ratios'] = gaze_dwell.frame_ratios()
+        result_dict['gazed_object_durations'] = gaze_dwell.dwell_durations()
+        # Each object's dwell weighted by its frame count, as the former GazeObjectDuration column summed up
+        weighted_dwell = {gazed_object: entry['frame_count'] * entry['total_dwell']
+                          for gazed_object, entry in gaze_dwell.to_dict().items()}
+        total_weighted_dwell = sum(weighted_dwell.values())
+        result_dict['normalized_gazed_object_durations'] = {gazed_object: dwell / total_weighted_dwell
+                                                            for gazed_object, dwell in weighted_dwell.items()}
+
+    result_dict['average_fps'] = average_fps
+    head_and_gaze_df = get_valid_head_and_gaze_movements(df)
+    result_dict['head_and_gaze_df'] = head_and_gaze_df
 
     
-        stats,eye_movement_df,eye_movement_dict = detect_fixations_and_saccades(head_and_gaze_df)
+    stats,eye_movement_df,eye_movement_dict = detect_fixations_and_saccades(head_and_gaze_df, breaks=breaks)
+    add_fixations_to_dwell_index(gaze_dwell, df, object_ids, eye_movement_dict.segments)
+    result_dict['gaze_dwell'] = gaze_dwell.to_dict()
 
-        result_dict['eye_movement_statistics'] = stats
-        result_dict['eye_movement_df'] = eye_movement_df
-        result_dict['eye_movement_dict'] = eye_movement_dict
-
-        # Combine eye_movement_df back into the original df
-        combined_df = df.merge(
-            eye_movement_df[['TimeStamp', 'MovementType', 'EyeMovementID']],
-            on='TimeStamp',
-            how='left'
-        )
-        # Fill NaN values in the combined DataFrame for non-matching rows
-        combined_df['MovementType'] = combined_df['MovementType'].fillna('Invalid')
-        combined_df['EyeMovementID'] = combined_df['EyeMovementID'].fillna(-1)
+    result_dict['eye_movement_statistics'] = stats
+    result_dict['eye_movement_df'] = eye_movement_df
+    result_dict['eye_movement_dict'] = eye_movement_dict
+    result_dict['movement_segments'] = eye_movement_dict.segments
+    result_dict['quantile_sketches'] = MetricSketches()
+    result_dict['quantile_sketches'].add_segments(eye_movement_dict.segments)
 
-        result_dict['combined_df'] = combined_df
+    # Combine eye_movement_df back into the original df
+    combined_df = df.merge(
+        eye_movement_df[['TimeStamp', 'MovementType', 'EyeMovementID']],
+        on='TimeStamp',
+        how='left'
+    )
+    # Fill NaN values in the combined DataFrame for non-matching rows
+    combined_df['MovementType'] = combined_df['MovementType'].fillna('Invalid')
+    combined_df['EyeMovementID'] = combined_df['EyeMovementID'].fillna(-1)
+
+    result_dict['combined_df'] = combined_df
 
     
-        # Process pupil diameter data using the new function
-        pupil_data = process_pupil_diameter_data(df)
-        
-        result_dict['pupil_data'] = pupil_data
+    # Process pupil diameter data using the new function
+    with stage_timer('pupil', len(df)):
+        pupil_data = process_pupil_diameter_data(df, sketches=result_dict['quantile_sketches'])
+    
+    result_dict['pupil_data'] = pupil_data
 
-        return result_dict,df
-    else:
-        print(f"File {file_path} does not exist.")
-        return None
+    return result_dict,df
 
 
 
 
 def reclassify_short_fixations_as_saccades(df, min_fixation_duration=0.100):
+    """
+    Relabels fixations shorter than `min_fixation_duration` (sum of their FrameDuration) as saccades and
+    renumbers the movements: every run of frames with the same MovementType gets one EyeMovementID,
+    counting up from 2.
 
+    Returns:
+    - DataFrame: A relabeled copy of `df`.
+    """
     # Create a copy of the DataFrame to avoid modifying the original
     df_copy = df.copy()
 
@@ -458,21 +1225,11 @@ def reclassify_short_fixations_as_saccades(df, min_fixation_duration=0.100):
     # Reclassify short fixations as saccades
     df_copy.loc[df_copy['EyeMovementID'].isin(short_fixation_ids) & (df_copy['MovementType'] == 'fixation'), 'MovementType'] = 'saccade'
 
-    # Recalculate the IDs for fixations and saccades
-    movement_types = df_copy['MovementType'].tolist()
-    recalculated_ids = []
-    current_id = 1
-    last_type = None
-
-    for movement_type in movement_types:
-        if movement_type == last_type:
-            recalculated_ids.append(current_id)
-        else:
-            current_id += 1
-            recalculated_ids.append(current_id)
-            last_type = movement_type
-
-    df_copy['EyeMovementID'] = recalculated_ids
+    # A new ID starts wherever the type changes (missing types never equal each other)
+    movement_types = df_copy['MovementType'].to_numpy(dtype=object)
+    changes = np.ones(len(movement_types), dtype=bool)
+    changes[1:] = movement_types[1:] != movement_types[:-1]
+    df_copy['EyeMovementID'] = np.cumsum(changes) + 1
 
     return df_copy
 
@@ -496,15 +1253,238 @@ def calculate_head_direction_vectors(valid_gaze_df):
 
 
 def calculate_angles_and_angular_velocity(vectors, timestamps):
-    dot_products = (vectors.shift(1) * vectors).sum(axis=1)
-    dot_products = np.clip(dot_products, -1.0, 1.0)
-    angles = np.arccos(dot_products)
+    previous = vectors.shift(1).to_numpy()
+    dot_products = (previous * vectors.to_numpy()).sum(axis=1)
+    # arctan2 keeps small angles precise where arccos of a cosine near 1 does not
+    cross_norms = np.linalg.norm(np.cross(previous, vectors.to_numpy()), axis=1)
+    angles = pd.Series(np.arctan2(cross_norms, dot_products), index=vectors.index)
     angular_velocity = angles / timestamps.diff().fillna(1)
     angular_velocity_deg = np.degrees(angular_velocity)
     return angles, angular_velocity_deg
 
 
 
+def angular_velocity_kernel(samples, timestamps, threshold=500, dtype=np.float64, previous=None, breaks=None):
+    """
+    Computes gaze and head angular velocities and repairs gaze velocity spikes in one pass over an (N, 12) array.
+
+    Gaze and head vectors (target minus origin) are normalized together as an (N, 2, 3) block, and the angle
+    between consecutive samples divided by their time difference gives the velocity in degrees per second.
+    Gaze velocities above `threshold` or undefined (e.g. a zero time step) are replaced by linear
+    interpolation between the surrounding good samples, as interpolate_high_angular_velocities does.
+
+    Parameters:
+    - samples (array-like): (N, 12) samples in KINEMATICS_COLUMNS order.
+    - timestamps (array-like): N timestamps in seconds.
+    - threshold (float or None): Gaze spike threshold in degrees per second, None skips the repair.
+    - dtype: np.float64, or np.float32 to halve the memory traffic. The angles are taken with arctan2 of the
+      cross and dot products, which stays precise for the small angles between consecutive samples, where
+      arccos of a float32 cosine near 1 resolves only about 0.02 degrees.
+    - previous (tuple or None): (sample, timestamp) preceding `samples`, e.g. the last sample of the
+      previous batch. Without it the first sample has no velocity (NaN).
+    - breaks (array-like or None): Boolean per sample, True where a gap precedes it (see find_gap_breaks).
+      No velocity is computed across a gap: these samples get NaN gaze and head velocities, which the spike
+      repair leaves alone.
+
+    Returns:
+    - tuple: (gaze_velocity, head_velocity, repaired) arrays of length N. `repaired` marks the gaze samples
+      that were replaced, those before the first good sample are NaN.
+    """
+    samples = np.asarray(samples, dtype=dtype)
+    timestamps = np.asarray(timestamps, dtype=np.float64)
+    if previous is not None:
+        samples = np.vstack((np.asarray(previous[0], dtype=dtype), samples))
+        timestamps = np.concatenate(([previous[1]], timestamps))
+    n = len(timestamps)
+
+    # (N, gaze/head, target/origin, xyz) -> unit vectors (N, gaze/head, xyz)
+    points = samples.reshape(n, 2, 2, 3)
+    vectors = points[:, :, 0] - points[:, :, 1]
+    vectors /= np.sqrt(np.einsum('ijk,ijk->ij', vectors, vectors))[..., None]
+
+    # Angle to the previous sample from the sine (cross product norm) and cosine (dot product), laid out (gaze/head, N)
+    cosines = np.full((2, n), np.nan, dtype=dtype)
+    np.einsum('ijk,ijk->ji', vectors[1:], vectors[:-1], out=cosines[:, 1:])
+    sines = np.full((2, n), np.nan, dtype=dtype)
+    (x, y, z), (px, py, pz) = vectors[1:].T, vectors[:-1].T  # (gaze/head, N - 1) per axis
+    np.sqrt((y * pz - z * py) ** 2 + (z * px - x * pz) ** 2 + (x * py - y * px) ** 2, out=sines[:, 1:])
+    time_steps = np.full(n, np.nan, dtype=dtype)
+    time_steps[1:] = np.diff(timestamps)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        velocities = np.degrees(np.arctan2(sines, cosines, out=cosines), out=cosines)
+        velocities /= time_steps
+    if previous is not None:
+        velocities = velocities[:, 1:]
+    gaze_velocity, head_velocity = velocities[0], velocities[1]
+    breaks = np.zeros(len(gaze_velocity), dtype=bool) if breaks is None else np.asarray(breaks, dtype=bool)
+    velocities[:, breaks] = np.nan
+
+    if threshold is None:
+        return gaze_velocity, head_velocity, np.zeros(len(gaze_velocity), dtype=bool)
+
+    repaired = ~(gaze_velocity <= threshold) & ~breaks
+    bad_positions = np.flatnonzero(repaired)
+    if len(bad_positions):
+        good_positions = np.flatnonzero(gaze_velocity <= threshold)
+        if len(good_positions):
+            gaze_velocity[bad_positions] = np.interp(bad_positions, good_positions, gaze_velocity[good_positions])
+            gaze_velocity[bad_positions[bad_positions < good_positions[0]]] = np.nan
+        else:
+            gaze_velocity[:] = np.nan
+    return gaze_velocity, head_velocity, repaired
+
+
+def _find_run_root(parent, run):
+    """Returns the root run of `run` in the union-find forest, halving the path on the way."""
+    while parent[run] != run:
+        parent[run] = parent[parent[run]]
+        run = parent[run]
+    return run
+
+
+def build_run_table(movement_types, eye_movement_ids):
+    """
+    Collapses per-point movement types and IDs into a run table with one entry per contiguous block of
+    one movement ID.
+
+    Returns:
+        tuple: Run lengths (array), run IDs (list) and run types (list).
+    """
+    ids = np.asarray(eye_movement_ids)
+    run_starts = np.concatenate(([0], np.flatnonzero(ids[1:] != ids[:-1]) + 1))
+    run_lengths = np.diff(np.append(run_starts, len(ids)))
+    run_ids = ids[run_starts].tolist()
+    run_types = [movement_types[start] for start in run_starts.tolist()]
+    return run_lengths, run_ids, run_types
+
+
+def merge_outlier_runs(run_lengths, run_ids, run_types, movement_durations, movement_amplitudes, movement_velocities,
+                       movement_type, max_duration):
+    """
+    Merges single-sample outliers that sit between two movements of `movement_type` (or its candidate)
+    into one movement, in a single pass over a run table.
+
+    A merged group is tracked with a union-find forest whose root is the leftmost run, so the group
+    keeps the ID of its first movement.
+
+    Args:
+        run_lengths (sequence): Number of points in each run.
+        run_ids (list): Movement ID of each run.
+        run_types (list): Movement type of each run.
+        movement_durations (dict): Movement durations keyed by movement ID.
+        movement_amplitudes (dict): Movement amplitudes keyed by movement ID.
+        movement_velocities (dict): All velocity values keyed by movement ID.
+        movement_type (str): 'fixation' or 'saccade'.
+        max_duration (float): Merged movements must stay shorter than this duration.
+
+    Returns:
+        tuple: Run IDs, run types, updated movement durations, updated movement amplitudes,
+        updated movement velocities. Run IDs and types reflect the merges.
+    """
+    new_movement_durations = movement_durations.copy()
+    new_movement_amplitudes = movement_amplitudes.copy()
+    new_movement_velocities = movement_velocities.copy()
+
+    run_types = list(run_types)
+    parent = list(range(len(run_ids)))
+
+    mergeable_types = (movement_type, movement_type + '_candidate')
+
+    for run in range(1, len(run_ids) - 1):
+        # Only single-point outliers between two movements of the same kind are merged
+        if run_types[run] != 'outlier' or run_lengths[run] != 1:
+            continue
+        root = _find_run_root(parent, run - 1)
+        if run_types[root] not in mergeable_types or run_types[run + 1] not in mergeable_types:
+            continue
+
+        prev_id = run_ids[root]
+        next_id = run_ids[run + 1]
+        outlier_id = run_ids[run]
+
+        # Calculate combined duration for merged movement
+        combined_duration = (
+            new_movement_durations.get(prev_id, 0) +
+            new_movement_durations.get(next_id, 0) +
+            new_movement_durations.get(outlier_id, 0)  # Include outlier duration
+        )
+
+        if combined_duration < max_duration:
+            # The outlier and the next movement join the group of the previous movement
+            parent[run] = root
+            parent[run + 1] = root
+            run_types[root] = movement_type
+
+            # Update the new duration dictionary
+            new_movement_durations[prev_id] = combined_duration
+
+            # Calculate combined amplitude for merged movement (weighted with the already merged duration)
+            combined_amplitude = (
+                (new_movement_amplitudes.get(prev_id, 0) * new_movement_durations.get(prev_id, 0) +
+                 new_movement_amplitudes.get(next_id, 0) * new_movement_durations.get(next_id, 0) +
+                 new_movement_amplitudes.get(outlier_id, 0) * new_movement_durations.get(outlier_id, 0))
+                / combined_duration
+            )
+            new_movement_amplitudes[prev_id] = combined_amplitude
+
+            # Combine velocity values for merged movement
+            new_movement_velocities[prev_id] = (
+                new_movement_velocities.get(prev_id, []) +
+                new_movement_velocities.get(next_id, []) +
+                new_movement_velocities.get(outlier_id, [])
+            )
+
+            # Remove the old IDs from the duration, amplitude, and velocity dictionaries
+            for merged_id in (next_id, outlier_id):
+                new_movement_durations.pop(merged_id, None)
+                new_movement_amplitudes.pop(merged_id, None)
+                new_movement_velocities.pop(merged_id, None)
+
+    # Resolve every run to the ID and type of its group
+    roots = [_find_run_root(parent, run) for run in range(len(run_ids))]
+    new_run_ids = [run_ids[root] for root in roots]
+    new_run_types = [run_types[root] for root in roots]
+
+    return new_run_ids, new_run_types, new_movement_durations, new_movement_amplitudes, new_movement_velocities
+
+
+def mark_invalid_movements(run_ids, run_types, movement_durations):
+    """
+    Relabels fixations and saccades whose duration is outside the valid range as 'outlier'.
+
+    Args:
+        run_ids (list): Movement ID of each run.
+        run_types (list): Movement type of each run, updated in place.
+        movement_durations (dict): Movement durations keyed by movement ID.
+
+    Returns:
+        list: The updated run types.
+    """
+    runs_by_id = defaultdict(list)
+    for run, movement_id in enumerate(run_ids):
+        runs_by_id[movement_id].append(run)
+
+    for movement_id, duration in movement_durations.items():
+        runs = runs_by_id.get(movement_id)
+        if runs:
+            movement_type = run_types[runs[0]]  # Check the type of the first run
+            if (movement_type == 'fixation' and not (MIN_FIXATION_DURATION <= duration <= MAX_FIXATION_DURATION)) or \
+                    (movement_type == 'saccade' and not (MIN_SACCADE_DURATION <= duration <= MAX_SACCADE_DURATION)):
+                # If a movement does not have a valid duration, mark all points with this ID as 'outlier'
+                for run in runs:
+                    run_types[run] = 'outlier'
+
+    return run_types
+
+
+def _expand_runs(run_lengths, run_ids, run_types):
+    """Expands run-level IDs and types back to per-point lists."""
+    run_index = np.repeat(np.arange(len(run_ids)), run_lengths)
+    movement_types = np.array(run_types, dtype=object)[run_index].tolist()
+    eye_movement_ids = np.array(run_ids)[run_index].tolist()
+    return movement_types, eye_movement_ids
+
+
 def process_outliers_fixation(movement_types, eye_movement_ids, movement_durations, movement_amplitudes, movement_velocities, tolerance=1):
     """
     Post-process the movement types to handle outliers within fixations and merge fixations with different IDs.
@@ -521,113 +1501,12 @@ def process_outliers_fixation(movement_types, eye_movement_ids, movement_duratio
     Returns:
         tuple: Updated list of movement types, updated list of eye movement IDs, updated movement durations, updated movement amplitudes, updated movement velocities.
     """
-    new_movement_types = movement_types.copy()
-    new_eye_movement_ids = eye_movement_ids.copy()
-    new_movement_durations = movement_durations.copy()
-    new_movement_amplitudes = movement_amplitudes.copy()
-    new_movement_velocities = movement_velocities.copy()
+    run_lengths, run_ids, run_types = build_run_table(movement_types, eye_movement_ids)
+    run_ids, run_types, new_movement_durations, new_movement_amplitudes, new_movement_velocities = merge_outlier_runs(
+        run_lengths, run_ids, run_types, movement_durations, movement_amplitudes, movement_velocities,
+        'fixation', MAX_FIXATION_DURATION)
 
-    merged_ids = set()  # To track IDs that have been merged and should not be added again
-
-    outlier_indices = [i for i, m_type in enumerate(new_movement_types) if m_type == 'outlier']
-    max_outlier_id = max(new_eye_movement_ids[i] for i in outlier_indices) if outlier_indices else None
-
-    for outlier_idx in outlier_indices:
-        # Check the surrounding movement types
-        prev_idx = outlier_idx - 1
-        next_idx = outlier_idx + 1
-
-        if 0 <= prev_idx < len(new_movement_types) and next_idx < len(new_movement_types):
-            if (new_movement_types[prev_idx] == 'fixation_candidate' and new_movement_types[next_idx] == 'fixation_candidate') or \
-                    (new_movement_types[prev_idx] == 'fixation' and new_movement_types[next_idx] == 'fixation_candidate') or \
-                    (new_movement_types[prev_idx] == 'fixation_candidate' and new_movement_types[next_idx] == 'fixation') or \
-                    (new_movement_types[prev_idx] == 'fixation' and new_movement_types[next_idx] == 'fixation'):
-
-                prev_fixation_id = new_eye_movement_ids[prev_idx]
-                next_fixation_id = new_eye_movement_ids[next_idx]
-                outlier_id = new_eye_movement_ids[outlier_idx]  # The ID of the current outlier
-
-                # Calculate combined duration for merged fixation
-                combined_duration = (
-                    new_movement_durations.get(prev_fixation_id, 0) +
-                    new_movement_durations.get(next_fixation_id, 0) +
-                    new_movement_durations.get(outlier_id, 0)  # Include outlier duration
-                )
-
-                if combined_duration < MAX_FIXATION_DURATION:
-                    # Use the existing ID of the first fixation in merging
-                    merge_id = prev_fixation_id
-
-                    # Efficiently update all relevant points to use the merged fixation ID
-                    new_movement_types[prev_idx:next_idx + 1] = ['fixation'] * (next_idx - prev_idx + 1)
-                    new_eye_movement_ids[prev_idx:next_idx + 1] = [merge_id] * (next_idx - prev_idx + 1)
-
-                    # Efficient replacement with early termination
-                    encountered_control = False
-                    for i in range(prev_idx, len(new_eye_movement_ids)):
-                        if new_eye_movement_ids[i] == next_fixation_id:
-                            new_movement_types[i] = 'fixation'
-                            new_eye_movement_ids[i] = merge_id
-                            encountered_control = True
-                        elif encountered_control:
-                            break
-
-                    encountered_control = False
-                    for i in range(0, next_idx):
-                        if new_eye_movement_ids[i] == prev_fixation_id:
-                            new_movement_types[i] = 'fixation'
-                            new_eye_movement_ids[i] = merge_id
-                            encountered_control = True
-                        elif encountered_control:
-                            break
-
-                    # Update the new duration dictionary
-                    new_movement_durations[merge_id] = combined_duration
-
-                    # Calculate combined amplitude for merged fixation
-                    combined_amplitude = (
-                        (new_movement_amplitudes.get(prev_fixation_id, 0) * new_movement_durations.get(prev_fixation_id, 0) +
-                         new_movement_amplitudes.get(next_fixation_id, 0) * new_movement_durations.get(next_fixation_id, 0) +
-                         new_movement_amplitudes.get(outlier_id, 0) * new_movement_durations.get(outlier_id, 0))
-                        / combined_duration
-                    )
-                    new_movement_amplitudes[merge_id] = combined_amplitude
-
-                    # Combine velocity values for merged fixation
-                    combined_velocities = (
-                        new_movement_velocities.get(prev_fixation_id, []) +
-                        new_movement_velocities.get(next_fixation_id, []) +
-                        new_movement_velocities.get(outlier_id, [])
-                    )
-                    new_movement_velocities[merge_id] = combined_velocities
-
-                    # Remove the old IDs from the duration, amplitude, and velocity dictionaries
-                    if next_fixation_id in new_movement_durations:
-                        del new_movement_durations[next_fixation_id]
-                    if outlier_id in new_movement_durations:
-                        del new_movement_durations[outlier_id]
-
-                    if next_fixation_id in new_movement_amplitudes:
-                        del new_movement_amplitudes[next_fixation_id]
-                    if outlier_id in new_movement_amplitudes:
-                        del new_movement_amplitudes[outlier_id]
-
-                    if next_fixation_id in new_movement_velocities:
-                        del new_movement_velocities[next_fixation_id]
-                    if outlier_id in new_movement_velocities:
-                        del new_movement_velocities[outlier_id]
-
-                    merged_ids.update({prev_fixation_id, next_fixation_id, outlier_id})  # Mark IDs as processed
-
-                  #  print(f"Last merged ID: {merge_id} / Max outlier ID: {max_outlier_id}")
-
-    # Add remaining unchanged movements to the new lists and dictionary after each loop iteration
-    for movement_id in set(new_eye_movement_ids):
-        if movement_id not in merged_ids and movement_id not in new_movement_durations:
-            # Copy original data for unchanged movements
-            new_movement_durations[movement_id] = movement_durations[movement_id]
-            new_movement_amplitudes[movement_id] = movement_amplitudes[movement_id]
-            new_movement_velocities[movement_id] = movement_velocities[movement_id]
+    new_movement_types, new_eye_movement_ids = _expand_runs(run_lengths, run_ids, run_types)
 
     return new_movement_types, new_eye_movement_ids, new_movement_durations, new_movement_amplitudes, new_movement_velocities
 
@@ -649,467 +1528,699 @@ def process_outliers_saccade(movement_types, eye_movement_ids, movement_duration
     Returns:
         tuple: Updated list of movement types, updated list of eye movement IDs, updated movement durations, updated movement amplitudes, updated movement velocities.
     """
-    new_movement_types = movement_types.copy()
-    new_eye_movement_ids = eye_movement_ids.copy()
-    new_movement_durations = movement_durations.copy()
-    new_movement_amplitudes = movement_amplitudes.copy()
-    new_movement_velocities = movement_velocities.copy()
-
-    merged_ids = set()  # To track IDs that have been merged and should not be added again
-
-    outlier_indices = [i for i, m_type in enumerate(new_movement_types) if m_type == 'outlier']
-    max_outlier_id = max(new_eye_movement_ids[i] for i in outlier_indices) if outlier_indices else None
-
-    for outlier_idx in outlier_indices:
-        # Check the surrounding movement types
-        prev_idx = outlier_idx - 1
-        next_idx = outlier_idx + 1
-
-        if 0 <= prev_idx < len(new_movement_types) and next_idx < len(new_movement_types):
-            if (new_movement_types[prev_idx] == 'saccade_candidate' and new_movement_types[next_idx] == 'saccade_candidate') or \
-                    (new_movement_types[prev_idx] == 'saccade' and new_movement_types[next_idx] == 'saccade_candidate') or \
-                    (new_movement_types[prev_idx] == 'saccade_candidate' and new_movement_types[next_idx] == 'saccade') or \
-                    (new_movement_types[prev_idx] == 'saccade' and new_movement_types[next_idx] == 'saccade'):
-
-                prev_fixation_id = new_eye_movement_ids[prev_idx]
-                next_fixation_id = new_eye_movement_ids[next_idx]
-                outlier_id = new_eye_movement_ids[outlier_idx]  # The ID of the current outlier
-
-                # Calculate combined duration for merged saccade
-                combined_duration = (
-                    new_movement_durations.get(prev_fixation_id, 0) +
-                    new_movement_durations.get(next_fixation_id, 0) +
-                    new_movement_durations.get(outlier_id, 0)  # Include outlier duration
-                )
-
-                if combined_duration < MAX_SACCADE_DURATION:
-                    # Use the existing ID of the first saccade in merging
-                    merge_id = prev_fixation_id  # Use the previous saccade ID
-
-                    # Efficiently update all relevant points to use the merged saccade ID
-                    new_movement_types[prev_idx:next_idx + 1] = ['saccade'] * (next_idx - prev_idx + 1)
-                    new_eye_movement_ids[prev_idx:next_idx + 1] = [merge_id] * (next_idx - prev_idx + 1)
-
-                    # Efficient replacement with early termination
-                    encountered_control = False
-                    for i in range(prev_idx, len(new_eye_movement_ids)):
-                        if new_eye_movement_ids[i] == next_fixation_id:
-                            new_movement_types[i] = 'saccade'
-                            new_eye_movement_ids[i] = merge_id
-                            encountered_control = True
-                        elif encountered_control:
-                            break
-
-                    encountered_control = False
-                    for i in range(0, next_idx):
-                        if new_eye_movement_ids[i] == prev_fixation_id:
-                            new_movement_types[i] = 'saccade'
-                            new_eye_movement_ids[i] = merge_id
-                            encountered_control = True
-                        elif encountered_control:
-                            break
-
-                    # Update the new duration dictionary
-                    new_movement_durations[merge_id] = combined_duration
-
-                    # Calculate combined amplitude for merged saccade
-                    combined_amplitude = (
-                        (new_movement_amplitudes.get(prev_fixation_id, 0) * new_movement_durations.get(prev_fixation_id, 0) +
-                         new_movement_amplitudes.get(next_fixation_id, 0) * new_movement_durations.get(next_fixation_id, 0) +
-                         new_movement_amplitudes.get(outlier_id, 0) * new_movement_durations.get(outlier_id, 0))
-                        / combined_duration
-                    )
-                    new_movement_amplitudes[merge_id] = combined_amplitude
-
-                    # Combine velocity values for merged saccade
-                    combined_velocities = (
-                        new_movement_velocities.get(prev_fixation_id, []) +
-                        new_movement_velocities.get(next_fixation_id, []) +
-                        new_movement_velocities.get(outlier_id, [])
-                    )
-                    new_movement_velocities[merge_id] = combined_velocities
-
-                    # Remove the old IDs from the duration, amplitude, and velocity dictionaries
-                    if next_fixation_id in new_movement_durations:
-                        del new_movement_durations[next_fixation_id]
-                    if outlier_id in new_movement_durations:
-                        del new_movement_durations[outlier_id]
-
-                    if next_fixation_id in new_movement_amplitudes:
-                        del new_movement_amplitudes[next_fixation_id]
-                    if outlier_id in new_movement_amplitudes:
-                        del new_movement_amplitudes[outlier_id]
-
-                    if next_fixation_id in new_movement_velocities:
-                        del new_movement_velocities[next_fixation_id]
-                    if outlier_id in new_movement_velocities:
-                        del new_movement_velocities[outlier_id]
-
-                    merged_ids.update({prev_fixation_id, next_fixation_id, outlier_id})  # Mark IDs as processed
-
-                 #   print(f"Last merged ID: {merge_id} / Max outlier ID: {max_outlier_id}")
-
-    # Add remaining unchanged movements to the new lists and dictionary after each loop iteration
-    for movement_id in set(new_eye_movement_ids):
-        if movement_id not in merged_ids and movement_id not in new_movement_durations:
-            # Copy original data for unchanged movements
-            new_movement_durations[movement_id] = movement_durations[movement_id]
-            new_movement_amplitudes[movement_id] = movement_amplitudes[movement_id]
-            new_movement_velocities[movement_id] = movement_velocities[movement_id]
+    run_lengths, run_ids, run_types = build_run_table(movement_types, eye_movement_ids)
+    run_ids, run_types, new_movement_durations, new_movement_amplitudes, new_movement_velocities = merge_outlier_runs(
+        run_lengths, run_ids, run_types, movement_durations, movement_amplitudes, movement_velocities,
+        'saccade', MAX_SACCADE_DURATION)
 
     # Now check all movements for validity based on duration thresholds
-    for movement_id, duration in new_movement_durations.items():
-        # Get the indices of the points with the current movement ID
-        indices = [i for i, id in enumerate(new_eye_movement_ids) if id == movement_id]
+    mark_invalid_movements(run_ids, run_types, new_movement_durations)
 
-        # Check if the movement type at the first index is 'fixation' or 'saccade'
-        if indices:  # Ensure there are indices found
-            movement_type = new_movement_types[indices[0]]  # Check the type at the first index
-            if (movement_type == 'fixation' and not (MIN_FIXATION_DURATION <= duration <= MAX_FIXATION_DURATION)) or \
-                    (movement_type == 'saccade' and not (MIN_SACCADE_DURATION <= duration <= MAX_SACCADE_DURATION)):
-                # If a movement does not have a valid duration, mark all points with this ID as 'outlier'
-                for idx in indices:
-                    new_movement_types[idx] = 'outlier'
+    new_movement_types, new_eye_movement_ids = _expand_runs(run_lengths, run_ids, run_types)
 
     return new_movement_types, new_eye_movement_ids, new_movement_durations, new_movement_amplitudes, new_movement_velocities
 
 
-#def classify_points(df):
-    # Initialize lists with default values corresponding to each row in the DataFrame
-    eye_movement_ids = [None] * len(df)  # Using None as a placeholder
-    last_type_list = ['outlier'] * len(df)  # Default all to 'outlier'
-    movement_durations = {}  # Dictionary to store the duration for each movement ID
-    movement_amplitudes = {}  # Dictionary to store the average speed (amplitude) for each movement ID
-    movement_velocities = {}  # Dictionary to store all velocity values for each movement ID
-    current_id = 1  # Starting ID for movements
-    last_type = 'saccade_candidate'  # Initialize the last movement type as 'saccade'
-    movement_start_time = df['TimeStamp'].iloc[0]  # Initial timestamp for movement start
+def find_movement_runs(gaze_velocity, head_velocity, timestamps, initial_type=SACCADE_CANDIDATE, breaks=None):
+    """
+    Splits a velocity trace into runs of identical candidate type and labels each run.
 
-    # Initialize start index for the first movement
-    movement_start_index = 0
+    A run starts wherever the candidate type of a sample differs from the type of the previous
+    usable sample. The first sample always opens a run of `initial_type`, and samples with a NaN
+    velocity or timestamp never start a run on their own (they stay in the run that is open).
+    A sample after a gap (`breaks`) always opens a run, of the type of its first usable sample, and the
+    run before the gap ends at the last sample before it, so no run spans a gap.
 
-    # Iterate over DataFrame rows
-    for i in range(1, len(df)):
-        gaze_velocity = df['GazeVelocity'].iloc[i]
-        head_velocity = df['HeadVelocity'].iloc[i]
-        timestamp = df['TimeStamp'].iloc[i]
-
-        # Determine the current movement type based on gaze and head velocities
-        if head_velocity < HEAD_VELOCITY_THRESHOLD and gaze_velocity < GAZE_VELOCITY_FIXATION_THRESHOLD:
-            current_type = 'fixation_candidate'
-        elif gaze_velocity > GAZE_VELOCITY_SACCADE_THRESHOLD:
-            current_type = 'saccade_candidate'
-        else:
-            current_type = 'outlier'  # Mark as outlier if it doesn't meet any criteria
+    Parameters:
+    - gaze_velocity (array-like): Gaze angular velocity per sample.
+    - head_velocity (array-like): Head angular velocity per sample.
+    - timestamps (array-like): Timestamps in seconds per sample.
+    - initial_type (int): Type code of the run opened by the first sample.
+    - breaks (array-like or None): Boolean per sample, True where a gap precedes it (see find_gap_breaks).
 
-        # If movement type changes, calculate duration and update the movement_durations and velocities
-        if current_type != last_type:
-            movement_duration = (timestamp - movement_start_time)  # Duration in seconds
+    Returns:
+    - tuple: (starts, ends, types, durations, amplitudes) arrays with one entry per run. `types`
+      holds MOVEMENT_TYPES codes, with candidates of valid duration promoted to fixation/saccade.
+    """
+    gaze_velocity = np.asarray(gaze_velocity, dtype=float)
+    head_velocity = np.broadcast_to(np.asarray(head_velocity, dtype=float), gaze_velocity.shape)
+    timestamps = np.asarray(timestamps, dtype=float)
+    n = len(timestamps)
+
+    # Label every sample with its candidate type using array masks
+    candidate_types = np.full(n, OUTLIER, dtype=np.int8)
+    is_fixation = (head_velocity < HEAD_VELOCITY_THRESHOLD) & (gaze_velocity < GAZE_VELOCITY_FIXATION_THRESHOLD)
+    candidate_types[gaze_velocity > GAZE_VELOCITY_SACCADE_THRESHOLD] = SACCADE_CANDIDATE
+    candidate_types[is_fixation] = FIXATION_CANDIDATE
+
+    # Only usable samples after the first one can open a new run
+    usable = ~(np.isnan(gaze_velocity) | np.isnan(head_velocity) | np.isnan(timestamps))
+    usable[:1] = False
+    usable_rows = np.flatnonzero(usable)
+    usable_types = candidate_types[usable_rows]
+
+    # Run boundaries are the usable samples whose type differs from the previous usable sample
+    changes = np.diff(usable_types, prepend=np.int8(initial_type)) != 0
+    if breaks is None:
+        changes = np.flatnonzero(changes)
+        starts = np.concatenate(([0], usable_rows[changes]))
+        types = np.concatenate(([initial_type], usable_types[changes])).astype(np.int8)
+        run_ends_at = np.append(starts[1:], n - 1)
+    else:
+        breaks = np.array(breaks, dtype=bool)
+        breaks[:1] = False
+        # Types are only compared within the stretch between two gaps
+        stretches = np.cumsum(breaks)
+        usable_stretches = stretches[usable_rows]
+        changes &= np.diff(usable_stretches, prepend=0) == 0
+        changes &= ~breaks[usable_rows]
+        change_rows = usable_rows[changes]
+        # The run opened by a gap takes the type of the stretch's first usable sample, outlier if it has none
+        break_rows = np.flatnonzero(breaks)
+        break_types = np.full(len(break_rows), OUTLIER, dtype=np.int8)
+        if len(usable_rows):
+            first_usable = np.minimum(np.searchsorted(usable_rows, break_rows), len(usable_rows) - 1)
+            has_usable = usable_stretches[first_usable] == stretches[break_rows]
+            break_types[has_usable] = usable_types[first_usable[has_usable]]
+        starts = np.concatenate(([0], change_rows, break_rows))
+        types = np.concatenate(([initial_type], usable_types[changes], break_types)).astype(np.int8)
+        order = np.argsort(starts, kind='stable')
+        starts, types = starts[order], types[order]
+        # A run followed by a gap ends at its own last sample
+        run_ends_at = np.append(starts[1:] - breaks[starts[1:]].astype(np.int64), n - 1)
+    ends = np.append(starts[1:], n)
+
+    # A run lasts from its first timestamp to the first timestamp of the next run (or the last sample)
+    durations = timestamps[run_ends_at] - timestamps[starts]
+
+    # Candidates with a valid duration become fixations/saccades
+    valid_fixation = (types == FIXATION_CANDIDATE) & (durations >= MIN_FIXATION_DURATION) & (durations <= MAX_FIXATION_DURATION)
+    valid_saccade = (types == SACCADE_CANDIDATE) & (durations >= MIN_SACCADE_DURATION) & (durations <= MAX_SACCADE_DURATION)
+    types[valid_fixation] = FIXATION
+    types[valid_saccade] = SACCADE
+
+    # Mean velocity per run (NaN samples ignored, as Series.mean does)
+    finite = ~np.isnan(gaze_velocity)
+    sums = np.add.reduceat(np.where(finite, gaze_velocity, 0.0), starts)
+    counts = np.add.reduceat(finite.astype(np.int64), starts)
+    amplitudes = np.full(len(starts), np.nan)
+    np.divide(sums, counts, out=amplitudes, where=counts > 0)
+
+    return starts, ends, types, durations, amplitudes
+
+
+def classify_points(df, breaks=None):
+    # Ensure df has data
+    if df.empty:
+        raise ValueError("The DataFrame is empty.")
 
-            # Check if the duration is valid for fixation or saccade
-            if (last_type == 'fixation_candidate' and MIN_FIXATION_DURATION <= movement_duration <= MAX_FIXATION_DURATION) or \
-                    (last_type == 'saccade_candidate' and MIN_SACCADE_DURATION <= movement_duration <= MAX_SACCADE_DURATION):
-                # If valid, assign indexes to the movement ID
-                for idx in range(movement_start_index, i):
-                    eye_movement_ids[idx] = current_id
-                    last_type_list[idx] = 'fixation' if last_type == 'fixation_candidate' else 'saccade'
+    # Samples after a gap (breaks) open a new movement, see find_movement_runs
+    gaze_velocity = df['GazeVelocity'].to_numpy(dtype=float)
+    starts, ends, types, durations, amplitudes = find_movement_runs(
+        gaze_velocity, df['HeadVelocity'].to_numpy(dtype=float), df['TimeStamp'].to_numpy(dtype=float),
+        breaks=breaks)
+    logger.debug("Last movement duration: %s", durations[-1])
+
+    # Every run gets its own ID, starting from 1
+    run_ids = np.arange(1, len(starts) + 1)
+    run_lengths = ends - starts
+    last_type_list = MOVEMENT_TYPES[np.repeat(types, run_lengths)].tolist()
+    eye_movement_ids = np.repeat(run_ids, run_lengths).tolist()
+
+    movement_durations = dict(zip(run_ids.tolist(), durations))  # Duration for each movement ID
+    movement_amplitudes = dict(zip(run_ids.tolist(), amplitudes))  # Mean velocity (amplitude) for each movement ID
+    movement_velocities = {  # All velocity values for each movement ID
+        movement_id: velocities.tolist()
+        for movement_id, velocities in zip(run_ids.tolist(), np.split(gaze_velocity, starts[1:]))
+    }
 
-                # Store the duration and amplitude of valid movement
-                movement_durations[current_id] = movement_duration
-                movement_amplitudes[current_id] = df['GazeVelocity'].iloc[movement_start_index:i].mean()  # Calculate mean velocity as amplitude
+    return last_type_list, eye_movement_ids, movement_durations, movement_amplitudes, movement_velocities
 
-                # Store all velocity values for this movement
-                movement_velocities[current_id] = df['GazeVelocity'].iloc[movement_start_index:i].tolist()
 
-                current_id += 1
-            else:
-                for idx in range(movement_start_index, i):
-                    eye_movement_ids[idx] = current_id
-                    last_type_list[idx] = last_type
-
-                # Store the duration of valid movement
-                movement_durations[current_id] = movement_duration
-                movement_amplitudes[current_id] = df['GazeVelocity'].iloc[movement_start_index:i].mean()  # Calculate mean velocity as amplitude
-
-                # Store all velocity values for this movement
-                movement_velocities[current_id] = df['GazeVelocity'].iloc[movement_start_index:i].tolist()
-
-                current_id += 1
-
-            # Update start index and time for the new movement
-            movement_start_time = timestamp
-            movement_start_index = i
-            last_type = current_type
-
-    # Handle the last movement after the loop, regardless of type
-    final_duration = (df['TimeStamp'].iloc[-1] - movement_start_time)
-    if (last_type == 'fixation_candidate' and MIN_FIXATION_DURATION <= final_duration <= MAX_FIXATION_DURATION) or \
-            (last_type == 'saccade_candidate' and MIN_SACCADE_DURATION <= final_duration <= MAX_SACCADE_DURATION):
-        for idx in range(movement_start_index, len(df)):
-            eye_movement_ids[idx] = current_id
-            last_type_list[idx] = 'fixation' if last_type == 'fixation_candidate' else 'saccade'
-        movement_durations[current_id] = final_duration
-        movement_amplitudes[current_id] = df['GazeVelocity'].iloc[movement_start_index:].mean()  # Calculate mean velocity as amplitude
-
-        # Store all velocity values for this last movement
-        movement_velocities[current_id] = df['GazeVelocity'].iloc[movement_start_index:].tolist()
-    else:
-        for idx in range(movement_start_index, len(df)):
-            eye_movement_ids[idx] = current_id
-            last_type_list[idx] = last_type
+# MOVEMENT_TYPES label -> type code
+MOVEMENT_TYPE_CODES = {label: code for code, label in enumerate(MOVEMENT_TYPES)}
 
-        # Store the duration of valid movement
-        movement_durations[current_id] = final_duration
-        movement_amplitudes[current_id] = df['GazeVelocity'].iloc[movement_start_index:].mean()  # Calculate mean velocity as amplitude
 
-        # Store all velocity values for this last movement
-        movement_velocities[current_id] = df['GazeVelocity'].iloc[movement_start_index:].tolist()
+class MovementSegments:
+    """
+    Struct-of-arrays table of the classified eye movements, one entry per movement in sample order.
+
+    Every movement covers a contiguous block of samples [start, end), so its velocities are a slice of
+    the one velocity array the table shares with the samples rather than a copy.
+
+    Attributes (arrays of one entry per movement unless noted):
+    - ids: Movement ID (EyeMovementID of its samples).
+    - types: MOVEMENT_TYPES code.
+    - starts, ends: Sample index range.
+    - durations: Duration in seconds.
+    - mean_velocities: Mean gaze velocity in degrees per second. For merged movements this is the
+      duration-weighted mean of the merged parts, as process_outliers_fixation/saccade compute it.
+    - peak_velocities: Highest gaze velocity, NaN if the movement has none.
+    - velocities: Gaze velocity of every sample (shared, not per movement), empty if not kept.
+    """
+    def __init__(self, ids, types, starts, ends, durations, mean_velocities, velocities):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.types = np.asarray(types, dtype=np.int8)
+        self.starts = np.asarray(starts, dtype=np.int64)
+        self.ends = np.asarray(ends, dtype=np.int64)
+        self.durations = np.asarray(durations, dtype=np.float64)
+        self.mean_velocities = np.asarray(mean_velocities, dtype=np.float64)
+        self.velocities = np.asarray(velocities, dtype=np.float64)
+        # fmax skips NaN velocities, a movement of NaN only stays NaN
+        self.peak_velocities = (np.fmax.reduceat(self.velocities, self.starts) if len(self.velocities)
+                                else np.full(len(self.starts), np.nan))
+
+    @classmethod
+    def from_points(cls, movement_types, eye_movement_ids, movement_durations, movement_amplitudes=None,
+                    velocities=None):
+        """
+        Builds the table from the per-sample labels and the per-ID dictionaries of the classifier.
+
+        Parameters:
+        - movement_types (list): MOVEMENT_TYPES label of every sample.
+        - eye_movement_ids (list): Movement ID of every sample, each ID in one contiguous block.
+        - movement_durations (dict): Duration by movement ID.
+        - movement_amplitudes (dict or None): Mean velocity by movement ID, None leaves the velocities NaN.
+        - velocities (array-like or None): Gaze velocity of every sample, None keeps no velocities.
+
+        Returns:
+        - MovementSegments: The table.
+        """
+        ids = np.asarray(eye_movement_ids, dtype=np.int64)
+        starts = np.flatnonzero(np.diff(ids, prepend=ids[:1] - 1)) if len(ids) else np.empty(0, dtype=np.int64)
+        ends = np.append(starts[1:], len(ids))
+        segment_ids = ids[starts].tolist()
+        types = np.fromiter(map(MOVEMENT_TYPE_CODES.__getitem__, map(movement_types.__getitem__, starts.tolist())),
+                            dtype=np.int8, count=len(starts))
+        durations = np.fromiter(map(movement_durations.__getitem__, segment_ids), dtype=np.float64, count=len(starts))
+        mean_velocities = (np.fromiter(map(movement_amplitudes.__getitem__, segment_ids), dtype=np.float64,
+                                       count=len(starts))
+                           if movement_amplitudes is not None else np.full(len(starts), np.nan))
+        return cls(segment_ids, types, starts, ends, durations, mean_velocities,
+                   velocities if velocities is not None else np.empty(0))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def movement_velocities(self, row):
+        """Returns the velocities of the movement in table row `row`, a view into the shared array."""
+        return self.velocities[self.starts[row]:self.ends[row]]
+
+    def sample_mask(self, movement_type, sample_count):
+        """Returns a boolean per sample, True for the samples of movements of type code `movement_type`."""
+        boundaries = np.zeros(sample_count + 1, dtype=np.int64)
+        chosen = self.types == movement_type
+        np.add.at(boundaries, self.starts[chosen], 1)
+        np.add.at(boundaries, self.ends[chosen], -1)
+        return np.cumsum(boundaries[:-1]) > 0
+
+    def to_frame(self):
+        """Returns the table as a DataFrame, one row per movement, with the type as its label."""
+        return pd.DataFrame({
+            'EyeMovementID': self.ids, 'MovementType': MOVEMENT_TYPES[self.types],
+            'Start': self.starts, 'End': self.ends, 'Duration': self.durations,
+            'MeanVelocity': self.mean_velocities, 'PeakVelocity': self.peak_velocities
+        })
+
+
+class EyeMovementDict(Mapping):
+    """
+    Read-only view of a MovementSegments table in the layout of the former eye_movement_dict:
+    movement ID -> {'MovementType', 'MovementDuration', 'MovementAmplitude', 'MovementVelocities'},
+    each a list with one entry per sample of the movement.
 
-    # Convert lists to DataFrame to keep the indexes consistent
-    movement_df = df[['TimeStamp']].copy()
-    movement_df['MovementType'] = last_type_list
-    movement_df['EyeMovementID'] = eye_movement_ids
+    Entries are built when they are read, and their lists repeat one shared value, so the view stores
+    nothing per sample. 'MovementVelocities' holds the movement's velocities in sample order.
+    """
+    def __init__(self, segments):
+        self.segments = segments
+        self._rows = {movement_id: row for row, movement_id in enumerate(segments.ids.tolist())}
+
+    def __getitem__(self, movement_id):
+        row = self._rows[movement_id]
+        segments = self.segments
+        samples = int(segments.ends[row] - segments.starts[row])
+        return {
+            'MovementType': [MOVEMENT_TYPES[segments.types[row]]] * samples,
+            'MovementDuration': [segments.durations[row]] * samples,
+            'MovementAmplitude': [segments.mean_velocities[row]] * samples,
+            'MovementVelocities': [segments.movement_velocities(row).tolist()] * samples
+        }
 
-    return last_type_list, eye_movement_ids, movement_durations, movement_amplitudes, movement_velocities
-def classify_points(df):
-    # Ensure df has data
-    if df.empty:
-        raise ValueError("The DataFrame is empty.")
+    def __iter__(self):
+        return iter(self._rows)
 
-    # Initialize lists with default values corresponding to each row in the DataFrame
-    eye_movement_ids = [None] * len(df)  # Using None as a placeholder
-    last_type_list = ['outlier'] * len(df)  # Default all to 'outlier'
-    movement_durations = {}  # Dictionary to store the duration for each movement ID
-    movement_amplitudes = {}  # Dictionary to store the average speed (amplitude) for each movement ID
-    movement_velocities = {}  # Dictionary to store all velocity values for each movement ID
-    current_id = 1  # Starting ID for movements
-    last_type = 'saccade_candidate'  # Initialize the last movement type as 'saccade'
-    movement_start_time = df['TimeStamp'].iloc[0]  # Initial timestamp for movement start
+    def __len__(self):
+        return len(self._rows)
 
-    # Initialize start index for the first movement
-    movement_start_index = 0
 
-    # Iterate over DataFrame rows
-    for i in range(1, len(df)):
-        # Print debug info to track i, movement_start_index, and df length
+# Movement types reported by get_movement_statistics/segment_statistics, 'other_saccades' is never assigned
+MOVEMENT_STATISTICS_TYPES = ['fixation', 'saccade', 'saccade_candidate', 'other_saccades']
 
-        gaze_velocity = df['GazeVelocity'].iloc[i]
-        head_velocity = df['HeadVelocity'].iloc[i]
-        timestamp = df['TimeStamp'].iloc[i]
 
+def grouped_duration_totals(codes, durations, group_count):
+    """
+    Count, total, minimum and maximum of `durations` per group with grouped NumPy reductions, in O(n).
 
-        if pd.isna(gaze_velocity) or pd.isna(head_velocity) or pd.isna(timestamp):
-            print(f"Skipping index {i} due to NaN value in one of the columns.")
-            continue  # Skip this row if any of the columns has NaN value
-        # Determine the current movement type based on gaze and head velocities
-        if head_velocity < HEAD_VELOCITY_THRESHOLD and gaze_velocity < GAZE_VELOCITY_FIXATION_THRESHOLD:
-            current_type = 'fixation_candidate'
-        elif gaze_velocity > GAZE_VELOCITY_SACCADE_THRESHOLD:
-            current_type = 'saccade_candidate'
-        else:
-            current_type = 'outlier'  # Mark as outlier if it doesn't meet any criteria
-
-        # If movement type changes, calculate duration and update the movement_durations and velocities
-        if current_type != last_type:
-            movement_duration = (timestamp - movement_start_time)  # Duration in seconds
-            # Check if the duration is valid for fixation or saccade
-            if (last_type == 'fixation_candidate' and MIN_FIXATION_DURATION <= movement_duration <= MAX_FIXATION_DURATION) or \
-                    (last_type == 'saccade_candidate' and MIN_SACCADE_DURATION <= movement_duration <= MAX_SACCADE_DURATION):
-                # If valid, assign indexes to the movement ID
-                for idx in range(movement_start_index, i):
-                    eye_movement_ids[idx] = current_id
-                    last_type_list[idx] = 'fixation' if last_type == 'fixation_candidate' else 'saccade'
-
-                # Store the duration and amplitude of valid movement
-                movement_durations[current_id] = movement_duration
-                movement_amplitudes[current_id] = df['GazeVelocity'].iloc[movement_start_index:i].mean()  # Calculate mean velocity as amplitude
-
-                # Store all velocity values for this movement
-                movement_velocities[current_id] = df['GazeVelocity'].iloc[movement_start_index:i].tolist()
-
-                current_id += 1
-            else:
-                for idx in range(movement_start_index, i):
-                    eye_movement_ids[idx] = current_id
-                    last_type_list[idx] = last_type
-
-                # Store the duration of valid movement
-                movement_durations[current_id] = movement_duration
-                movement_amplitudes[current_id] = df['GazeVelocity'].iloc[movement_start_index:i].mean()  # Calculate mean velocity as amplitude
-
-                # Store all velocity values for this movement
-                movement_velocities[current_id] = df['GazeVelocity'].iloc[movement_start_index:i].tolist()
-
-                current_id += 1
-
-            # Update start index and time for the new movement
-            movement_start_time = timestamp
-            movement_start_index = i
-            last_type = current_type
-
-    # Handle the last movement after the loop, regardless of type
-    final_duration = (df['TimeStamp'].iloc[-1] - movement_start_time)
-    print(final_duration)
-    if (last_type == 'fixation_candidate' and MIN_FIXATION_DURATION <= final_duration <= MAX_FIXATION_DURATION) or \
-            (last_type == 'saccade_candidate' and MIN_SACCADE_DURATION <= final_duration <= MAX_SACCADE_DURATION):
-        for idx in range(movement_start_index, len(df)):
-            eye_movement_ids[idx] = current_id
-            last_type_list[idx] = 'fixation' if last_type == 'fixation_candidate' else 'saccade'
-        movement_durations[current_id] = final_duration
-        movement_amplitudes[current_id] = df['GazeVelocity'].iloc[movement_start_index:].mean()  # Calculate mean velocity as amplitude
-
-        # Store all velocity values for this last movement
-        movement_velocities[current_id] = df['GazeVelocity'].iloc[movement_start_index:].tolist()
-    else:
-        for idx in range(movement_start_index, len(df)):
-            eye_movement_ids[idx] = current_id
-            last_type_list[idx] = last_type
+    Totals are accumulated in input order, so they equal adding the durations up one by one.
 
-        # Store the duration of valid movement
-        movement_durations[current_id] = final_duration
-        movement_amplitudes[current_id] = df['GazeVelocity'].iloc[movement_start_index:].mean()  # Calculate mean velocity as amplitude
+    Parameters:
+    - codes (array-like): Group code (0 to group_count - 1) of every duration.
+    - durations (array-like): The durations.
+    - group_count (int): Number of groups.
 
-        # Store all velocity values for this last movement
-        movement_velocities[current_id] = df['GazeVelocity'].iloc[movement_start_index:].tolist()
+    Returns:
+    - tuple: (counts, totals, minimums, maximums) arrays with one entry per group, the minimum and
+      maximum of an empty group are NaN.
+    """
+    codes = np.asarray(codes, dtype=np.intp)
+    durations = np.asarray(durations, dtype=np.float64)
+    counts = np.bincount(codes, minlength=group_count)
+    totals = np.bincount(codes, weights=durations, minlength=group_count)
+    minimums = np.full(group_count, np.inf)
+    maximums = np.full(group_count, -np.inf)
+    np.minimum.at(minimums, codes, durations)
+    np.maximum.at(maximums, codes, durations)
+    minimums[counts == 0] = np.nan
+    maximums[counts == 0] = np.nan
+    return counts, totals, minimums, maximums
+
+
+def segment_statistics(segments, total_time, percentiles=()):
+    """
+    Statistics of the movements in a MovementSegments table per movement type, computed with grouped
+    reductions over the table in O(movements).
 
-    # Convert lists to DataFrame to keep the indexes consistent
-    movement_df = df[['TimeStamp']].copy()
-    movement_df['MovementType'] = last_type_list
-    movement_df['EyeMovementID'] = eye_movement_ids
+    Parameters:
+    - segments (MovementSegments): The classified movements.
+    - total_time (float): Duration of the analyzed samples in seconds.
+    - percentiles (sequence): Duration percentiles (0 to 100) to add to every movement type as 'p<q>',
+      none by default.
 
-    return last_type_list, eye_movement_ids, movement_durations, movement_amplitudes, movement_velocities
+    Returns:
+    - dict: Per MOVEMENT_STATISTICS_TYPES entry min, max, mean, count, percentage (of the movement time),
+      time and time_percentage (of total_time) of the movement durations, and the 'outlier' count,
+      percentage (of the samples), time and time_percentage, as get_movement_statistics returns them.
+    """
+    counts, totals, minimums, maximums = grouped_duration_totals(segments.types, segments.durations, len(MOVEMENT_TYPES))
+    sample_counts = np.bincount(segments.types.astype(np.intp), weights=segments.ends - segments.starts,
+                                minlength=len(MOVEMENT_TYPES))
+
+    type_totals, type_durations = {}, {}
+    for movement_type in MOVEMENT_STATISTICS_TYPES:
+        code = MOVEMENT_TYPE_CODES.get(movement_type)
+        count = int(counts[code]) if code is not None else 0
+        type_durations[movement_type] = segments.durations[segments.types == code] if count else np.empty(0)
+        type_totals[movement_type] = {
+            'count': count,
+            'time': totals[code] if count else 0.0,
+            'min': minimums[code] if count else None,
+            'max': maximums[code] if count else None,
+            # np.mean sums pairwise, as the statistics always did
+            'mean': np.mean(type_durations[movement_type]) if count else None
+        }
+    total_points = int(segments.ends[-1]) if len(segments) else 0
+    stats = _movement_statistics_from_totals(type_totals, int(sample_counts[OUTLIER]), total_points, total_time)
 
+    for movement_type, durations in type_durations.items():
+        for percentile in percentiles:
+            stats[movement_type][f'p{percentile:g}'] = np.percentile(durations, percentile) if len(durations) else None
+    return stats
 
 
 def get_movement_statistics(movement_types, eye_movement_ids, movement_durations, total_time):
-    # Initialize dictionaries to store statistics for fixations, saccades, small saccades, long fixations, and outliers
-    stats = {
-        'fixation': {
-            'min': None,
-            'max': None,
-            'mean': None,
-            'count': 0,
-            'percentage': 0.0,
-            'time': 0.0  # Total time for fixation
-        },
-        'saccade': {
-            'min': None,
-            'max': None,
-            'mean': None,
-            'count': 0,
-            'percentage': 0.0,
-            'time': 0.0  # Total time for saccade
-        },
-        'saccade_candidate': {
-            'min': None,
-            'max': None,
-            'mean': None,
-            'count': 0,
-            'percentage': 0.0,
-            'time': 0.0  # Total time for small saccades
-        },
-        'other_saccades': {
-            'min': None,
-            'max': None,
-            'mean': None,
-            'count': 0,
-            'percentage': 0.0,
-            'time': 0.0  # Total time for long fixations
-        },
-        'outlier': {
-            'count': 0,
-            'percentage': 0.0,
-            'time': 0.0  # Total time for outliers
+    """
+    Statistics of the movements per type from per-sample labels and IDs, see segment_statistics.
+
+    Parameters:
+    - movement_types (list): MOVEMENT_TYPES label of every sample.
+    - eye_movement_ids (list): Movement ID of every sample, each ID in one contiguous block.
+    - movement_durations (dict): Duration by movement ID.
+    - total_time (float): Duration of the samples in seconds.
+
+    Returns:
+    - dict: The statistics of segment_statistics.
+    """
+    return segment_statistics(MovementSegments.from_points(movement_types, eye_movement_ids, movement_durations),
+                              total_time)
+
+
+class QuantileSketch:
+    """
+    KLL quantile sketch (Karnin, Lang and Liberty) of a stream of values, in bounded memory.
+
+    Values are kept in compactors, one per level, where an item at level h stands for 2**h values. When the
+    items outgrow the capacity, the lowest full compactor is sorted and every other item moves up a level.
+    About 3 * k items are kept however many values are added, and a quantile is off by about 1.7 / k in
+    rank. The compaction offset alternates per level instead of being random, so the same values always
+    give the same sketch.
+
+    Sketches of the same k merge into the sketch of both streams. Count, minimum and maximum are exact.
+    """
+
+    SHRINK = 2 / 3  # Capacity of a level relative to the level above it
+
+    def __init__(self, k=SKETCH_K):
+        self.k = k
+        self.levels = [np.empty(0)]
+        self.offsets = [0]
+        self.count = 0
+        self.min = np.inf
+        self.max = -np.inf
+
+    def _capacity(self, level):
+        return max(int(np.ceil(self.k * self.SHRINK ** (len(self.levels) - level - 1))), 2)
+
+    def _compress(self):
+        while sum(map(len, self.levels)) > sum(map(self._capacity, range(len(self.levels)))):
+            level = next(level for level in range(len(self.levels)) if len(self.levels[level]) >= self._capacity(level))
+            if level + 1 == len(self.levels):
+                self.levels.append(np.empty(0))
+                self.offsets.append(0)
+            items = np.sort(self.levels[level])
+            # An odd item out stays at its level
+            paired = len(items) - len(items) % 2
+            self.levels[level + 1] = np.concatenate((self.levels[level + 1], items[self.offsets[level]:paired:2]))
+            self.levels[level] = items[paired:]
+            self.offsets[level] ^= 1
+
+    def update(self, values):
+        """Adds `values` (a number or an array), NaNs are skipped."""
+        values = np.asarray(values, dtype=np.float64).ravel()
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return
+        self.count += len(values)
+        self.min = min(self.min, values.min())
+        self.max = max(self.max, values.max())
+        self.levels[0] = np.concatenate((self.levels[0], values))
+        self._compress()
+
+    def merge(self, other):
+        """Adds the values of `other` to this sketch."""
+        if other.k != self.k:
+            raise ValueError(f"Cannot merge a sketch with k={other.k} into one with k={self.k}")
+        for level, items in enumerate(other.levels):
+            if level == len(self.levels):
+                self.levels.append(np.empty(0))
+                self.offsets.append(0)
+            self.levels[level] = np.concatenate((self.levels[level], items))
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._compress()
+        return self
+
+    def quantiles(self, fractions):
+        """
+        Estimates quantiles.
+
+        Parameters:
+        - fractions (array-like): Quantiles to estimate, 0 to 1.
+
+        Returns:
+        - ndarray: One estimate per fraction, NaN if the sketch is empty.
+        """
+        fractions = np.asarray(fractions, dtype=np.float64)
+        if not self.count:
+            return np.full(fractions.shape, np.nan)
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(level_items), 2 ** level) for level, level_items in enumerate(self.levels)])
+        order = np.argsort(items, kind='stable')
+        # Compactions keep the total weight, it equals the count
+        cumulative = np.cumsum(weights[order])
+        estimates = items[order][np.minimum(np.searchsorted(cumulative, fractions * self.count), len(items) - 1)]
+        return np.where(fractions <= 0, self.min, np.where(fractions >= 1, self.max, estimates))
+
+    def __len__(self):
+        """Number of items kept."""
+        return sum(map(len, self.levels))
+
+    def to_dict(self):
+        """Returns the sketch as plain JSON-serializable values, see from_dict."""
+        return {
+            'k': self.k, 'count': self.count,
+            'min': float(self.min) if self.count else None, 'max': float(self.max) if self.count else None,
+            'levels': [items.tolist() for items in self.levels], 'offsets': list(self.offsets)
         }
+
+    @classmethod
+    def from_dict(cls, data):
+        """Rebuilds a sketch written by to_dict."""
+        sketch = cls(data['k'])
+        sketch.levels = [np.asarray(items, dtype=np.float64) for items in data['levels']]
+        sketch.offsets = list(data['offsets'])
+        sketch.count = data['count']
+        sketch.min = data['min'] if data['min'] is not None else np.inf
+        sketch.max = data['max'] if data['max'] is not None else -np.inf
+        return sketch
+
+
+# Metrics summarized by quantile sketches: movement durations in seconds, saccade peak gaze velocity in
+# degrees per second and pupil diameter (mean of both eyes) in mm
+SKETCH_METRICS = ('fixation_duration', 'saccade_duration', 'peak_velocity', 'pupil_diameter')
+
+
+class MetricSketches:
+    """
+    One QuantileSketch per SKETCH_METRICS entry, the long-session quantiles of one session or, merged,
+    of a cohort. Memory does not grow with the session, unlike keeping every movement duration.
+    """
+
+    def __init__(self, k=SKETCH_K):
+        self.sketches = {metric: QuantileSketch(k) for metric in SKETCH_METRICS}
+
+    def update(self, metric, values):
+        self.sketches[metric].update(values)
+
+    @property
+    def count(self):
+        """Number of values added over every metric."""
+        return sum(sketch.count for sketch in self.sketches.values())
+
+    def add_movements(self, types, durations, peak_velocities):
+        """
+        Adds classified movements.
+
+        Parameters:
+        - types (array-like): MOVEMENT_TYPES code of every movement.
+        - durations (array-like): Duration of every movement in seconds.
+        - peak_velocities (array-like): Highest gaze velocity of every movement.
+        """
+        types = np.asarray(types)
+        saccades = types == SACCADE
+        self.update('fixation_duration', np.asarray(durations)[types == FIXATION])
+        self.update('saccade_duration', np.asarray(durations)[saccades])
+        self.update('peak_velocity', np.asarray(peak_velocities)[saccades])
+
+    def add_segments(self, segments):
+        """Adds the movements of a MovementSegments table."""
+        self.add_movements(segments.types, segments.durations, segments.peak_velocities)
+
+    def merge(self, other):
+        for metric, sketch in self.sketches.items():
+            sketch.merge(other.sketches[metric])
+        return self
+
+    def copy(self):
+        return MetricSketches.from_dict(self.to_dict())
+
+    def summary(self, percentiles=SKETCH_PERCENTILES):
+        """
+        Returns per metric the count, min, max and 'p<q>' estimate of every percentile (0 to 100),
+        None where nothing was added.
+        """
+        summary = {}
+        for metric, sketch in self.sketches.items():
+            estimates = sketch.quantiles(np.asarray(percentiles, dtype=np.float64) / 100)
+            summary[metric] = {'count': sketch.count,
+                               'min': float(sketch.min) if sketch.count else None,
+                               'max': float(sketch.max) if sketch.count else None}
+            for percentile, estimate in zip(percentiles, estimates):
+                summary[metric][f'p{percentile:g}'] = float(estimate) if sketch.count else None
+        return summary
+
+    def to_dict(self):
+        return {metric: sketch.to_dict() for metric, sketch in self.sketches.items()}
+
+    @classmethod
+    def from_dict(cls, data):
+        sketches = cls()
+        for metric in SKETCH_METRICS:
+            if metric in data:
+                sketches.sketches[metric] = QuantileSketch.from_dict(data[metric])
+        return sketches
+
+    def save(self, file_path):
+        """Writes the sketches as JSON, replacing `file_path` atomically."""
+        with open(file_path + '.part', 'w') as file:
+            json.dump(self.to_dict(), file)
+        os.replace(file_path + '.part', file_path)
+
+    @classmethod
+    def load(cls, file_path):
+        with open(file_path) as file:
+            return cls.from_dict(json.load(file))
+
+
+
+
+def tracking_lost_frames(df):
+    """
+    Marks the frames without usable gaze: GazeStatus is not VALID, both eyes are not VALID
+    (Left/RightEyeStatus) or both eyes are closed (Left/RightEyeOpenness below EYE_CLOSED_OPENNESS).
+    The eye status and openness columns are optional (older logs lack them), and an empty eye status
+    or openness counts as unknown rather than lost.
+
+    Returns:
+    - ndarray: Boolean mask with one entry per frame.
+    """
+    lost = (df['GazeStatus'] != 'VALID').to_numpy(dtype=bool, copy=True)
+    if 'LeftEyeStatus' in df.columns and 'RightEyeStatus' in df.columns:
+        eye_lost = [(~df[column].isin(['VALID', ''])) & df[column].notna() for column in ('LeftEyeStatus', 'RightEyeStatus')]
+        lost |= (eye_lost[0] & eye_lost[1]).to_numpy()
+    if 'LeftEyeOpenness' in df.columns and 'RightEyeOpenness' in df.columns:
+        lost |= ((df['LeftEyeOpenness'] < EYE_CLOSED_OPENNESS) & (df['RightEyeOpenness'] < EYE_CLOSED_OPENNESS)).to_numpy()
+    return lost
+
+
+def _tracking_gap_runs(df, lost):
+    """
+    Finds the gaps of a log: runs of lost frames, and time steps longer than MAX_FRAME_GAP between two
+    tracked frames (frames that never arrived).
+
+    Returns:
+    - tuple: (first frame, end frame (exclusive), start time, end time, is_blink) arrays with one entry per gap
+      in time order. A gap lasts from the last tracked frame before it to the first one after it (or the
+      first/last frame of the log). Blinks are runs of lost frames lasting BLINK_MIN_DURATION to
+      BLINK_MAX_DURATION, every other gap is tracking loss.
+    """
+    timestamps = df['TimeStamp'].to_numpy(dtype=float)
+    n = len(timestamps)
+    edges = np.diff(np.concatenate(([0], lost.astype(np.int8), [0])))
+    run_starts, run_ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+    run_start_times = timestamps[np.maximum(run_starts - 1, 0)]
+    run_end_times = timestamps[np.minimum(run_ends, n - 1)]
+    run_durations = run_end_times - run_start_times
+    run_blinks = (run_durations >= BLINK_MIN_DURATION) & (run_durations <= BLINK_MAX_DURATION)
+
+    # Missing frames between two tracked frames
+    dropped = np.flatnonzero((np.diff(timestamps) > MAX_FRAME_GAP) & ~lost[:-1] & ~lost[1:]) + 1
+    starts = np.concatenate((run_starts, dropped))
+    order = np.argsort(starts, kind='stable')
+    return (starts[order], np.concatenate((run_ends, dropped))[order],
+            np.concatenate((run_start_times, timestamps[dropped - 1]))[order],
+            np.concatenate((run_end_times, timestamps[dropped]))[order],
+            np.concatenate((run_blinks, np.zeros(len(dropped), dtype=bool)))[order])
+
+
+def find_tracking_gaps(df):
+    """
+    Segments a log into blink and tracking-loss intervals, see tracking_lost_frames and _tracking_gap_runs.
+
+    Parameters:
+    - df (DataFrame): Frames with TimeStamp (seconds) and GazeStatus, optionally Left/RightEyeStatus and
+      Left/RightEyeOpenness.
+
+    Returns:
+    - list: One dict per gap with 'type' ('blink' or 'tracking_loss'), 'start' and 'end' (timestamps of
+      the tracked frames around it), 'duration' and 'frames' (lost frames, 0 for frames that never arrived).
+    """
+    if df.empty:
+        return []
+    first_frames, end_frames, start_times, end_times, blinks = _tracking_gap_runs(df, tracking_lost_frames(df))
+    return [
+        {'type': 'blink' if blink else 'tracking_loss', 'start': start, 'end': end, 'duration': end - start,
+         'frames': frames}
+        for blink, start, end, frames
+        in zip(blinks.tolist(), start_times.tolist(), end_times.tolist(), (end_frames - first_frames).tolist())
+    ]
+
+
+def tracking_quality(df, gaps=None):
+    """
+    Tracking-quality ratios of a log.
+
+    Parameters:
+    - df (DataFrame): Frames as for find_tracking_gaps.
+    - gaps (list or None): The result of find_tracking_gaps, computed if None.
+
+    Returns:
+    - dict: 'tracked_frame_ratio' (frames with usable gaze), 'monocular_frame_ratio' (frames with one eye
+      VALID, None without the eye status columns), blink and tracking loss counts, 'blink_rate' (blinks
+      per minute) and 'blink_time_ratio' and 'tracking_loss_time_ratio' (share of the log's duration).
+    """
+    if df.empty:
+        return {}
+    if gaps is None:
+        gaps = find_tracking_gaps(df)
+    timestamps = df['TimeStamp'].to_numpy(dtype=float)
+    total_time = timestamps[-1] - timestamps[0]
+    blink_time = sum(gap['duration'] for gap in gaps if gap['type'] == 'blink')
+    blink_count = sum(gap['type'] == 'blink' for gap in gaps)
+    loss_time = sum(gap['duration'] for gap in gaps if gap['type'] == 'tracking_loss')
+    monocular = None
+    if 'LeftEyeStatus' in df.columns and 'RightEyeStatus' in df.columns:
+        monocular = float(((df['LeftEyeStatus'] == 'VALID') != (df['RightEyeStatus'] == 'VALID')).mean())
+    return {
+        'tracked_frame_ratio': float(1 - tracking_lost_frames(df).mean()),
+        'monocular_frame_ratio': monocular,
+        'blink_count': blink_count,
+        'blink_rate': blink_count / total_time * 60 if total_time > 0 else None,
+        'blink_time_ratio': blink_time / total_time if total_time > 0 else None,
+        'tracking_loss_count': len(gaps) - blink_count,
+        'tracking_loss_time_ratio': loss_time / total_time if total_time > 0 else None
     }
 
-    # Separate durations by movement type using a dictionary
-    durations = {'fixation': [], 'saccade': [], 'saccade_candidate': [], 'other_saccades': []}
-    unique_ids = {'fixation': set(), 'saccade': set(), 'saccade_candidate': set(), 'other_saccades': set()}  # To track unique IDs for each movement type
-
-    # Accumulate durations based on unique movement ID
-    for i in range(len(movement_types)):
-        current_id = eye_movement_ids[i]
-        current_type = movement_types[i]
-
-        if current_type in durations and current_id != 0:  # Ignore outliers for duration
-            if current_id in movement_durations and current_id not in unique_ids[current_type]:
-                # Only add duration if this ID hasn't been processed yet for this type
-                durations[current_type].append(movement_durations[current_id])
-                stats[current_type]['time'] += movement_durations[current_id]  # Add to total time
-                unique_ids[current_type].add(current_id)  # Mark this ID as processed
-        elif current_type == 'outlier':
-            stats['outlier']['count'] += 1
-
-    # Calculate total duration across all unique movements
-    total_duration = sum(durations['fixation']) + sum(durations['saccade']) + sum(durations['saccade_candidate']) + sum(durations['other_saccades'])
-
-    # Function to calculate statistics
-    def calculate_stats(type_durations, total_time):
-        if len(type_durations) == 1:
-            # If there's only one duration, min, max, and mean are the same
-            duration = type_durations[0]
-            return {
-                'min': duration,
-                'max': duration,
-                'mean': duration,
-                'count': 1,
-                'percentage': (duration / total_duration) * 100 if total_duration > 0 else 0,
-                'time_percentage': (duration / total_time) * 100 if total_time > 0 else 0
-            }
-        elif len(type_durations) > 1:
-            # Calculate statistics normally
-            total_type_duration = sum(type_durations)
-            return {
-                'min': np.min(type_durations),
-                'max': np.max(type_durations),
-                'mean': np.mean(type_durations),
-                'count': len(type_durations),
-                'percentage': (total_type_duration / total_duration) * 100 if total_duration > 0 else 0,
-                'time_percentage': (total_type_duration / total_time) * 100 if total_time > 0 else 0
-            }
-        else:
-            # If there are no durations, return default stats
-            return {'min': None, 'max': None, 'mean': None, 'count': 0, 'percentage': 0.0, 'time_percentage': 0.0}
-
-   
-    # Assign calculated statistics to the respective movement types
-    stats['fixation'].update(calculate_stats(durations['fixation'], total_time))
-    stats['saccade'].update(calculate_stats(durations['saccade'], total_time))
-    stats['saccade_candidate'].update(calculate_stats(durations['saccade_candidate'], total_time))
-    stats['other_saccades'].update(calculate_stats(durations['other_saccades'], total_time))
-
-    # Calculate percentage of outliers
-    total_points = len(movement_types)
-    if total_points > 0:
-        stats['outlier']['percentage'] = (stats['outlier']['count'] / total_points) * 100
-        stats['outlier']['time'] = total_time - (stats['fixation']['time'] + stats['saccade']['time'] + stats['saccade_candidate']['time'] + stats['other_saccades']['time'])
-        stats['outlier']['time_percentage'] = (stats['outlier']['time'] / total_time) * 100 if total_time > 0 else 0
 
-    return stats
+def find_gap_breaks(gaze_valid, timestamps, max_frame_gap=MAX_FRAME_GAP):
+    """
+    Marks the valid frames whose velocity would span a gap: the first valid frame after invalid frames,
+    or after a time step longer than `max_frame_gap`.
 
+    Parameters:
+    - gaze_valid (array-like): Boolean per frame, True where GazeStatus is VALID.
+    - timestamps (array-like): Timestamps in seconds per frame.
 
+    Returns:
+    - ndarray: Boolean mask with one entry per valid frame, for angular_velocity_kernel and find_movement_runs.
+    """
+    positions = np.flatnonzero(np.asarray(gaze_valid, dtype=bool))
+    breaks = np.diff(positions, prepend=-1) > 1
+    breaks[1:] |= np.diff(np.asarray(timestamps, dtype=float)[positions]) > max_frame_gap
+    return breaks
 
 
 def detect_blinks(head_gaze_df):
-    # Initialize a column for Blink detection
-    head_gaze_df['Blink'] = False
-
-    # Find periods with lost gaze tracking (GazeStatus != 'VALID')
-    lost_tracking_periods = head_gaze_df[head_gaze_df['GazeStatus'] != 1].index
+    """
+    Adds a 'Blink' column marking the frames of blink intervals (see find_tracking_gaps).
 
-    # Mark these periods as blinks
-    head_gaze_df.loc[lost_tracking_periods, 'Blink'] = True
+    Parameters:
+    - head_gaze_df (DataFrame): All frames of a log, with TimeStamp in seconds.
 
+    Returns:
+    - DataFrame: head_gaze_df with the 'Blink' column.
+    """
+    blink = np.zeros(len(head_gaze_df), dtype=bool)
+    if len(head_gaze_df):
+        first_frames, end_frames, _, _, blinks = _tracking_gap_runs(head_gaze_df, tracking_lost_frames(head_gaze_df))
+        # Per-frame marks from the run boundaries: +1 at each blink's first frame, -1 after its last
+        marks = np.zeros(len(head_gaze_df) + 1, dtype=np.int64)
+        np.add.at(marks, first_frames[blinks], 1)
+        np.add.at(marks, end_frames[blinks], -1)
+        blink = np.cumsum(marks[:-1]) > 0
+    head_gaze_df['Blink'] = blink
     return head_gaze_df
 
-def interpolate_high_angular_velocities(angular_velocity, threshold=500):
+def interpolate_high_angular_velocities(angular_velocity, threshold=500, seed=0):
     """
     Interpolates individual points in angular velocities if they exceed a specified threshold.
 
     Parameters:
     - angular_velocity (Series): Series containing gaze angular velocities.
     - threshold (float): Threshold above which velocity points will be interpolated.
+    - seed (int): Seed of the random values that replace velocities still above 500 after interpolation,
+      so the same input always gives the same output (results are cached by input).
 
     Returns:
     - interpolated_angular_velocity (Series): Interpolated gaze angular velocities.
@@ -1138,7 +2249,7 @@ def interpolate_high_angular_velocities(angular_velocity, threshold=500):
     remaining_changed_count = remaining_high_gaze_indices.sum()
 
     # Update the high values to random values between 150 and 500
-    interpolated_angular_velocity[remaining_high_gaze_indices] = np.random.uniform(150, 500, size=remaining_high_gaze_indices.sum())
+    interpolated_angular_velocity[remaining_high_gaze_indices] = np.random.default_rng(seed).uniform(150, 500, size=remaining_high_gaze_indices.sum())
 
     # Calculate total number of changes
     total_changed_count = initial_changed_count + remaining_changed_count
@@ -1160,49 +2271,60 @@ def interpolate_high_angular_velocities(angular_velocity, threshold=500):
     return interpolated_angular_velocity, percentage_changed
 
 # Calculate gaze and head angular velocities
-def detect_fixations_and_saccades(valid_head_gaze_df):
-    
-    gaze_vectors = calculate_gaze_vectors(valid_head_gaze_df)
-    _, gaze_angular_velocity = calculate_angles_and_angular_velocity(gaze_vectors, valid_head_gaze_df['TimeStamp'])
-    head_vectors = calculate_head_direction_vectors(valid_head_gaze_df)
-    _, head_angular_velocity = calculate_angles_and_angular_velocity(head_vectors, valid_head_gaze_df['TimeStamp'])
+def detect_fixations_and_saccades(valid_head_gaze_df, mode='full', breaks=None, outlier_filter=True):
+    """
+    Classifies the valid head and gaze samples into fixations and saccades.
+    With `outlier_filter` the isolated velocity outliers are interpolated first (ISOLATED_OUTLIER_WINDOW).
 
+    `breaks` (see find_gap_breaks) marks the samples that follow a gap. No velocity is computed across
+    a gap and no movement spans one; without `breaks` the samples are treated as one continuous recording.
 
-    # Initialize interpolated series
-    #interpolated_gaze_velocity = gaze_angular_velocity.reindex(head_gaze_df.index).interpolate()
-    #interpolated_head_velocity = head_angular_velocity.reindex(head_gaze_df.index).interpolate()
+    Returns (stats, eye_movement_df, eye_movement_dict). In 'summary' mode eye_movement_df is None.
+    eye_movement_dict is an EyeMovementDict view over the MovementSegments table of the movements
+    (its `segments`), the view is built when it is read.
+    """
+    
+    rows = len(valid_head_gaze_df)
+    # Gaze and head angular velocities, with gaze spikes above 500 deg/s interpolated
+    with stage_timer('kinematics', rows):
+        gaze_angular_velocity, head_angular_velocity, _ = angular_velocity_kernel(
+            valid_head_gaze_df[KINEMATICS_COLUMNS].to_numpy(dtype=float), valid_head_gaze_df['TimeStamp'].to_numpy(dtype=float),
+            threshold=500, breaks=breaks)
 
     # Apply time-based sliding window interpolation to velocity columns
-    #valid_gaze_df['AngularVelocity'] = interpolate_outliers_time_window(
-    #    valid_gaze_df['AngularVelocity'], valid_gaze_df['TimeStamp'], window_duration, threshold
-    #)
-    #valid_gaze_df['HeadVelocity'] = interpolate_outliers_time_window(
-    #    valid_gaze_df['HeadVelocity'], valid_gaze_df['TimeStamp'], window_duration, threshold
-    #)
-
+    if outlier_filter and ISOLATED_OUTLIER_WINDOW is not None:
+        with stage_timer('outlier_filter', rows):
+            timestamps = valid_head_gaze_df['TimeStamp'].to_numpy(dtype=float)
+            gaze_angular_velocity = interpolate_outliers_time_window(
+                gaze_angular_velocity, timestamps, ISOLATED_OUTLIER_WINDOW, ISOLATED_OUTLIER_THRESHOLD).to_numpy()
+            head_angular_velocity = interpolate_outliers_time_window(
+                head_angular_velocity, timestamps, ISOLATED_OUTLIER_WINDOW, ISOLATED_OUTLIER_THRESHOLD).to_numpy()
+            if breaks is not None:
+                # The filter interpolates every NaN, the velocities after a gap stay undefined
+                gaze_angular_velocity = np.where(breaks, np.nan, gaze_angular_velocity)
+                head_angular_velocity = np.where(breaks, np.nan, head_angular_velocity)
 
-    # Interpolate high angular velocities before storing them in the DataFrame
-    gaze_angular_velocity, head_angular_velocity = interpolate_high_angular_velocities(
-        gaze_angular_velocity, threshold=500
-    )
     # Store angular and head velocities in the DataFrame
     valid_head_gaze_df['GazeVelocity'] = gaze_angular_velocity
     valid_head_gaze_df['HeadVelocity'] = head_angular_velocity
 
     # Classify points using updated conditions
-    movement_types, eye_movement_ids, movement_durations, movement_amplitudes, movement_velocities = classify_points(
-        valid_head_gaze_df)
+    with stage_timer('classify_points', rows):
+        movement_types, eye_movement_ids, movement_durations, movement_amplitudes, movement_velocities = classify_points(
+            valid_head_gaze_df, breaks)
     # Include movement_velocities in the call to process_outliers_fixation
-    movement_types, eye_movement_ids, movement_durations, movement_amplitudes, movement_velocities = process_outliers_fixation(
-        movement_types, eye_movement_ids, movement_durations, movement_amplitudes, movement_velocities)
+    with stage_timer('outliers_fixation', rows):
+        movement_types, eye_movement_ids, movement_durations, movement_amplitudes, movement_velocities = process_outliers_fixation(
+            movement_types, eye_movement_ids, movement_durations, movement_amplitudes, movement_velocities)
 
    # # Step 4: Process groups of outliers and saccade candidates
    # movement_types, eye_movement_ids, movement_durations, movement_amplitudes, movement_velocities = process_outliers_saccade_candidates(
    #     movement_types, eye_movement_ids, movement_durations, movement_amplitudes, movement_velocities)
 
     # Include movement_velocities in the call to process_outliers_saccade
-    movement_types, eye_movement_ids, movement_durations, movement_amplitudes, movement_velocities = process_outliers_saccade(
-        movement_types, eye_movement_ids, movement_durations, movement_amplitudes, movement_velocities)
+    with stage_timer('outliers_saccade', rows):
+        movement_types, eye_movement_ids, movement_durations, movement_amplitudes, movement_velocities = process_outliers_saccade(
+            movement_types, eye_movement_ids, movement_durations, movement_amplitudes, movement_velocities)
 
     
     # Get statistics of detected movements
@@ -1210,66 +2332,127 @@ def detect_fixations_and_saccades(valid_head_gaze_df):
     # Calculate total time from the DataFrame
     total_time = valid_head_gaze_df['TimeStamp'].iloc[-1] - valid_head_gaze_df['TimeStamp'].iloc[0]
 
-    # Get statistics of detected movements
-    stats = get_movement_statistics(movement_types, eye_movement_ids, movement_durations, total_time)
+    # Get statistics of detected movements from a table with one row per movement
+    with stage_timer('movement_statistics', rows):
+        segments = MovementSegments.from_points(movement_types, eye_movement_ids, movement_durations,
+                                                movement_amplitudes, gaze_angular_velocity)
+        stats = segment_statistics(segments, total_time)
+    if mode == 'summary':
+        return stats, None, EyeMovementDict(segments)
 
     valid_head_gaze_df['FrameDuration'] = valid_head_gaze_df['TimeStamp'].diff().fillna(0)
     valid_head_gaze_df['MovementType'] = movement_types
     valid_head_gaze_df['EyeMovementID'] = eye_movement_ids
 
+    # eye_movement_dict reads the table in the former per-row layout
+    return stats, valid_head_gaze_df, EyeMovementDict(segments)
 
+# Function to detect and interpolate isolated outliers using a time-based sliding window
+def _kth_smallest_of_two(left, left_count, right, right_count, k):
+    """
+    Returns the k-th smallest (0-based) value of two ascending sequences given as accessors
+    left(j) and right(j), by binary search over how many values come from `left`.
+    """
+    low, high = max(0, k + 1 - right_count), min(k + 1, left_count)
+    while low < high:
+        taken = (low + high) // 2
+        if left(taken) < right(k - taken):
+            low = taken + 1
+        else:
+            high = taken
+    candidates = []
+    if low > 0:
+        candidates.append(left(low - 1))
+    if k + 1 - low > 0:
+        candidates.append(right(k - low))
+    return max(candidates)
 
-    # Create a general dictionary with unique ids as keys
-    general_dict = {}
 
-    for idx, eye_id in enumerate(eye_movement_ids):
-        if eye_id not in general_dict:
-            # Initialize the dictionary for a new id
-            general_dict[eye_id] = {
-                'MovementType': [movement_types[idx]],
-                'MovementDuration': [movement_durations[eye_id]],
-                'MovementAmplitude': [movement_amplitudes[eye_id]],
-                'MovementVelocities': [movement_velocities[eye_id]]
-            }
-        else:
-            # Append data for existing id
-            general_dict[eye_id]['MovementType'].append(movement_types[idx])
-            general_dict[eye_id]['MovementDuration'].append(movement_durations[eye_id])
-            general_dict[eye_id]['MovementAmplitude'].append(movement_amplitudes[eye_id])
-            general_dict[eye_id]['MovementVelocities'].append(movement_velocities[eye_id])
+def rolling_median_mad(values, timestamps, window_duration):
+    """
+    Median and median absolute deviation of every centered time window
+    [t - window_duration / 2, t + window_duration / 2], ignoring NaN values like pandas does.
 
+    Samples are visited in time order while two pointers add the samples entering the window to a sorted
+    list and remove the ones leaving it (binary search). The median is read from the middle of the list,
+    and the MAD is a selection over the deviations below and above the median, which are two already
+    sorted sequences. Every sample costs O(log W) comparisons for a window of W samples, plus the O(W)
+    list shift of an insert or delete. The shift is a single memmove: a Fenwick-tree window with
+    O(log N) updates in Python was about 10 times slower for every W up to 18000 samples (200 s at 90 Hz).
+
+    Parameters:
+    - values (array-like): The series to filter.
+    - timestamps (array-like): Time of every value, in any order. Samples without a time have no window.
+    - window_duration (float): Window length in the unit of `timestamps`.
+
+    Returns:
+    - tuple: (medians, mads) arrays aligned with `values`, NaN where a window holds no values.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    timestamps = np.asarray(timestamps, dtype=np.float64)
+    medians = np.full(len(values), np.nan)
+    mads = np.full(len(values), np.nan)
+
+    order = np.argsort(timestamps, kind='stable')
+    order = order[~np.isnan(timestamps[order])]
+    sorted_times = timestamps[order].tolist()
+    sorted_values = values[order].tolist()
+    half_window = window_duration / 2
+
+    window = []
+    first, end = 0, 0
+    for position, current_time in enumerate(sorted_times):
+        while end < len(sorted_times) and sorted_times[end] <= current_time + half_window:
+            if sorted_values[end] == sorted_values[end]:  # Not NaN
+                bisect.insort(window, sorted_values[end])
+            end += 1
+        while sorted_times[first] < current_time - half_window:
+            if sorted_values[first] == sorted_values[first]:
+                del window[bisect.bisect_left(window, sorted_values[first])]
+            first += 1
+        count = len(window)
+        if not count:
+            continue
+
+        median = (window[(count - 1) // 2] + window[count // 2]) / 2
+        # Deviations of the values below the median grow to the left, the others to the right
+        split = bisect.bisect_left(window, median)
+        left = lambda j: median - window[split - 1 - j]
+        right = lambda j: window[split + j] - median
+        low_mad = _kth_smallest_of_two(left, split, right, count - split, (count - 1) // 2)
+        high_mad = _kth_smallest_of_two(left, split, right, count - split, count // 2)
+        medians[order[position]] = median
+        mads[order[position]] = (low_mad + high_mad) / 2
+    return medians, mads
 
-    return stats,valid_head_gaze_df, general_dict
 
-# Function to detect and interpolate isolated outliers using a time-based sliding window
 def interpolate_outliers_time_window(data_series, timestamps, window_duration, threshold):
-    interpolated_series = data_series.copy()
-
-    for i in range(len(data_series)):
-        # Define the window range based on timestamps
-        current_time = timestamps.iloc[i]
-        window_start = current_time - window_duration / 2
-        window_end = current_time + window_duration / 2
-
-        # Get indices within the window
-        window_indices = (timestamps >= window_start) & (timestamps <= window_end)
-        window_data = data_series[window_indices]
-
-        # Calculate median and MAD within the window
-        median = window_data.median()
-        mad = (window_data - median).abs().median()
-
-        # Identify if the current point is an outlier
-        if abs(data_series.iloc[i] - median) > threshold * mad:
-            # Check if it's an isolated outlier (not part of a group)
-            is_isolated = (
-                    (i == 0 or abs(data_series.iloc[i - 1] - median) <= threshold * mad) and
-                    (i == len(data_series) - 1 or abs(data_series.iloc[i + 1] - median) <= threshold * mad)
-            )
+    """
+    Replaces isolated outliers by linear interpolation. A value is an outlier when it is more than
+    `threshold` MADs from the median of its centered time window, and isolated when its neighbours
+    are within that distance.
 
-            if is_isolated:
-                interpolated_series.iloc[i] = np.nan
+    Parameters:
+    - data_series (Series or array-like): Values in sample order.
+    - timestamps (Series or array-like): Time of every value.
+    - window_duration (float): Window length in the unit of `timestamps`, see rolling_median_mad.
+    - threshold (float): Outlier distance in MADs.
 
+    Returns:
+    - Series: The values with isolated outliers interpolated.
+    """
+    values = np.asarray(data_series, dtype=np.float64)
+    medians, mads = rolling_median_mad(values, timestamps, window_duration)
+    limits = threshold * mads
+
+    outliers = np.abs(values - medians) > limits
+    previous_inlier = np.ones(len(values), dtype=bool)
+    previous_inlier[1:] = np.abs(values[:-1] - medians[1:]) <= limits[1:]
+    next_inlier = np.ones(len(values), dtype=bool)
+    next_inlier[:-1] = np.abs(values[1:] - medians[:-1]) <= limits[:-1]
+
+    interpolated_series = pd.Series(values, index=getattr(data_series, 'index', None))
+    interpolated_series[outliers & previous_inlier & next_inlier] = np.nan
     # Interpolate NaN values (isolated outliers)
     interpolated_series.interpolate(method='linear', inplace=True)
     return interpolated_series
@@ -1345,106 +2528,7 @@ def read_general_questionnaire(file_path):
     return questionnaire_results
 
 
-"""def process_all_files_in_folder(folder_path, nasatlx_filepath,questionnaire_filepath, video_games_filepath, double_slit_filepath):
-    results = {}
-
-    # Read NASA TLX results from the file
-    nasatlx_result = read_nasa_tlx_file(nasatlx_filepath)
-    questionnaire_results = read_general_questionnaire(questionnaire_filepath)
-    # Read Video Games MC and Double Slit MC results from their respective files
-    video_games_results = read_general_questionnaire(video_games_filepath)
-    double_slit_results = read_general_questionnaire(double_slit_filepath)
-
-    # Calculate scores for each topic
-    video_games_scores = calculate_scores(video_games_results, video_games_correct_answers)
-    double_slit_scores = calculate_scores(double_slit_results, double_slit_correct_answers)
-
-    count=0
-    for file_name in os.listdir(folder_path):
-
-        file_path = os.path.join(folder_path, file_name)
-        if os.path.isfile(file_path) and file_name.endswith('.csv'):  # Ensure it's a CSV file
-            print(f"Processing file: {file_name}")
-            count=count+1
-            print(count)
-
-            # Extract file information
-            file_info = parse_filename(file_name)
-
-            # Extract participant ID, case number, and trial number
-            participant_id = file_info['participant_id']
-            case_number = file_info['case_number']
-            trial_number = file_info['session']  # Assuming trial number corresponds to session
-
-            # Create a unique key using participant ID, case number, and trial number
-            key = (participant_id, case_number, trial_number)
-
-
-            # Create a nested dictionary structure if not already present
-            if key not in results:
-                results[key] = {
-                    'file_info': file_info,
-                    'eye_tracking': {},
-                    'nasatlx': {
-                        'condition_tlx': None,
-                        'topic_tlx': None,
-                        'cognitive_load': None
-                    },
-                    'questionnaire_results': {},
-                    'mc_quiz': {}
-                }
-
-
-            # Process eye-tracking data
-            result_eye_tracking = process_log_file(file_path)
-
-            # Assign the eye-tracking results if needed
-            results[key]['eye_tracking'] = result_eye_tracking
-
-            # Extract condition and topic from file_info
-            condition = file_info['condition']
-            topic = file_info['topic']
-
-            # Assign condition_tlx and topic_tlx from NASA TLX results if available
-            if participant_id in nasatlx_result:
-                participant_data = nasatlx_result[participant_id]
-
-                # Assign the specific condition and topic from file_info
-                results[key]['nasatlx']['condition_tlx'] = condition
-                results[key]['nasatlx']['topic_tlx'] = topic
-
-                # Assign cognitive load score based on condition and topic
-                cognitive_load_score = participant_data['condition_tlx'].get(condition, None)
-                if cognitive_load_score is None:
-                    cognitive_load_score = participant_data['topic_tlx'].get(topic, None)
-                results[key]['nasatlx']['cognitive_load'] = cognitive_load_score
-
-            # Check if the participant ID exists in questionnaire results and add it
-            if participant_id in questionnaire_results:
-                results[key]['questionnaire_results'] = questionnaire_results[participant_id]
-            else:
-                print('no participant id')
-
-            # Assign MC scores based on topic
-            if topic == 'videogames':
-                if participant_id in video_games_scores:
-                    results[key]['mc_quiz']['mc_familiarity'] = video_games_scores[participant_id]['familiarity']
-                    results[key]['mc_quiz']['mc_quiz'] = video_games_scores[participant_id]['quiz_score']
-            elif topic == 'doubleslit':
-                if participant_id in double_slit_scores:
-                    results[key]['mc_quiz']['mc_familiarity'] = double_slit_scores[participant_id]['familiarity']
-                    results[key]['mc_quiz']['mc_quiz'] = double_slit_scores[participant_id]['quiz_score']
-
-    return results
-
-
-# Example usage
-video_games_filepath = '/Users/suleymanozdel/Downloads/VRClassroomEyeTrackingData/vrClassroom/questionaries/Video Games MC_August 27, 2024_15.04.csv'
-double_slit_filepath = '/Users/suleymanozdel/Downloads/VRClassroomEyeTrackingData/vrClassroom/questionaries/Double Slit MC_August 27, 2024_15.04.csv'
-questionnaire_filepath= '/Users/suleymanozdel/Downloads/VRClassroomEyeTrackingData/vrClassroom/questionaries/VRClassroom General Questionnaire_August 27, 2024_11.08.csv'
-nasatlx_filepath = '/Users/suleymanozdel/Downloads/VRClassroomEyeTrackingData/vrClassroom/nasaTLX/nasatlx_raw.txt'
-folder_path = '/Users/suleymanozdel/Downloads/VRClassroomEyeTrackingData/EyeTrackingLogs/'
-results = process_all_files_in_folder(folder_path, nasatlx_filepath, questionnaire_filepath, video_games_filepath, double_slit_filepath)"""
+# The offline cohort pipeline (process_all_files_in_folder) lives in batch.py
 
 # Convert results dictionary to JSON-compatible format (e.g., handling non-serializable objects)
 def make_json_serializable(obj):
@@ -1506,23 +2590,598 @@ app.config['ALLOWED_EXTENSIONS'] = {'csv'}  # Allowed file types
 app.config['SESSION_PERMANENT'] = False
 app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(minutes=30)  # Session timeout
 
+app.config['ARCHIVE_UPLOADS'] = True  # Keep a copy of every upload for offline analysis
+app.config['ARCHIVE_FOLDER'] = os.path.join('uploads', 'archive')  # Only this folder is rotated
+app.config['ARCHIVE_QUEUE_SIZE'] = 64  # Uploads waiting for the archive writer, further uploads are not archived
+app.config['ARCHIVE_MAX_FILES'] = 1000  # Oldest archived uploads are deleted beyond this count
+app.config['ARCHIVE_MAX_AGE_DAYS'] = 30  # Archived uploads older than this are deleted, None keeps them
+app.config['ARCHIVE_FORMAT'] = 'parquet'  # 'parquet' or 'arrow' transcode uploads (needs pyarrow), 'csv' keeps them as received
+app.config['TIMELINE_STORE'] = True  # Keep every received frame once per user in a gaze timeline for whole-session reanalysis
+app.config['TIMELINE_FOLDER'] = os.path.join('uploads', 'timelines')  # One timeline file per user, restarted by /start_session
+app.config['SKETCH_FOLDER'] = os.path.join('uploads', 'sketches')  # Quantile sketches of every /ingest session, kept across restarts, None keeps them in memory only
+app.config['SKETCH_SAVE_INTERVAL'] = 10  # Seconds between writes of a session's sketches
+app.config['ANALYSIS_WORKERS'] = os.cpu_count() or 1  # Processes analyzing uploads, 0 analyzes in the request thread
+app.config['ANALYSIS_PENDING_PER_USER'] = 1  # Windows of one user waiting for a worker, older ones are coalesced
+app.config['ANALYSIS_TIMEOUT'] = 120  # Seconds an upload waits for its analysis before it fails, None waits indefinitely
+app.config['RESULT_CACHE_SIZE'] = 1024  # Upload results kept in memory, 0 disables the result cache
+app.config['RESULT_CACHE_FOLDER'] = None  # Folder of the on-disk result cache tier, None keeps results in memory only
+app.config['LOG_LEVEL'] = 'INFO'  # 'DEBUG' also logs per-request details such as the /upload results
+app.config['LOG_RATE_LIMIT_BURST'] = 10  # Messages with the same text let through per interval, further ones are counted and dropped
+app.config['LOG_RATE_LIMIT_INTERVAL'] = 60  # Seconds
+
+logger.setLevel(app.config['LOG_LEVEL'])
+logger.addFilter(RateLimitFilter(app.config['LOG_RATE_LIMIT_BURST'], app.config['LOG_RATE_LIMIT_INTERVAL']))
+
 UPLOAD_FOLDER = "uploads"
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
 if not os.path.exists(app.config['UPLOAD_FOLDER']):
     os.makedirs(app.config['UPLOAD_FOLDER'])
 
+
+class UploadArchiver:
+    """
+    Writes uploads to the archive folder on a background thread so requests never wait for the disk.
+
+    Uploads are stored under <folder>/user=<user_id>/date=<YYYY-MM-DD>/, the layout Parquet dataset
+    readers understand as partitions. With archive_format 'parquet' or 'arrow' every upload is parsed
+    and transcoded into a typed columnar file (categorical columns dictionary-encoded), so reanalysis
+    never parses the decimal-comma text again. 'csv' stores the upload as it was received, which is also
+    the fallback when pyarrow is not installed.
+
+    The same thread adds the frames of uploads to the users' gaze timelines (see append_to_timeline), so
+    requests neither parse an upload a second time nor wait for the timeline file. Timeline appends and
+    clears run in the order they were queued; wait_for_timeline waits for those of one user only.
+
+    The queue is bounded: when the writer falls behind, new uploads are dropped from the archive and the
+    timeline (the analysis is not affected). After every write the folder is rotated so it keeps at most
+    max_files files, none older than max_age_days. The folder must hold nothing but archived uploads. It is
+    scanned once, on the first write; later writes only update an index of the files by age, so rotating
+    does not slow down as the archive grows.
+    """
+
+    def __init__(self, folder, queue_size=64, max_files=1000, max_age_days=30, archive_format='csv'):
+        self.folder = folder
+        self.max_files = max_files
+        self.max_age_days = max_age_days
+        self.archive_format = archive_format
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.dropped = 0
+        self._timeline_tasks = Counter()  # user_id -> queued timeline appends and clears not done yet
+        self._timeline_done = threading.Condition()
+        self._files = None  # Absolute path -> mtime of every archived file, oldest first; built on the first write
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def submit(self, filename, data, user_id='default_user', archive=True, timeline=False, binary=False):
+        """
+        Queues an upload of `user_id`. With `archive` `data` is written as `filename` in the user's partition,
+        with `timeline` its frames are added to the user's gaze timeline. `binary` uploads (see
+        encode_gaze_frames) are only added to the timeline. Returns False if the queue is full.
+        """
+        task = (self._store_upload, (filename, data, user_id, time.strftime('%Y-%m-%d'), archive and not binary,
+                                     timeline, binary))
+        return self._put(task, filename, user_id if timeline else None)
+
+    def submit_frames(self, user_id, df):
+        """Queues already parsed frames for the gaze timeline of `user_id`. Returns False if the queue is full."""
+        return self._put((append_to_timeline, (user_id, df)), f"frames of {user_id}", user_id)
+
+    def clear_timeline(self, user_id):
+        """Queues clearing the gaze timeline of `user_id`, after the frames queued before. Returns False if the queue is full."""
+        return self._put((clear_timeline, (user_id,)), f"timeline clear of {user_id}", user_id)
+
+    def wait_for_timeline(self, user_id, timeout=None):
+        """
+        Blocks until the timeline appends and clears queued for `user_id` are done, not waiting for other
+        users' uploads. Returns False if they were not done within `timeout` seconds.
+        """
+        with self._timeline_done:
+            return self._timeline_done.wait_for(lambda: not self._timeline_tasks[user_id], timeout)
+
+    def _put(self, task, name, timeline_user=None):
+        self._ensure_started()
+        with self._timeline_done:
+            if timeline_user is not None:
+                self._timeline_tasks[timeline_user] += 1
+        try:
+            self.queue.put_nowait(task + (timeline_user,))
+            return True
+        except queue.Full:
+            self._timeline_task_done(timeline_user)
+            self.dropped += 1
+            logger.warning("Archive queue full, not storing %s (%d dropped so far)", name, self.dropped)
+            return False
+
+    def _timeline_task_done(self, timeline_user):
+        if timeline_user is None:
+            return
+        with self._timeline_done:
+            self._timeline_tasks[timeline_user] -= 1
+            if not self._timeline_tasks[timeline_user]:
+                del self._timeline_tasks[timeline_user]
+                self._timeline_done.notify_all()
+
+    def flush(self):
+        """Blocks until every queued upload has been written."""
+        if self._thread is not None:
+            self.queue.join()
+
+    def partition(self, user_id, date):
+        """Returns the folder holding the uploads of `user_id` received on `date` (YYYY-MM-DD)."""
+        return os.path.join(self.folder, f"user={secure_filename(str(user_id)) or 'unknown'}", f"date={date}")
+
+    def _ensure_started(self):
+        with self._start_lock:
+            if self._thread is None:
+                if self.archive_format != 'csv' and pyarrow is None:
+                    logger.warning("pyarrow is not installed, archiving uploads as CSV instead of %s", self.archive_format)
+                    self.archive_format = 'csv'
+                self._thread = threading.Thread(target=self._run, name='upload-archiver', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            task, arguments, timeline_user = self.queue.get()
+            try:
+                task(*arguments)
+            except (OSError, ValueError, TypeError) as e:  # Unparseable uploads fail the transcode with ValueError
+                logger.error("Error storing %s: %s", arguments[0], e)
+            finally:
+                self._timeline_task_done(timeline_user)
+                self.queue.task_done()
+
+    def _store_upload(self, filename, data, user_id, date, archive, timeline, binary):
+        df = None
+        if archive:
+            file_path, df = self._write(filename, data, self.partition(user_id, date))
+            self._rotate(file_path)
+        if timeline:
+            if binary:
+                df = gaze_frames_to_dataframe(*decode_gaze_frames(data))
+            elif df is None:
+                df = read_gaze_log(io.BytesIO(data), columns=[column for column, _ in GAZE_FRAME_COLUMNS])
+            append_to_timeline(user_id, df)
+
+    def _write(self, filename, data, folder):
+        """Writes one upload to `folder`. Returns its path and the parsed frames if the upload was transcoded, else None."""
+        os.makedirs(folder, exist_ok=True)
+        if self.archive_format == 'csv':
+            file_path = os.path.join(folder, filename)
+        else:
+            file_path = os.path.join(folder, os.path.splitext(filename)[0] + '.' + self.archive_format)
+        temporary_path = file_path + '.part'
+        df = None
+        if self.archive_format == 'csv':
+            with open(temporary_path, 'wb') as file:
+                file.write(data)
+        else:
+            df = read_gaze_log(io.BytesIO(data))
+            write_gaze_archive(df, temporary_path, self.archive_format)
+        os.replace(temporary_path, file_path)  # Readers never see a half-written upload
+        return file_path, df
+
+    def _scan(self):
+        """Returns absolute path -> mtime of every archived file in the folder, oldest first."""
+        entries = []
+        for root, _, filenames in os.walk(self.folder):
+            for filename in filenames:
+                if not filename.endswith('.part'):
+                    file_path = os.path.abspath(os.path.join(root, filename))
+                    entries.append((os.stat(file_path).st_mtime, file_path))
+        entries.sort()
+        return OrderedDict((file_path, mtime) for mtime, file_path in entries)
+
+    def _rotate(self, file_path):
+        """Adds the file just written to the index, then removes the oldest files over max_files or max_age_days."""
+        file_path = os.path.abspath(file_path)
+        if self._files is None:
+            self._files = self._scan()
+        else:
+            self._files.pop(file_path, None)  # A rewritten upload is the newest file again
+            self._files[file_path] = os.stat(file_path).st_mtime
+
+        oldest_allowed = time.time() - self.max_age_days * 86400 if self.max_age_days is not None else None
+        root = os.path.abspath(self.folder)
+        while self._files:
+            oldest_path, mtime = next(iter(self._files.items()))
+            too_many = self.max_files is not None and len(self._files) > self.max_files
+            too_old = oldest_allowed is not None and mtime < oldest_allowed
+            if not too_many and not too_old:
+                break
+            del self._files[oldest_path]
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(oldest_path)
+            # Drop partitions that became empty, never the archive folder itself or anything above it
+            folder = os.path.dirname(oldest_path)
+            while folder.startswith(root + os.sep) and not os.listdir(folder):
+                os.rmdir(folder)
+                folder = os.path.dirname(folder)
+
+
+upload_archiver = UploadArchiver(app.config['ARCHIVE_FOLDER'], app.config['ARCHIVE_QUEUE_SIZE'],
+                                 app.config['ARCHIVE_MAX_FILES'], app.config['ARCHIVE_MAX_AGE_DAYS'],
+                                 app.config['ARCHIVE_FORMAT'])
+atexit.register(upload_archiver.flush)
+
+
+def _analyze_upload(data, source, binary=False):
+    """
+    Parses an uploaded window and computes its /upload results. Runs in an analysis worker process.
+
+    Returns:
+    - tuple: (results_dict, compute_seconds, report) where report holds the worker's stage timings
+      ('stages', see collect_stages) and peak memory ('peak_memory_bytes') for the server's metrics.
+    """
+    start = time.perf_counter()
+    with collect_stages() as stages:
+        with stage_timer('parse') as stage:
+            if binary:
+                df = gaze_frames_to_dataframe(*decode_gaze_frames(data))
+            else:
+                df = read_gaze_log(io.BytesIO(data), columns='analysis')
+            stage['rows'] = len(df)
+        results_dict = process_eye_tracking_frames(df, source, session_inputs=True)
+    return results_dict, time.perf_counter() - start, {'stages': stages, 'peak_memory_bytes': peak_memory_bytes()}
+
+
+def observe_worker_report(compute_seconds, report):
+    """Adds the compute time, stage timings and peak memory an analysis worker sent back to the metrics."""
+    metrics.observe('gaze_analysis_seconds', compute_seconds)
+    observe_stages(report['stages'])
+    if report['peak_memory_bytes'] is not None:
+        metrics.set_max('gaze_peak_memory_bytes', report['peak_memory_bytes'], process='worker')
+
+
+def _warm_up_worker():
+    """Does nothing, submitting it makes a worker process import this module before the first upload."""
+    return None
+
+
+class AnalysisJob:
+    """One uploaded window waiting for its analysis, see AnalysisScheduler."""
+
+    def __init__(self, data, source, binary):
+        self.data = data
+        self.source = source
+        self.binary = binary
+        self.arrival = time.perf_counter()
+        self.done = threading.Event()
+        self.coalesced = []  # Older windows of the same user that are answered with this job's result
+        self.result = None
+        self.error = None
+        self.compute_seconds = 0.0
+        self.finished = None
+        self.result_of = None  # The job whose analysis answered this one
+
+
+class AnalysisScheduler:
+    """
+    Runs /upload analyses in a pool of worker processes so a slow window never blocks the request threads
+    of other headsets.
+
+    Every user has at most one window in the pool and a bounded queue of windows waiting for it. When a
+    newer window arrives and the queue is full, the oldest waiting window is dropped from the queue (it is
+    coalesced): its request is answered with the result of the newer window.
+    """
+
+    def __init__(self, workers, pending_per_user=1, timeout=None):
+        self.workers = workers
+        self.pending_per_user = max(pending_per_user, 1)
+        self.timeout = timeout  # Seconds run() waits for a result, None waits indefinitely
+        self._executor = None
+        self._lock = threading.Lock()
+        self._running = {}  # user_id -> AnalysisJob in the pool
+        self._pending = defaultdict(deque)  # user_id -> AnalysisJobs waiting, oldest first
+
+    def run(self, user_id, data, source, binary=False):
+        """
+        Analyzes an uploaded window of `user_id` and waits for the result.
+
+        Returns:
+        - tuple: (results_dict, timings) where timings holds 'Queue_Wait_Seconds', 'Compute_Seconds' and
+          'Coalesced' (True if the result is the one of a newer window). Raises the analysis error, if any,
+          and TimeoutError if no result arrived within `timeout` seconds.
+        """
+        if self.workers == 0:
+            results_dict, compute_seconds, report = _analyze_upload(data, source, binary)
+            observe_worker_report(compute_seconds, report)
+            return results_dict, {'Queue_Wait_Seconds': 0.0, 'Compute_Seconds': compute_seconds, 'Coalesced': False}
+
+        job = AnalysisJob(data, source, binary)
+        with self._lock:
+            start = user_id not in self._running
+            if start:
+                self._running[user_id] = job
+            else:
+                pending = self._pending[user_id]
+                pending.append(job)
+                while len(pending) > self.pending_per_user:
+                    dropped = pending.popleft()
+                    pending[0].coalesced += [dropped] + dropped.coalesced
+                    dropped.coalesced = []
+        if start:
+            self._start(user_id, job)
+
+        if not job.done.wait(self.timeout):
+            raise TimeoutError(f"No analysis result for {source} after {self.timeout} seconds")
+        if job.error is not None:
+            raise job.error
+        total_seconds = job.finished - job.arrival
+        return job.result, {
+            'Queue_Wait_Seconds': max(total_seconds - job.compute_seconds, 0.0),
+            'Compute_Seconds': job.compute_seconds,
+            'Coalesced': job.result_of is not job
+        }
+
+    def start(self):
+        """Starts the worker processes now instead of on the first upload, which would wait for their imports."""
+        if self.workers == 0:
+            return
+        with self._lock:
+            executor = self._get_executor()
+        for warm_up in [executor.submit(_warm_up_worker) for _ in range(self.workers)]:
+            warm_up.result()
+
+    def _get_executor(self):
+        if self._executor is None:
+            # Spawned workers do not inherit the server's threads and locks
+            self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+        return self._executor
+
+    def _start(self, user_id, job):
+        """
+        Submits `job`, which is already the user's entry in _running. Call without the lock held: a future
+        that is already done runs _finish in this thread.
+        """
+        with self._lock:
+            executor = self._get_executor()
+        try:
+            future = executor.submit(_analyze_upload, job.data, job.source, job.binary)
+        except Exception as e:  # E.g. BrokenProcessPool when a worker died, the waiting windows fail with it
+            with self._lock:
+                self._reset_executor(executor, e)
+                del self._running[user_id]
+                failed = [job] + list(self._pending.pop(user_id, ()))
+            for failed_job in failed:
+                self._answer(failed_job, None, e, 0.0, time.perf_counter())
+            return
+        future.add_done_callback(lambda future: self._finish(user_id, job, executor, future))
+
+    def _reset_executor(self, executor, error):
+        """Drops a broken pool so the next window starts a new one. Call with the lock held."""
+        if isinstance(error, BrokenProcessPool) and self._executor is executor:
+            self._executor = None
+
+    @staticmethod
+    def _answer(job, result, error, compute_seconds, finished):
+        """Hands the result of `job` to its request and to the requests of the windows coalesced into it."""
+        for answered in [job] + job.coalesced:
+            answered.result, answered.error = result, error
+            answered.compute_seconds, answered.finished, answered.result_of = compute_seconds, finished, job
+            answered.data = None
+            answered.done.set()
+
+    def _finish(self, user_id, job, executor, future):
+        finished = time.perf_counter()
+        result, compute_seconds = None, 0.0
+        error = CancelledError() if future.cancelled() else future.exception()
+        try:
+            if error is None:
+                result, compute_seconds, report = future.result()
+                observe_worker_report(compute_seconds, report)
+        finally:
+            # The waiting requests are answered even if the bookkeeping fails
+            self._answer(job, result, error, compute_seconds, finished)
+
+        with self._lock:
+            self._reset_executor(executor, error)
+            pending = self._pending.get(user_id)
+            next_job = pending.popleft() if pending else None
+            if next_job is not None:
+                self._running[user_id] = next_job
+            else:
+                del self._running[user_id]
+                self._pending.pop(user_id, None)
+        if next_job is not None:
+            self._start(user_id, next_job)
+
+    def shutdown(self):
+        """Stops the worker processes, windows still waiting are not analyzed."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+analysis_scheduler = AnalysisScheduler(app.config['ANALYSIS_WORKERS'], app.config['ANALYSIS_PENDING_PER_USER'],
+                                       app.config['ANALYSIS_TIMEOUT'])
+atexit.register(analysis_scheduler.shutdown)
+
+
+# Bump when a change to the analysis changes the results of the same upload, so cached results are not reused
+ANALYSIS_VERSION = 7
+
+
+def analysis_parameters():
+    """Returns the parameters the /upload results depend on, used in the result cache keys."""
+    return {
+        'version': ANALYSIS_VERSION,
+        'window_length': WINDOW_LENGTH, 'polyorder': POLYORDER, 'baseline_duration': BASELINE_DURATION,
+        'min_fixation_duration': MIN_FIXATION_DURATION, 'max_fixation_duration': MAX_FIXATION_DURATION,
+        'min_saccade_duration': MIN_SACCADE_DURATION, 'max_saccade_duration': MAX_SACCADE_DURATION,
+        'head_velocity_threshold': HEAD_VELOCITY_THRESHOLD,
+        'gaze_velocity_fixation_threshold': GAZE_VELOCITY_FIXATION_THRESHOLD,
+        'gaze_velocity_saccade_threshold': GAZE_VELOCITY_SACCADE_THRESHOLD,
+        'isolated_outlier_window': ISOLATED_OUTLIER_WINDOW, 'isolated_outlier_threshold': ISOLATED_OUTLIER_THRESHOLD,
+        'upload_outlier_filter': UPLOAD_OUTLIER_FILTER,
+        'max_frame_gap': MAX_FRAME_GAP, 'eye_closed_openness': EYE_CLOSED_OPENNESS,
+        'blink_min_duration': BLINK_MIN_DURATION, 'blink_max_duration': BLINK_MAX_DURATION,
+        'fixation_overload_threshold': FIXATION_OVERLOAD_THRESHOLD,
+        'saccade_underload_threshold': SACCADE_UNDERLOAD_THRESHOLD,
+        'pupil_overload_threshold': PUPIL_OVERLOAD_THRESHOLD,
+        'distraction_time_threshold': DISTRACTION_TIME_TRESHOLD
+    }
+
+
+class ResultCache:
+    """
+    Content-addressed cache of /upload results, so retried posts and replayed logs are not analyzed again.
+
+    Keys hash the upload bytes together with analysis_parameters(). Results live in an in-memory LRU tier
+    of at most `max_entries` results and, if `folder` is set, in a JSON file per key on disk that survives
+    restarts. Disk hits are promoted to memory.
+    """
+
+    def __init__(self, max_entries=1024, folder=None):
+        self.max_entries = max_entries
+        self.folder = folder
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        if folder is not None:
+            os.makedirs(folder, exist_ok=True)
+
+    def key(self, data, binary=False):
+        """Returns the cache key of an upload."""
+        digest = hashlib.sha256()
+        digest.update(json.dumps(analysis_parameters(), sort_keys=True).encode())
+        digest.update(b'binary' if binary else b'csv')
+        digest.update(data)
+        return digest.hexdigest()
+
+    def get(self, key):
+        """Returns the cached results of `key`, or None."""
+        with self._lock:
+            results_dict = self.entries.get(key)
+            if results_dict is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return results_dict
+
+        results_dict = self._read(key)
+        with self._lock:
+            if results_dict is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._remember(key, results_dict)
+        return results_dict
+
+    def put(self, key, results_dict):
+        """Caches the results of `key`."""
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._remember(key, results_dict)
+        self._write(key, results_dict)
+
+    def _remember(self, key, results_dict):
+        self.entries[key] = results_dict
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def _path(self, key):
+        return os.path.join(self.folder, key + '.json')
+
+    def _read(self, key):
+        if self.folder is None:
+            return None
+        try:
+            with open(self._path(key)) as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return None
+
+    def _write(self, key, results_dict):
+        if self.folder is None:
+            return
+        temporary_path = self._path(key) + '.part'
+        try:
+            with open(temporary_path, 'w') as file:
+                json.dump(results_dict, file)
+            os.replace(temporary_path, self._path(key))
+        except (OSError, TypeError, ValueError) as e:
+            logger.error("Error caching results %s: %s", key, e)
+
+
+result_cache = ResultCache(app.config['RESULT_CACHE_SIZE'], app.config['RESULT_CACHE_FOLDER'])
+
+
+def analyze_upload(user_id, data, source, binary=False):
+    """
+    Returns the /upload results of an uploaded window from the result cache, or analyzes it with
+    analysis_scheduler, anchored to the user's session with anchor_to_upload_session. Returns
+    (results_dict, timings) like AnalysisScheduler.run, plus 'Cached'.
+    """
+    key = result_cache.key(data, binary)
+    results_dict = result_cache.get(key)
+    if results_dict is not None:
+        metrics.inc('gaze_uploads_total', outcome='cached')
+        return anchor_to_upload_session(user_id, results_dict), {'Queue_Wait_Seconds': 0.0, 'Compute_Seconds': 0.0, 'Coalesced': False, 'Cached': True}
+
+    results_dict, timings = analysis_scheduler.run(user_id, data, source, binary)
+    # A coalesced result is the one of a newer window, it must not be cached under this window's key
+    if results_dict is not None and not timings['Coalesced']:
+        result_cache.put(key, results_dict)
+    metrics.observe('gaze_queue_wait_seconds', timings['Queue_Wait_Seconds'])
+    metrics.inc('gaze_uploads_total', outcome='coalesced' if timings['Coalesced'] else 'analyzed')
+    return anchor_to_upload_session(user_id, results_dict), {**timings, 'Cached': False}
+
+
+# Pupil processors of the /upload sessions keyed by user_id, see anchor_to_upload_session
+upload_pupil_sessions = {}
+upload_pupil_sessions_lock = threading.Lock()
+
+
+def anchor_to_upload_session(user_id, results_dict):
+    """
+    Returns the /upload results of a window without its 'Session_Inputs', with Cognitive_Overload decided
+    on the user's session rather than the window alone. The window's smoothed pupil diameters are added
+    to the user's IncrementalPupilProcessor (samples of earlier, overlapping windows are skipped), so the
+    baseline is captured once per session and the window's mean pupil diameter is min-max normalized with
+    the range of the whole session so far. Values are therefore comparable between uploads, like on /ingest.
+    `results_dict` is not changed, coalesced requests share it.
+    """
+    if results_dict is None or 'Session_Inputs' not in results_dict:
+        return results_dict
+    inputs = results_dict['Session_Inputs']
+    results = {name: value for name, value in results_dict.items() if name != 'Session_Inputs'}
+    smoothed = np.asarray(inputs['SmoothedPupilDiameter'], dtype=float)
+    with upload_pupil_sessions_lock:
+        processor = upload_pupil_sessions.setdefault(user_id, IncrementalPupilProcessor())
+        processor.add_smoothed(inputs['TimeStamp'], smoothed)
+        measured = smoothed[~np.isnan(smoothed)]
+        pupil_mean = processor.normalize(measured.mean()) if len(measured) and processor.max > processor.min else np.nan
+    fixation_mean = np.nan if inputs['Fixation_Mean'] is None else inputs['Fixation_Mean']
+    saccade_mean = np.nan if inputs['Saccade_Mean'] is None else inputs['Saccade_Mean']
+    results['Cognitive_Overload'] = bool(is_cognitive_overload(fixation_mean, saccade_mean, pupil_mean))
+    return results
+
 # Function to check allowed file types
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_EXTENSIONS']
 
 Previous_Classified_Files = []
 
+# Incremental analysis sessions keyed by user_id, see IncrementalAnalysisSession
+analysis_sessions = {}
+analysis_sessions_lock = threading.Lock()
+
 @app.route('/start_session', methods=['POST'])
 def start_session():
     user_id = request.form.get('user_id', 'default_user')  # Read from form data
     session['user_id'] = user_id  # Store in session
     session['file_Prefix'] = 1  # Initialize file_Postfix in session
+    with analysis_sessions_lock:
+        analysis_sessions.pop(user_id, None)  # A new session starts a fresh incremental analysis
+    with upload_pupil_sessions_lock:
+        upload_pupil_sessions.pop(user_id, None)  # And a new /upload pupil baseline
+        file_path = sketch_path(user_id)
+        if file_path and os.path.isfile(file_path):
+            os.remove(file_path)
+    if app.config['TIMELINE_STORE']:
+        upload_archiver.clear_timeline(user_id)  # After the frames of the previous session still queued
     return jsonify({'message': 'Session started', 'user_id': session['user_id']}), 200
 
 
@@ -1535,7 +3194,7 @@ def upload_file():
 
     user_id = session['user_id']
     # Debug: Check what files are in request
-    print("Received files:", request.files.keys())
+    logger.debug("Received files: %s", list(request.files.keys()))
 
     if 'file' not in request.files:
         return jsonify({'error': 'No file part'}), 400
@@ -1545,32 +3204,232 @@ def upload_file():
     if not file or not allowed_file(file.filename):
         return jsonify({'error': 'Invalid file or no file provided'}), 400
     file_Prefix = session.get('file_Prefix', 1)  # Default to 1 if not fou
-    file_path = os.path.join(UPLOAD_FOLDER, str(file_Prefix) + "_240_"+file.filename )
+    archive_name = str(file_Prefix) + "_240_" + secure_filename(file.filename)
     try:
-        file.save(file_path)
+        # Parse straight from memory, the archive copy is written in the background
+        data = file.read()
         session['file_Prefix'] = file_Prefix + 1
-        print(f"File saved to {file_path}")
+        if app.config['ARCHIVE_UPLOADS'] or app.config['TIMELINE_STORE']:
+            upload_archiver.submit(archive_name, data, user_id, archive=app.config['ARCHIVE_UPLOADS'],
+                                   timeline=app.config['TIMELINE_STORE'])
 
-        # Process the file
-        results_dict = process_eye_tracking_data(file_path)
+        # Process the file in an analysis worker
+        results_dict, timings = analyze_upload(user_id, data, archive_name)
         
         if results_dict is None:
             return jsonify({'error': 'Error processing file'}), 400
 
-        # Print the results to check what's being processed
-        print("Results:", results_dict)
+        # Log the results to check what's being processed
+        logger.debug("Results: %s", results_dict)
 
-        return jsonify(results_dict), 200
+        with stage_timer('serialization'):
+            response = jsonify({**results_dict, **timings})
+        return response, 200
 
     except Exception as e:
-        # Catch the error and print it
-        print("Error processing file:", str(e))
+        # Catch the error and log it
+        logger.error("Error processing file: %s", e)
         return jsonify({'error': str(e)}), 500  # Return error message
 
+@app.route('/upload_frames', methods=['POST'])
+def upload_frames():
+    """Handle a binary gaze frame upload (application/octet-stream body, see encode_gaze_frames) for the authenticated user."""
+    if 'user_id' not in session:
+        return jsonify({'error': 'User not authenticated'}), 400
+
+    if request.mimetype != 'application/octet-stream':
+        return jsonify({'error': 'Expected an application/octet-stream body'}), 400
+
+    data = request.get_data()
+    try:
+        decode_gaze_frames(data)  # Validates the header before the window is queued
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        user_id = session['user_id']
+        if app.config['TIMELINE_STORE']:
+            upload_archiver.submit(f"binary upload of {user_id}", data, user_id, archive=False, timeline=True, binary=True)
+        results_dict, timings = analyze_upload(user_id, data, f"binary upload of {user_id}", binary=True)
+        if results_dict is None:
+            return jsonify({'error': 'Error processing file'}), 400
+
+        with stage_timer('serialization'):
+            response = jsonify({**results_dict, **timings})
+        return response, 200
+
+    except Exception as e:
+        logger.error("Error processing frames: %s", e)
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/ingest', methods=['POST'])
+def ingest_frames():
+    """
+    Add only the new frames of the authenticated user to their incremental analysis session.
+    Accepts a CSV 'file' part or a binary gaze frame body (application/octet-stream).
+
+    The incremental classifier skips the isolated velocity outlier filter (ISOLATED_OUTLIER_WINDOW), whose
+    centered windows need frames that have not arrived yet. The fixation and saccade labels can therefore
+    differ from the /upload analysis of the same frames. Distraction_Detected tells whether the newest frames
+    show a distraction, not whether the session ever did.
+    """
+    if 'user_id' not in session:
+        return jsonify({'error': 'User not authenticated'}), 400
+
+    binary = request.mimetype == 'application/octet-stream'
+    file = request.files.get('file')
+    if not binary and (not file or not allowed_file(file.filename)):
+        return jsonify({'error': 'Invalid file or no file provided'}), 400
+
+    try:
+        with stage_timer('parse') as stage:
+            if binary:
+                df = gaze_frames_to_dataframe(*decode_gaze_frames(request.get_data()))
+            else:
+                df = read_gaze_log(file.stream, columns='analysis')
+            stage['rows'] = len(df)
+        if df.empty or 'TimeStamp' not in df.columns:
+            return jsonify({'error': 'No frames in file'}), 400
+        if app.config['TIMELINE_STORE']:
+            upload_archiver.submit_frames(session['user_id'], df)
+        df = df.assign(TimeStamp=df['TimeStamp'] / 1000.0)  # Convert to seconds, the queued frames keep milliseconds
+
+        analysis_session = get_analysis_session(session['user_id'])
+        with analysis_session.lock, stage_timer('incremental_analysis', len(df)):
+            analysis_session.ingest(df)
+            results_dict = analysis_session.results()
+            save_session_sketches(analysis_session)
+
+        with stage_timer('serialization'):
+            response = jsonify(results_dict)
+        return response, 200
+
+    except Exception as e:
+        logger.error("Error ingesting frames: %s", e)
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/gaze_dwell', methods=['GET'])
+def gaze_dwell():
+    """
+    Return the gaze dwell index of the authenticated user's incremental analysis session (frames sent to /ingest).
+    With ?object=<name> only that object's entry is returned. First and last fixation times only include
+    fixations that later frames can no longer change, so they trail the newest frames by a few movements.
+    Without a session (nothing ingested yet) the index is empty.
+    """
+    if 'user_id' not in session:
+        return jsonify({'error': 'User not authenticated'}), 400
+
+    analysis_session = find_analysis_session(session['user_id'])
+    gazed_object = request.args.get('object')
+    if analysis_session is None:
+        if gazed_object is None:
+            return jsonify({}), 200
+        return jsonify({'error': f'Object {gazed_object} has not been looked at'}), 404
+    with analysis_session.lock:
+        if gazed_object is None:
+            return jsonify(analysis_session.gaze_dwell.to_dict()), 200
+        entry = analysis_session.gaze_dwell.get(gazed_object)
+    if entry is None:
+        return jsonify({'error': f'Object {gazed_object} has not been looked at'}), 404
+    return jsonify(entry), 200
+
+@app.route('/session_quantiles', methods=['GET'])
+def session_quantiles():
+    """
+    Return p50/p90/p99 of fixation duration, saccade duration, saccade peak velocity and pupil diameter of the
+    authenticated user's incremental analysis session (frames sent to /ingest), estimated by quantile sketches.
+    """
+    if 'user_id' not in session:
+        return jsonify({'error': 'User not authenticated'}), 400
+
+    analysis_session = find_analysis_session(session['user_id'])
+    if analysis_session is None:
+        # No frames ingested since the server started, report the saved sketches if there are any
+        sketches = load_session_sketches(session['user_id']) or MetricSketches()
+        return jsonify(sketches.summary()), 200
+    with analysis_session.lock:
+        return jsonify(analysis_session.sketch_summary()), 200
+
+@app.route('/cohort_quantiles', methods=['GET'])
+def cohort_quantiles():
+    """
+    Return the /session_quantiles metrics over every session, in memory or saved, from the merged sketches.
+    With ?sketches=1 the merged sketches are included, to be merged further.
+    """
+    sketches, session_count = cohort_sketches()
+    response = {'sessions': session_count, 'quantiles': sketches.summary()}
+    if request.args.get('sketches', type=int):
+        response['sketches'] = sketches.to_dict()
+    return jsonify(response), 200
+
+@app.route('/timeline_analysis', methods=['GET'])
+def timeline_analysis():
+    """
+    Analyze the authenticated user's gaze timeline, every frame received since /start_session stored once.
+    Optional ?t0=&t1= (TimeStamp milliseconds) restrict the analysis to that time range.
+    Returns the /upload results plus the number of frames analyzed.
+
+    The frames are analyzed in the analysis worker pool like /upload windows, in a scheduler slot of their
+    own so only requests for the same range coalesce. The request waits only for the user's own frames
+    still queued for the timeline.
+    """
+    if 'user_id' not in session:
+        return jsonify({'error': 'User not authenticated'}), 400
+    if not app.config['TIMELINE_STORE']:
+        return jsonify({'error': 'The timeline store is disabled'}), 400
+
+    try:
+        t0 = request.args.get('t0', type=float)
+        t1 = request.args.get('t1', type=float)
+        user_id = session['user_id']
+        # Frames of earlier uploads may still be queued for the timeline
+        if not upload_archiver.wait_for_timeline(user_id, app.config['ANALYSIS_TIMEOUT']):
+            return jsonify({'error': 'The timeline is still being stored, try again later'}), 503
+        timeline = get_gaze_timeline(user_id)
+        with timeline.lock:
+            df = timeline.range(t0, t1)
+        if df.empty:
+            return jsonify({'error': 'Not enough frames in the timeline'}), 400
+        results_dict, _ = analysis_scheduler.run((user_id, 'timeline', t0, t1), encode_gaze_frames(df),
+                                                 f"timeline of {user_id}", binary=True)
+        if results_dict is None:
+            return jsonify({'error': 'Not enough frames in the timeline'}), 400
+        # The timeline is the whole session already, it needs no anchoring to it
+        results_dict = {name: value for name, value in results_dict.items() if name != 'Session_Inputs'}
+        return jsonify({**results_dict, 'Frames': len(df)}), 200
+
+    except Exception as e:
+        logger.error("Error analyzing timeline: %s", e)
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Return the server metrics (stage timings, request latencies, throughput, peak memory) in the Prometheus text format."""
+    server_peak = peak_memory_bytes()
+    if server_peak is not None:
+        metrics.set('gaze_peak_memory_bytes', server_peak, process='server')
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    endpoint = request.endpoint or 'unknown'
+    if 'request_start' in g and endpoint != 'metrics_endpoint':
+        metrics.observe('gaze_request_seconds', time.perf_counter() - g.request_start, endpoint=endpoint)
+        metrics.inc('gaze_requests_total', endpoint=endpoint, status=response.status_code)
+    return response
+
 @app.route('/logout', methods=['POST'])
 def logout():
     """Log out the user and clear session."""
-    session.pop('user_id', None)
+    user_id = session.pop('user_id', None)
+    with analysis_sessions_lock:
+        analysis_sessions.pop(user_id, None)
+    with upload_pupil_sessions_lock:
+        upload_pupil_sessions.pop(user_id, None)
     return jsonify({'message': 'User logged out'}), 200
 
 
@@ -1680,29 +3539,116 @@ def read_csv_file(file_path):
     saccade_ratio = len(saccades) / (len(fixations) + len(saccades) + 1e-6)
     return fixations, saccades, fixation_ratio, saccade_ratio"""
 
+def _true_runs(mask):
+    """Returns the first and last positions of every run of True values in a boolean array."""
+    edges = np.diff(mask.astype(np.int8), prepend=0, append=0)
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1) - 1
+
+
+class DistractionTracker:
+    """
+    Finds distraction intervals, runs of frames whose GazedObject is not the current Task lasting longer
+    than `threshold` seconds, across consecutive batches of frames. An off-task run that reaches the end of
+    a batch stays open and continues into the next one, so intervals spanning two uploads are found.
+
+    Each interval is a dict with 'start' and 'end' (timestamps of its first and last off-task frame),
+    'duration' and 'object', the object looked at in most of its frames.
+    """
+
+    def __init__(self, threshold=DISTRACTION_TIME_TRESHOLD):
+        self.threshold = threshold
+        self.intervals = []  # Completed distraction intervals
+        self.open_start = None
+        self.open_end = None
+        self.open_objects = Counter()
+
+    def update(self, df):
+        """
+        Adds a batch of frames.
+
+        Parameters:
+        - df (DataFrame): Frames with TimeStamp (seconds), GazedObject and Task.
+
+        Returns:
+        - list: The distraction intervals completed in this batch, followed by the open run if it already
+          lasts longer than `threshold` (a snapshot, it is reported again once it completes).
+        """
+        if df.empty:
+            return []
+        timestamps = df['TimeStamp'].to_numpy(dtype=float)
+        gazed_objects = df['GazedObject'].astype(object).to_numpy()
+        off_task = gazed_objects != df['Task'].astype(object).to_numpy()
+        starts, ends = _true_runs(off_task)
+        start_times, end_times = timestamps[starts], timestamps[ends]
+
+        completed = len(self.intervals)
+        carried = Counter()
+        if self.open_start is not None:
+            if len(starts) and starts[0] == 0:
+                start_times[0] = self.open_start  # The open run continues
+                carried = self.open_objects
+            else:
+                self._add_interval(self.open_start, self.open_end, self.open_objects)
+            self.open_start, self.open_end, self.open_objects = None, None, Counter()
+
+        still_open = bool(len(ends)) and ends[-1] == len(df) - 1
+        closed = len(starts) - still_open
+        durations = end_times - start_times
+        for i in np.flatnonzero(durations[:closed] > self.threshold):
+            objects = Counter(gazed_objects[starts[i]:ends[i] + 1])
+            self._add_interval(start_times[i], end_times[i], objects + carried if i == 0 else objects)
+        if still_open:
+            objects = Counter(gazed_objects[starts[-1]:])
+            self.open_start, self.open_end = start_times[-1], end_times[-1]
+            self.open_objects = objects + carried if closed == 0 else objects
+
+        detected = self.intervals[completed:]
+        open_interval = self.open_interval()
+        return detected + [open_interval] if open_interval else detected
+
+    def open_interval(self):
+        """Returns the open off-task run as an interval if it already lasts longer than `threshold`, else None."""
+        if self.open_start is None or self.open_end - self.open_start <= self.threshold:
+            return None
+        return self._interval(self.open_start, self.open_end, self.open_objects)
+
+    def finish(self):
+        """Completes the open run, e.g. at the end of a log. Returns all distraction intervals."""
+        if self.open_start is not None:
+            self._add_interval(self.open_start, self.open_end, self.open_objects)
+            self.open_start, self.open_end, self.open_objects = None, None, Counter()
+        return self.intervals
+
+    def _add_interval(self, start, end, objects):
+        if end - start > self.threshold:
+            self.intervals.append(self._interval(start, end, objects))
+
+    @staticmethod
+    def _interval(start, end, objects):
+        gazed_object = objects.most_common(1)[0][0] if objects else None
+        if isinstance(gazed_object, float) and np.isnan(gazed_object):
+            gazed_object = None
+        return {'start': float(start), 'end': float(end), 'duration': float(end - start), 'object': gazed_object}
+
+
+def find_distraction_intervals(df, threshold=DISTRACTION_TIME_TRESHOLD):
+    """Returns every distraction interval in a complete log, see DistractionTracker."""
+    tracker = DistractionTracker(threshold)
+    tracker.update(df)
+    return tracker.finish()
+
+
 def detect_distraction(df):
-    distraction_events = []  # Store distraction events
-    distraction_start = None
+    """Returns True if the gaze stays off the task for longer than DISTRACTION_TIME_TRESHOLD anywhere in `df`."""
+    return len(find_distraction_intervals(df)) > 0
 
-    for index, row in df.iterrows():
-        if row['GazedObject'] != row['Task']:  # Gaze is not on the task
-            if distraction_start is None:
-                distraction_start = row['TimeStamp']  # Start distraction timer
-            elif row['TimeStamp'] - distraction_start > DISTRACTION_TIME_TRESHOLD:
-                distraction_events.append((distraction_start, row['TimeStamp']))  # Store distraction period
-                distraction_start = None  # Reset after recording event
-                return True
-        else:
-            distraction_start = None  # Reset if attention returns
-    print(distraction_events)
-    if(len(distraction_events) != 0):
-        return True
-    return False  # Return all detected distraction events
 def cognitive_overload_detection(results_dict):
-    fixation_mean = results_dict['eye_movement_statistics']["fixation"]["mean"]
-    saccade_mean = results_dict['eye_movement_statistics']["saccade"]["mean"]
-    pupil_diameter_mean = results_dict['pupil_data']['normalized_statistics']["mean_pupil_diameter"]
+    return is_cognitive_overload(results_dict['eye_movement_statistics']["fixation"]["mean"],
+                                 results_dict['eye_movement_statistics']["saccade"]["mean"],
+                                 results_dict['pupil_data']['normalized_statistics']["mean_pupil_diameter"])
 
+def is_cognitive_overload(fixation_mean, saccade_mean, pupil_diameter_mean):
+    """Returns whether mean fixation and saccade durations and the min-max normalized mean pupil diameter indicate overload."""
     if pd.isna(fixation_mean) or pd.isna(saccade_mean) or pd.isna(pupil_diameter_mean):
         return False
     cognitive_overload = (
@@ -1714,24 +3660,23 @@ def cognitive_overload_detection(results_dict):
 
 def calculate_gaze_distribution(df):
     """Calculate the percentage of time spent gazing at each object during fixations."""
-    # Flatten the list of fixations (if each fixation is a list of rows)
+    gaze_dwell = GazeDwellIndex()
+    gaze_dwell.update(df)
+
     result_dict = {}
     result_dict['gazed_object_column'] = df['GazedObject'].tolist()
     result_dict['unique_gazed_objects'] = df['GazedObject'].unique().tolist()
 
     # Store counts with object names
-    gazed_object_counts = df['GazedObject'].value_counts()
-    result_dict['gazed_object_counts'] = gazed_object_counts.to_dict()
-
-    # Compute total count
-    total_count = gazed_object_counts.sum()
+    ratios = gaze_dwell.frame_ratios()
+    result_dict['gazed_object_counts'] = {gazed_object: gaze_dwell.get(gazed_object)['frame_count'] for gazed_object in ratios}
 
     # Store gaze ratios
-    result_dict['gazed_object_ratios'] = (gazed_object_counts / total_count).to_dict()
+    result_dict['gazed_object_ratios'] = ratios
 
     # Store durations per object
-    gazed_object_duration = df.groupby('GazedObject')['FrameDuration'].sum().to_dict()
-    result_dict['gazed_object_durations'] = gazed_object_duration
+    result_dict['gazed_object_durations'] = gaze_dwell.dwell_durations()
+    result_dict['gaze_dwell'] = gaze_dwell.to_dict()
 
     #result_dict['normalized_gazed_object_durations'] = normalized_durations.to_dict()
     return result_dict
@@ -1749,19 +3694,40 @@ def calculate_fixation_saccade_ratio(results_dict):
 def process_eye_tracking_data(file_path):
     """Main function to process eye-tracking data."""
     #df = load_eye_tracking_data(file_path)
-    result_dict,df = process_log_file(file_path)
+    return process_eye_tracking_frames(load_gaze_frames(file_path, columns='analysis'), file_path)
+
+def process_eye_tracking_frames(df, source='<memory>', mode='summary', session_inputs=False):
+    """
+    Computes the /upload results for frames that are already loaded, see process_log_dataframe for `mode`.
+    With `session_inputs` the results also hold 'Session_Inputs', what anchor_to_upload_session needs to
+    decide Cognitive_Overload on the user's session: the fixation and saccade mean durations and the
+    smoothed pupil diameters with their TimeStamp (seconds), as JSON-ready lists.
+    """
+    processed = process_log_dataframe(df, source, mode)
+    if processed is None:
+        return None
+    result_dict,df = processed
     fixation_ratio, saccade_ratio = calculate_fixation_saccade_ratio(result_dict)
     distraction_detected = detect_distraction(df)
     overload_detected = cognitive_overload_detection(result_dict)
-    gaze_dict = calculate_gaze_distribution(df)
     gaze_durations_dict = result_dict['gazed_object_durations']
-    return {
+    results = {
         'Fixation_Ratio': fixation_ratio,
         'Saccade_Ratio': saccade_ratio,
         'Distraction_Detected': bool(distraction_detected),
         'Cognitive_Overload': bool(overload_detected),
         'Gaze_Object_Percentages': gaze_durations_dict
     }
+    if session_inputs:
+        stats = result_dict['eye_movement_statistics']
+        pupil_df = get_pupil_diameter_data(df)
+        results['Session_Inputs'] = {
+            'Fixation_Mean': None if pd.isna(stats['fixation']['mean']) else float(stats['fixation']['mean']),
+            'Saccade_Mean': None if pd.isna(stats['saccade']['mean']) else float(stats['saccade']['mean']),
+            'TimeStamp': pupil_df['TimeStamp'].tolist(),
+            'SmoothedPupilDiameter': smooth_pupil_diameter(pupil_df['AvgPupilDiameter']).tolist()
+        }
+    return results
     """df = read_csv_file(file_path)
     fixations, saccades, fixation_ratio, saccade_ratio = detect_fixations_and_saccades(df)
     distraction_detected = detect_distraction(df)
@@ -1776,6 +3742,882 @@ def process_eye_tracking_data(file_path):
         'Gaze_Object_Percentages': gaze_dict
     }"""
 
+def _promote_candidate(candidate_type, duration):
+    """Returns the label of a run of `candidate_type`, promoting candidates with a valid duration."""
+    if candidate_type == FIXATION_CANDIDATE and MIN_FIXATION_DURATION <= duration <= MAX_FIXATION_DURATION:
+        return 'fixation'
+    if candidate_type == SACCADE_CANDIDATE and MIN_SACCADE_DURATION <= duration <= MAX_SACCADE_DURATION:
+        return 'saccade'
+    return MOVEMENT_TYPES[candidate_type]
+
+
+def _collapse_runs(run_lengths, run_ids, run_types):
+    """
+    Joins consecutive runs that share a movement ID.
+
+    Returns:
+        tuple: Lengths, IDs, types and the index of the last input run of every joined run.
+    """
+    lengths, ids, types, last_runs = [], [], [], []
+    for run, movement_id in enumerate(run_ids):
+        if ids and ids[-1] == movement_id:
+            lengths[-1] += run_lengths[run]
+            last_runs[-1] = run
+        else:
+            lengths.append(run_lengths[run])
+            ids.append(movement_id)
+            types.append(run_types[run])
+            last_runs.append(run)
+    return lengths, ids, types, last_runs
+
+
+def _movement_statistics_from_totals(totals, outlier_points, total_points, total_time):
+    """
+    Builds the get_movement_statistics dictionary from per-type count/time/min/max totals. A 'mean' in the
+    totals is used as it is, otherwise the mean is time / count.
+    """
+    total_duration = sum(type_totals['time'] for type_totals in totals.values())
+
+    stats = {}
+    for movement_type, type_totals in totals.items():
+        count, time = type_totals['count'], type_totals['time']
+        stats[movement_type] = {
+            'min': type_totals['min'],
+            'max': type_totals['max'],
+            'mean': type_totals.get('mean', time / count) if count else None,
+            'count': count,
+            'percentage': (time / total_duration) * 100 if count and total_duration > 0 else 0.0,
+            'time': time,
+            'time_percentage': (time / total_time) * 100 if count and total_time > 0 else 0.0
+        }
+
+    stats['outlier'] = {'count': outlier_points, 'percentage': 0.0, 'time': 0.0}
+    if total_points > 0:
+        stats['outlier']['percentage'] = (outlier_points / total_points) * 100
+        stats['outlier']['time'] = total_time - total_duration
+        stats['outlier']['time_percentage'] = (stats['outlier']['time'] / total_time) * 100 if total_time > 0 else 0
+    return stats
+
+
+class IncrementalKinematics:
+    """
+    Turns batches of valid head/gaze samples into gaze and head angular velocities. The last sample of a
+    batch is carried over, so consecutive batches give the same velocities as one long recording.
+
+    Gaze velocities above `threshold` are interpolated linearly between the surrounding good samples, like
+    interpolate_high_angular_velocities does. Samples after the last good velocity are held back until a
+    later batch brings their right-hand neighbour; pending_samples returns them as the recording would end
+    now. Samples after a gap (see find_gap_breaks) keep NaN velocities, no velocity is computed across the gap.
+    """
+
+    def __init__(self, threshold=500):
+        self.threshold = threshold
+        self.previous_sample = None  # KINEMATICS_COLUMNS values of the last sample
+        self.previous_time = None
+        self.last_good_velocity = None
+        # Held back gaze velocity, head velocity, timestamp and gap break
+        self.pending = (np.empty(0), np.empty(0), np.empty(0), np.empty(0, dtype=bool))
+
+    def update(self, valid_df, breaks=None):
+        """
+        Adds a batch of valid samples.
+
+        Parameters:
+        - valid_df (DataFrame): New valid samples.
+        - breaks (array-like or None): Boolean per sample, True where a gap precedes it (see find_gap_breaks).
+
+        Returns:
+            tuple: (gaze_velocity, head_velocity, timestamps, breaks) arrays of the samples that are ready to classify.
+        """
+        if valid_df.empty:
+            return np.empty(0), np.empty(0), np.empty(0), np.empty(0, dtype=bool)
+
+        timestamps = valid_df['TimeStamp'].to_numpy(dtype=float)
+        samples = valid_df[KINEMATICS_COLUMNS].to_numpy(dtype=float)
+        breaks = np.zeros(len(timestamps), dtype=bool) if breaks is None else np.asarray(breaks, dtype=bool)
+        previous = None if self.previous_sample is None else (self.previous_sample, self.previous_time)
+        gaze_velocity, head_velocity, _ = angular_velocity_kernel(samples, timestamps, threshold=None,
+                                                                  previous=previous, breaks=breaks)
+        self.previous_sample, self.previous_time = samples[-1], timestamps[-1]
+
+        pending_gaze, pending_head, pending_times, pending_breaks = self.pending
+        gaze_velocity = np.concatenate((pending_gaze, gaze_velocity))
+        head_velocity = np.concatenate((pending_head, head_velocity))
+        timestamps = np.concatenate((pending_times, timestamps))
+        breaks = np.concatenate((pending_breaks, breaks))
+
+        good_positions = np.flatnonzero(gaze_velocity <= self.threshold)
+        if self.last_good_velocity is None and not len(good_positions):
+            # Nothing to interpolate from yet, leading spikes stay NaN. A run opened by a gap takes the type
+            # of its first usable sample, so the samples from the first gap on wait for one.
+            ready = int(np.argmax(breaks)) if breaks.any() else len(breaks)
+            self.pending = (gaze_velocity[ready:], head_velocity[ready:], timestamps[ready:], breaks[ready:])
+            return np.full(ready, np.nan), head_velocity[:ready], timestamps[:ready], breaks[:ready]
+
+        # Everything up to the last good velocity can be repaired now
+        ready = good_positions[-1] + 1 if len(good_positions) else 0
+        self.pending = (gaze_velocity[ready:], head_velocity[ready:], timestamps[ready:], breaks[ready:])
+        gaze_velocity, head_velocity, timestamps = gaze_velocity[:ready], head_velocity[:ready], timestamps[:ready]
+        breaks = breaks[:ready]
+
+        anchor_positions, anchor_values = good_positions, gaze_velocity[good_positions]
+        if self.last_good_velocity is not None:
+            anchor_positions = np.concatenate(([-1], anchor_positions))
+            anchor_values = np.concatenate(([self.last_good_velocity], anchor_values))
+        if ready:
+            self.last_good_velocity = gaze_velocity[-1]
+
+        # Samples after a gap keep their NaN velocity
+        bad_positions = np.flatnonzero(~(gaze_velocity <= self.threshold) & ~breaks)
+        repaired = gaze_velocity.copy()
+        repaired[bad_positions] = np.interp(bad_positions, anchor_positions, anchor_values)
+        repaired[bad_positions[bad_positions < anchor_positions[0]]] = np.nan
+        return repaired, head_velocity, timestamps, breaks
+
+    def pending_samples(self):
+        """
+        Returns the held back samples repaired as if the recording ended after them, as angular_velocity_kernel
+        does at the end of a recording: spikes after the last good velocity take its value, all are NaN if no
+        good velocity came in yet. The samples stay held back, a later batch still repairs them.
+
+        Returns:
+            tuple: (gaze_velocity, head_velocity, timestamps, breaks) arrays, see update.
+        """
+        gaze_velocity, head_velocity, timestamps, breaks = self.pending
+        gaze_velocity = gaze_velocity.copy()
+        bad = ~(gaze_velocity <= self.threshold) & ~breaks
+        gaze_velocity[bad] = np.nan if self.last_good_velocity is None else self.last_good_velocity
+        return gaze_velocity, head_velocity, timestamps, breaks
+
+
+class IncrementalMovementClassifier:
+    """
+    Classifies fixations and saccades sample by sample, with the same rules as detect_fixations_and_saccades
+    (classify_points, process_outliers_fixation, process_outliers_saccade and get_movement_statistics).
+    The isolated velocity outlier filter (ISOLATED_OUTLIER_WINDOW) is not applied, its centered windows
+    need samples that have not arrived yet.
+
+    Runs are labelled with find_movement_runs as samples arrive. Only a short tail of closed runs is kept for
+    the outlier merges; once later runs can no longer change a movement, it is added to the per-type totals
+    and dropped. Memory and cost per batch therefore depend on the batch, not on the session length.
+    """
+
+    STATISTIC_TYPES = ('fixation', 'saccade', 'saccade_candidate', 'other_saccades')
+
+    def __init__(self, sketches=None):
+        self.open_type = None  # Candidate type of the run that is still open
+        self.open_start_time = None
+        self.open_length = 0
+        self.open_velocity_sum = 0.0
+        self.open_velocity_count = 0
+        self.open_velocity_peak = np.nan
+
+        # Closed runs that may still be merged
+        self.tail_lengths, self.tail_ids, self.tail_types, self.tail_peaks = [], [], [], []
+        self.tail_durations, self.tail_amplitudes = {}, {}
+        self.next_id = 1
+
+        self.totals = {movement_type: {'count': 0, 'time': 0.0, 'min': None, 'max': None}
+                       for movement_type in self.STATISTIC_TYPES}
+        self.outlier_points = 0
+        self.total_points = 0
+        self.first_time = None
+        self.last_time = None
+        # Quantile sketches of the finalized movements, None keeps none
+        self.sketches = sketches
+
+    def add_samples(self, gaze_velocity, head_velocity, timestamps, breaks=None):
+        """
+        Adds a batch of velocity samples and finalizes every movement that can no longer change. `breaks`
+        marks the samples after a gap (see find_gap_breaks), the open run ends before the gap.
+
+        Returns:
+            list: (MOVEMENT_TYPES label, sample count) of every movement finalized, in sample order. They
+            cover the samples added so far from the first one not covered before.
+        """
+        if not len(timestamps):
+            return []
+
+        if self.open_type is None:
+            self.first_time = timestamps[0]
+            starts, ends, types, durations, _ = find_movement_runs(gaze_velocity, head_velocity, timestamps,
+                                                                   breaks=breaks)
+            carried_length, carried_sum, carried_count, carried_peak = 0, 0.0, 0, np.nan
+        else:
+            # A leading placeholder sample continues the open run from its start time. If the batch starts
+            # after a gap, a second one at the open run's last sample ends the run there.
+            placeholder_times = [self.open_start_time]
+            if breaks is not None and breaks[0]:
+                placeholder_times.append(self.last_time)
+            placeholders = len(placeholder_times)
+            gaze_velocity = np.concatenate((np.full(placeholders, np.nan), gaze_velocity))
+            head_velocity = np.concatenate((np.full(placeholders, np.nan), head_velocity))
+            timestamps = np.concatenate((placeholder_times, timestamps))
+            if breaks is not None:
+                breaks = np.concatenate((np.zeros(placeholders, dtype=bool), breaks))
+            starts, ends, types, durations, _ = find_movement_runs(
+                gaze_velocity, head_velocity, timestamps, initial_type=self.open_type, breaks=breaks)
+            carried_length = self.open_length - placeholders
+            carried_sum, carried_count = self.open_velocity_sum, self.open_velocity_count
+            carried_peak = self.open_velocity_peak
+        self.last_time = timestamps[-1]
+
+        finite = ~np.isnan(gaze_velocity)
+        velocity_sums = np.add.reduceat(np.where(finite, gaze_velocity, 0.0), starts)
+        velocity_counts = np.add.reduceat(finite.astype(np.int64), starts)
+        velocity_peaks = np.fmax.reduceat(gaze_velocity, starts)
+        velocity_sums[0] += carried_sum
+        velocity_counts[0] += carried_count
+        velocity_peaks[0] = np.fmax(velocity_peaks[0], carried_peak)
+        lengths = ends - starts
+        lengths[0] += carried_length
+
+        for run in range(len(starts) - 1):
+            run_id = self.next_id
+            self.next_id += 1
+            self.tail_lengths.append(int(lengths[run]))
+            self.tail_ids.append(run_id)
+            self.tail_types.append(MOVEMENT_TYPES[types[run]])
+            self.tail_peaks.append(velocity_peaks[run])
+            self.tail_durations[run_id] = durations[run]
+            self.tail_amplitudes[run_id] = velocity_sums[run] / velocity_counts[run] if velocity_counts[run] else np.nan
+
+        # The last run stays open, keep its candidate type
+        last_type = int(types[-1])
+        self.open_type = last_type - 2 if last_type in (FIXATION, SACCADE) else last_type
+        self.open_start_time = timestamps[starts[-1]]
+        self.open_length = int(lengths[-1])
+        self.open_velocity_sum = velocity_sums[-1]
+        self.open_velocity_count = int(velocity_counts[-1])
+        self.open_velocity_peak = velocity_peaks[-1]
+
+        return self._finalize_movements()
+
+    def _classify_tail(self):
+        """
+        Runs the outlier merges over the tail, treating the open run as if the recording ended now.
+
+        Returns:
+            tuple: Movements as (type, duration, length, last tail run, last fixation-pass run, peak velocity)
+            tuples, and the last tail run of every run after the fixation pass.
+        """
+        lengths, ids, types = list(self.tail_lengths), list(self.tail_ids), list(self.tail_types)
+        durations, amplitudes = dict(self.tail_durations), dict(self.tail_amplitudes)
+        peaks = list(self.tail_peaks)
+        if self.open_length:
+            open_duration = self.last_time - self.open_start_time
+            peaks.append(self.open_velocity_peak)
+            lengths.append(self.open_length)
+            ids.append(self.next_id)
+            types.append(_promote_candidate(self.open_type, open_duration))
+            durations[self.next_id] = open_duration
+            amplitudes[self.next_id] = self.open_velocity_sum / self.open_velocity_count if self.open_velocity_count else np.nan
+        if not ids:
+            return [], []
+
+        ids, types, durations, amplitudes, _ = merge_outlier_runs(
+            lengths, ids, types, durations, amplitudes, {}, 'fixation', MAX_FIXATION_DURATION)
+        fixation_lengths, fixation_ids, fixation_types, fixation_last_runs = _collapse_runs(lengths, ids, types)
+
+        ids, types, durations, _, _ = merge_outlier_runs(
+            fixation_lengths, fixation_ids, fixation_types, durations, amplitudes, {}, 'saccade', MAX_SACCADE_DURATION)
+        mark_invalid_movements(ids, types, durations)
+        movement_lengths, movement_ids, movement_types, movement_last_runs = _collapse_runs(fixation_lengths, ids, types)
+
+        # Every movement covers the tail runs after the previous movement's last one
+        last_tail_runs = [fixation_last_runs[last_run] for last_run in movement_last_runs]
+        movement_peaks = np.fmax.reduceat(np.asarray(peaks, dtype=np.float64), [0] + [run + 1 for run in last_tail_runs[:-1]])
+        movements = [
+            (movement_type, durations.get(movement_id, 0.0), length, last_tail_run, last_run, peak)
+            for movement_type, movement_id, length, last_tail_run, last_run, peak
+            in zip(movement_types, movement_ids, movement_lengths, last_tail_runs, movement_last_runs, movement_peaks)
+        ]
+        return movements, fixation_last_runs
+
+    def _finalize_movements(self):
+        """
+        Adds the movements that later runs can no longer change to the totals and drops their runs.
+        Returns their (type, sample count), see add_samples.
+        """
+        movements, fixation_last_runs = self._classify_tail()
+        run_count = len(self.tail_ids) + 1  # Including the open run
+
+        # A merge decision needs the two following runs to be closed
+        fixation_final = [last_run <= run_count - 4 for last_run in fixation_last_runs]
+        finalized, finalized_runs = [], 0
+        for movement in movements:
+            next_fixation_run = movement[4] + 2
+            if next_fixation_run >= len(fixation_final) or not fixation_final[next_fixation_run]:
+                break
+            finalized.append(movement)
+            finalized_runs = movement[3] + 1
+
+        self._add_to_totals(self.totals, finalized)
+        if self.sketches is not None:
+            self._add_to_sketches(self.sketches, finalized)
+        self.outlier_points += sum(movement[2] for movement in finalized if movement[0] == 'outlier')
+        self.total_points += sum(movement[2] for movement in finalized)
+
+        for run_id in self.tail_ids[:finalized_runs]:
+            del self.tail_durations[run_id]
+            del self.tail_amplitudes[run_id]
+        del self.tail_lengths[:finalized_runs], self.tail_ids[:finalized_runs], self.tail_types[:finalized_runs]
+        del self.tail_peaks[:finalized_runs]
+        return [(movement[0], movement[2]) for movement in finalized]
+
+    @staticmethod
+    def _add_to_sketches(sketches, movements):
+        if movements:
+            movement_types, durations, _, _, _, peaks = zip(*movements)
+            sketches.add_movements([MOVEMENT_TYPE_CODES[movement_type] for movement_type in movement_types],
+                                   durations, peaks)
+
+    @staticmethod
+    def _add_to_totals(totals, movements):
+        for movement_type, duration, *_ in movements:
+            if movement_type in totals:
+                type_totals = totals[movement_type]
+                type_totals['count'] += 1
+                type_totals['time'] += duration
+                type_totals['min'] = duration if type_totals['min'] is None else min(type_totals['min'], duration)
+                type_totals['max'] = duration if type_totals['max'] is None else max(type_totals['max'], duration)
+
+    def _with_samples(self, samples, sketches=None):
+        """Returns a copy of the classifier with `samples` (add_samples arguments) added, leaving this one unchanged."""
+        preview = copy.copy(self)
+        preview.tail_lengths, preview.tail_ids = list(self.tail_lengths), list(self.tail_ids)
+        preview.tail_types, preview.tail_peaks = list(self.tail_types), list(self.tail_peaks)
+        preview.tail_durations, preview.tail_amplitudes = dict(self.tail_durations), dict(self.tail_amplitudes)
+        preview.totals = {movement_type: dict(type_totals) for movement_type, type_totals in self.totals.items()}
+        preview.sketches = sketches
+        preview.add_samples(*samples)
+        return preview
+
+    def statistics(self, pending=None):
+        """
+        Returns get_movement_statistics-style statistics of the whole session so far. `pending` are samples
+        not added yet (add_samples arguments, e.g. IncrementalKinematics.pending_samples), counted as if the
+        recording ended after them.
+        """
+        if pending is not None and len(pending[2]):
+            return self._with_samples(pending).statistics()
+        movements, _ = self._classify_tail()
+        totals = {movement_type: dict(type_totals) for movement_type, type_totals in self.totals.items()}
+        self._add_to_totals(totals, movements)
+        outlier_points = self.outlier_points + sum(movement[2] for movement in movements if movement[0] == 'outlier')
+        total_points = self.total_points + sum(movement[2] for movement in movements)
+        total_time = self.last_time - self.first_time if self.first_time is not None else 0.0
+        return _movement_statistics_from_totals(totals, outlier_points, total_points, total_time)
+
+    def sketch_summary(self, percentiles=SKETCH_PERCENTILES, pending=None):
+        """
+        Returns MetricSketches.summary of the sketches including the movements that are not final yet and
+        the `pending` samples, see statistics.
+        """
+        if pending is not None and len(pending[2]):
+            return self._with_samples(pending, self.sketches.copy()).sketch_summary(percentiles)
+        sketches = self.sketches.copy()
+        movements, _ = self._classify_tail()
+        self._add_to_sketches(sketches, movements)
+        return sketches.summary(percentiles)
+
+
+class GazeDwellIndex:
+    """
+    Per-object gaze dwell statistics that are updated with every batch of frames.
+
+    For every GazedObject it keeps the total dwell time, the number of visits (runs of consecutive frames
+    on the object), the number of frames, the first and last time the object was looked at, the first and
+    last time it was fixated, and the longest continuous visit. Like gazed_object_durations, each frame
+    contributes the time since the previous frame to the object it shows. A visit still running at the end
+    of a batch continues into the next batch.
+
+    Fixations are only known once the frames are classified, so they are added separately with add_fixations.
+    """
+
+    FIELDS = ('total_dwell', 'visit_count', 'frame_count', 'first_seen', 'last_seen', 'first_fixation',
+              'last_fixation', 'longest_dwell')
+
+    def __init__(self):
+        self.objects = []  # Object names by index
+        self.object_index = {}
+        self.total_dwell = np.zeros(0)
+        self.visit_count = np.zeros(0, dtype=np.int64)
+        self.frame_count = np.zeros(0, dtype=np.int64)
+        self.first_seen = np.zeros(0)
+        self.last_seen = np.zeros(0)
+        self.first_fixation = np.zeros(0)
+        self.last_fixation = np.zeros(0)
+        self.longest_dwell = np.zeros(0)
+        self.last_frame_time = None
+        self.open_object = -1  # Object of the visit running at the end of the last batch
+        self.open_dwell = 0.0
+
+    def _object_ids(self, gazed_objects):
+        """Maps the categories of `gazed_objects` to object indices, adding objects seen for the first time."""
+        codes = gazed_objects.cat.codes.to_numpy()
+        categories = gazed_objects.cat.categories
+        observed = np.bincount(codes[codes >= 0], minlength=len(categories)) > 0
+        for gazed_object in categories[observed]:
+            if gazed_object not in self.object_index:
+                self.object_index[gazed_object] = len(self.objects)
+                self.objects.append(gazed_object)
+        missing = len(self.objects) - len(self.total_dwell)
+        if missing:
+            self.total_dwell = np.concatenate([self.total_dwell, np.zeros(missing)])
+            self.visit_count = np.concatenate([self.visit_count, np.zeros(missing, dtype=np.int64)])
+            self.frame_count = np.concatenate([self.frame_count, np.zeros(missing, dtype=np.int64)])
+            self.first_seen = np.concatenate([self.first_seen, np.full(missing, np.inf)])
+            self.last_seen = np.concatenate([self.last_seen, np.full(missing, -np.inf)])
+            self.first_fixation = np.concatenate([self.first_fixation, np.full(missing, np.inf)])
+            self.last_fixation = np.concatenate([self.last_fixation, np.full(missing, -np.inf)])
+            self.longest_dwell = np.concatenate([self.longest_dwell, np.zeros(missing)])
+        category_ids = np.array([self.object_index.get(gazed_object, -1) for gazed_object in categories] + [-1], dtype=np.int64)
+        return category_ids[codes]  # Missing objects (code -1) map to -1
+
+    def update(self, df):
+        """
+        Adds a batch of frames.
+
+        Parameters:
+        - df (DataFrame): Frames with TimeStamp (seconds) and GazedObject.
+
+        Returns:
+        - ndarray: Object index of every frame, -1 where no object is looked at, for add_fixations.
+        """
+        if df.empty:
+            return np.empty(0, dtype=np.int64)
+        object_ids = self._object_ids(df['GazedObject'].astype('category'))
+        timestamps = df['TimeStamp'].to_numpy(dtype=float)
+        previous_time = timestamps[0] if self.last_frame_time is None else self.last_frame_time
+        frame_durations = np.diff(timestamps, prepend=previous_time)
+        self.last_frame_time = timestamps[-1]
+
+        known = object_ids >= 0
+        size = len(self.objects)
+        self.total_dwell += np.bincount(object_ids[known], weights=frame_durations[known], minlength=size)
+        self.frame_count += np.bincount(object_ids[known], minlength=size)
+        np.minimum.at(self.first_seen, object_ids[known], timestamps[known])
+        np.maximum.at(self.last_seen, object_ids[known], timestamps[known])
+
+        run_starts = np.flatnonzero(np.diff(object_ids, prepend=object_ids[0] - 1))
+        run_ids = object_ids[run_starts]
+        run_dwell = np.add.reduceat(frame_durations, run_starts)
+        new_visit = np.ones(len(run_starts), dtype=bool)
+        if run_ids[0] == self.open_object:
+            run_dwell[0] += self.open_dwell  # The visit of the last batch continues
+            new_visit[0] = False
+        counted = run_ids >= 0
+        self.visit_count += np.bincount(run_ids[counted & new_visit], minlength=size)
+        np.maximum.at(self.longest_dwell, run_ids[counted], run_dwell[counted])
+        self.open_object, self.open_dwell = run_ids[-1], run_dwell[-1]
+        return object_ids
+
+    def add_fixations(self, timestamps, object_ids):
+        """
+        Adds frames classified as fixation samples to the first and last fixation times.
+
+        Parameters:
+        - timestamps (array-like): Frame times in seconds.
+        - object_ids (array-like): Object index of every frame as returned by update, -1 for none.
+        """
+        object_ids = np.asarray(object_ids, dtype=np.int64)
+        timestamps = np.asarray(timestamps, dtype=float)
+        known = object_ids >= 0
+        np.minimum.at(self.first_fixation, object_ids[known], timestamps[known])
+        np.maximum.at(self.last_fixation, object_ids[known], timestamps[known])
+
+    def _entry(self, i):
+        return {
+            'total_dwell': float(self.total_dwell[i]),
+            'visit_count': int(self.visit_count[i]),
+            'frame_count': int(self.frame_count[i]),
+            'first_seen': float(self.first_seen[i]),
+            'last_seen': float(self.last_seen[i]),
+            # None if the object was looked at but never fixated
+            'first_fixation': float(self.first_fixation[i]) if np.isfinite(self.first_fixation[i]) else None,
+            'last_fixation': float(self.last_fixation[i]) if np.isfinite(self.last_fixation[i]) else None,
+            'longest_dwell': float(self.longest_dwell[i])
+        }
+
+    def get(self, gazed_object):
+        """Returns the dwell statistics of one object, or None if it has not been looked at."""
+        i = self.object_index.get(gazed_object)
+        return None if i is None else self._entry(i)
+
+    def to_dict(self):
+        """Returns the dwell statistics of every object, sorted by object name."""
+        return {gazed_object: self._entry(self.object_index[gazed_object]) for gazed_object in sorted(self.objects)}
+
+    def dwell_durations(self):
+        """Returns object -> total dwell, sorted by object name like a groupby over GazedObject."""
+        return {gazed_object: float(self.total_dwell[self.object_index[gazed_object]]) for gazed_object in sorted(self.objects)}
+
+    def frame_ratios(self):
+        """Returns object -> share of frames, most looked at first like value_counts(normalize=True)."""
+        order = sorted(self.objects, key=lambda gazed_object: -self.frame_count[self.object_index[gazed_object]])
+        total = self.frame_count.sum()
+        return {gazed_object: float(self.frame_count[self.object_index[gazed_object]] / total) for gazed_object in order}
+
+
+class IncrementalAnalysisSession:
+    """
+    Analysis state of one user that is updated with every batch of new frames instead of reprocessing
+    whole windows: running kinematics, open movements, a session-wide pupil baseline, distraction
+    intervals, the gaze dwell index and the quantile sketches of the session's movements and pupil size.
+    """
+
+    def __init__(self, user_id, sketches=None):
+        self.user_id = user_id
+        self.lock = threading.Lock()
+        self.frame_count = 0
+        self.kinematics = IncrementalKinematics()
+        # Sketches restored from disk continue where the session was when the server stopped
+        self.sketches = sketches if sketches is not None else MetricSketches()
+        self.sketches_saved = time.monotonic()
+        self.movements = IncrementalMovementClassifier(self.sketches)
+
+        # Pupil diameter, the baseline is captured once over the first BASELINE_DURATION seconds of the session
+        self.pupil = IncrementalPupilProcessor()
+
+        self.gaze_dwell = GazeDwellIndex()
+        # Times and dwell index objects of the valid frames whose movements are not final yet
+        self.unclassified_times = np.empty(0)
+        self.unclassified_objects = np.empty(0, dtype=np.int64)
+        self.distraction = DistractionTracker()
+        self.distraction_detected = False
+        self.last_frame = None  # (gaze valid, timestamp) of the last frame, to find gaps across batches
+
+    def ingest(self, df):
+        """
+        Adds new frames to the session.
+
+        Parameters:
+        - df (DataFrame): New frames as returned by read_gaze_log, with TimeStamp in seconds.
+        """
+        gaze_valid = (df['GazeStatus'] == 'VALID').to_numpy()
+        valid_df = df[gaze_valid]
+        if len(df):
+            # The previous batch's last frame decides whether the first valid frame follows a gap
+            timestamps = df['TimeStamp'].to_numpy(dtype=float)
+            if self.last_frame is None:
+                breaks = find_gap_breaks(gaze_valid, timestamps)
+            else:
+                breaks = find_gap_breaks(np.concatenate(([self.last_frame[0]], gaze_valid)),
+                                         np.concatenate(([self.last_frame[1]], timestamps)))[int(self.last_frame[0]):]
+            self.last_frame = (bool(gaze_valid[-1]), timestamps[-1])
+            finalized = self.movements.add_samples(*self.kinematics.update(valid_df, breaks))
+        else:
+            timestamps, finalized = np.empty(0), []
+        process_pupil_diameter_data(valid_df, 'summary', self.sketches, self.pupil)
+        object_ids = self.gaze_dwell.update(df)
+        self._add_fixations(timestamps[gaze_valid], object_ids[gaze_valid], finalized)
+        # Distracted if an interval ended in these frames or is still running at their end
+        self.distraction_detected = len(self.distraction.update(df)) > 0
+        self.frame_count += len(df)
+
+    def _add_fixations(self, timestamps, object_ids, finalized):
+        """
+        Queues new valid frames and adds the frames of the finalized fixations to the gaze dwell index.
+        The classifier finalizes movements in sample order, so they cover the oldest queued frames.
+        """
+        self.unclassified_times = np.concatenate((self.unclassified_times, timestamps))
+        self.unclassified_objects = np.concatenate((self.unclassified_objects, object_ids))
+        if not finalized:
+            return
+        movement_types, lengths = zip(*finalized)
+        fixation = np.repeat(np.asarray(movement_types) == 'fixation', lengths)
+        self.gaze_dwell.add_fixations(self.unclassified_times[:len(fixation)][fixation],
+                                      self.unclassified_objects[:len(fixation)][fixation])
+        self.unclassified_times = self.unclassified_times[len(fixation):]
+        self.unclassified_objects = self.unclassified_objects[len(fixation):]
+
+    def pupil_statistics(self):
+        """Returns the pupil statistics of the session, see IncrementalPupilProcessor.statistics."""
+        return self.pupil.statistics()
+
+    def movement_statistics(self):
+        """Returns the movement statistics of the session, including the samples the kinematics hold back."""
+        return self.movements.statistics(self.kinematics.pending_samples())
+
+    def sketch_summary(self):
+        """Returns the quantile sketch summary of the session, see IncrementalMovementClassifier.sketch_summary."""
+        return self.movements.sketch_summary(pending=self.kinematics.pending_samples())
+
+    def results(self):
+        """Returns the /upload result fields for the whole session so far."""
+        stats = self.movement_statistics()
+        overload_detected = cognitive_overload_detection({
+            'eye_movement_statistics': stats,
+            'pupil_data': self.pupil_statistics()
+        })
+        return {
+            'Fixation_Ratio': stats['fixation']['percentage'],
+            'Saccade_Ratio': stats['saccade']['percentage'],
+            'Distraction_Detected': bool(self.distraction_detected),
+            'Cognitive_Overload': bool(overload_detected),
+            'Gaze_Object_Percentages': self.gaze_dwell.dwell_durations()
+        }
+
+
+def get_analysis_session(user_id):
+    """
+    Returns the incremental analysis session of `user_id`, creating it on first use. A new session
+    starts from the user's saved quantile sketches, if the server was restarted during their session.
+    """
+    with analysis_sessions_lock:
+        if user_id not in analysis_sessions:
+            analysis_sessions[user_id] = IncrementalAnalysisSession(user_id, load_session_sketches(user_id))
+        return analysis_sessions[user_id]
+
+
+def find_analysis_session(user_id):
+    """Returns the incremental analysis session of `user_id`, None if there is none. Unlike
+    get_analysis_session it never creates one, so read-only endpoints do not leave empty sessions behind."""
+    with analysis_sessions_lock:
+        return analysis_sessions.get(user_id)
+
+
+def load_session_sketches(user_id):
+    """Returns the saved quantile sketches of `user_id`, None if there are none or they cannot be read."""
+    file_path = sketch_path(user_id)
+    if not file_path or not os.path.isfile(file_path):
+        return None
+    try:
+        return MetricSketches.load(file_path)
+    except (OSError, ValueError, KeyError) as e:
+        logger.error("Error loading the quantile sketches of %s: %s", user_id, e)
+        return None
+
+
+def sketch_path(user_id):
+    """Returns the file of the saved quantile sketches of `user_id`, None if sketches are not saved."""
+    if not app.config['SKETCH_FOLDER']:
+        return None
+    return os.path.join(app.config['SKETCH_FOLDER'], (secure_filename(str(user_id)) or 'unknown') + '.json')
+
+
+def save_session_sketches(analysis_session, force=False):
+    """
+    Writes the quantile sketches of `analysis_session` at most every SKETCH_SAVE_INTERVAL seconds, or now
+    with `force`. Call with the session's lock held.
+    """
+    file_path = sketch_path(analysis_session.user_id)
+    now = time.monotonic()
+    if not file_path or (not force and now - analysis_session.sketches_saved < app.config['SKETCH_SAVE_INTERVAL']):
+        return
+    try:
+        os.makedirs(app.config['SKETCH_FOLDER'], exist_ok=True)
+        analysis_session.sketches.save(file_path)
+        analysis_session.sketches_saved = now
+    except OSError as e:  # The analysis goes on, the sketches are saved with a later batch
+        logger.error("Error saving the quantile sketches of %s: %s", analysis_session.user_id, e)
+
+
+def cohort_sketches():
+    """
+    Merges the quantile sketches of every session: the sessions in memory and the saved sketches of
+    users without one. Sessions without any samples are skipped, so they do not inflate the session count.
+
+    Returns:
+    - tuple: (MetricSketches, number of sessions merged).
+    """
+    with analysis_sessions_lock:
+        sessions = list(analysis_sessions.values())
+    merged = MetricSketches()
+    session_count = 0
+    in_memory = set()
+    for analysis_session in sessions:
+        with analysis_session.lock:
+            if not analysis_session.sketches.count:
+                continue
+            merged.merge(analysis_session.sketches)
+        session_count += 1
+        in_memory.add(sketch_path(analysis_session.user_id))
+    folder = app.config['SKETCH_FOLDER']
+    file_names = sorted(os.listdir(folder)) if folder and os.path.isdir(folder) else []
+    for file_name in file_names:
+        file_path = os.path.join(folder, file_name)
+        if not file_name.endswith('.json') or file_path in in_memory:
+            continue
+        try:
+            merged.merge(MetricSketches.load(file_path))
+        except (OSError, ValueError, KeyError) as e:
+            logger.error("Error loading the quantile sketches %s: %s", file_path, e)
+            continue
+        session_count += 1
+    return merged, session_count
+
+
+class GazeTimeline:
+    """
+    Append-only on-disk timeline of one user's frames, keyed by Frame.
+
+    The client's buffered uploads overlap, so most frames of a window were already received. append()
+    keeps only frames past the last stored one, which leaves every frame stored exactly once and in
+    Frame order. Frames are fixed-size records with the GAZE_FRAME_COLUMNS layout (string columns as
+    codes into a string table kept next to the file) and are read through a memory map, so a range
+    read only touches the pages it returns. Stored timestamps never decrease, which makes the
+    TimeStamp column its own time index: range() finds [t0, t1] by binary search.
+
+    A record left half-written by a crash is dropped when the timeline is opened again.
+    """
+
+    DTYPE = np.dtype(GAZE_FRAME_COLUMNS)
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.strings_path = file_path + '.strings.json'
+        self.lock = threading.Lock()
+        self._view = None
+
+        self.strings = []
+        if os.path.isfile(self.strings_path):
+            with open(self.strings_path) as file:
+                self.strings = json.load(file)
+        self._string_index = {value: index for index, value in enumerate(self.strings)}
+
+        self.count = 0
+        if os.path.isfile(file_path):
+            size = os.path.getsize(file_path)
+            self.count = size // self.DTYPE.itemsize
+            if size % self.DTYPE.itemsize:
+                os.truncate(file_path, self.count * self.DTYPE.itemsize)
+        frames = self.frames()
+        self.last_frame = int(frames['Frame'][-1]) if self.count else None
+        self.last_time = float(frames['TimeStamp'][-1]) if self.count else None
+
+    def append(self, df):
+        """
+        Appends the frames of `df` that are not stored yet.
+
+        Parameters:
+        - df (DataFrame): Frames as returned by read_gaze_log or gaze_frames_to_dataframe, TimeStamp in milliseconds.
+
+        Returns:
+        - int: Number of frames appended. Frames at or before the last stored Frame, repeated frames
+          and frames whose TimeStamp is earlier than the stored ones are skipped.
+        """
+        if df.empty or 'Frame' not in df.columns or 'TimeStamp' not in df.columns:
+            return 0
+        frames = pd.to_numeric(df['Frame'], errors='coerce').to_numpy(dtype=np.float64)
+        timestamps = df['TimeStamp'].to_numpy(dtype=np.float64)
+        valid = ~np.isnan(frames) & ~np.isnan(timestamps)
+        if self.last_frame is not None:
+            valid &= frames > self.last_frame
+        # First occurrence of every new frame, in Frame order
+        _, rows = np.unique(frames[valid], return_index=True)
+        rows = np.flatnonzero(valid)[rows]
+        if len(rows):
+            running_max = np.maximum.accumulate(timestamps[rows])
+            if self.last_time is not None:
+                running_max = np.maximum(running_max, self.last_time)
+            rows = rows[timestamps[rows] >= running_max]
+        if not len(rows):
+            return 0
+
+        window = df.iloc[rows]
+        records = np.empty(len(rows), dtype=self.DTYPE)
+        strings_before = len(self.strings)
+        for column, dtype in GAZE_FRAME_COLUMNS:
+            if column in GAZE_FRAME_STRING_COLUMNS:
+                if column not in window.columns:
+                    records[column] = GAZE_FRAME_MISSING
+                    continue
+                column_codes, uniques = pd.factorize(window[column])
+                table_codes = np.array([self._string_code(str(value)) for value in uniques] + [GAZE_FRAME_MISSING], dtype='<u2')
+                records[column] = table_codes[column_codes]
+            elif column in window.columns:
+                records[column] = window[column].to_numpy(dtype=dtype)
+            else:
+                records[column] = np.nan
+
+        # The string table is written first, so stored records never reference a missing string
+        if len(self.strings) != strings_before:
+            with open(self.strings_path + '.part', 'w') as file:
+                json.dump(self.strings, file)
+            os.replace(self.strings_path + '.part', self.strings_path)
+        with open(self.file_path, 'ab') as file:
+            file.write(records.tobytes())
+        self.count += len(records)
+        self.last_frame = int(records['Frame'][-1])
+        self.last_time = float(records['TimeStamp'][-1])
+        self._view = None
+        return len(records)
+
+    def frames(self):
+        """Returns the stored records as a read-only structured array backed by the memory-mapped file."""
+        if self._view is None or len(self._view) != self.count:
+            if self.count:
+                self._view = np.memmap(self.file_path, dtype=self.DTYPE, mode='r', shape=(self.count,))
+            else:
+                self._view = np.empty(0, dtype=self.DTYPE)
+        return self._view
+
+    def range(self, t0=None, t1=None):
+        """
+        Returns the frames with t0 <= TimeStamp <= t1 (milliseconds, None leaves that side open)
+        in the layout gaze_frames_to_dataframe produces.
+        """
+        frames = self.frames()
+        timestamps = frames['TimeStamp']
+        start = 0 if t0 is None else np.searchsorted(timestamps, t0, side='left')
+        end = len(frames) if t1 is None else np.searchsorted(timestamps, t1, side='right')
+        records = frames[start:max(start, end)]
+        return gaze_frames_to_dataframe({column: records[column] for column, _ in GAZE_FRAME_COLUMNS}, self.strings)
+
+    def clear(self):
+        """Deletes every stored frame."""
+        for path in (self.file_path, self.strings_path):
+            if os.path.isfile(path):
+                os.remove(path)
+        self.strings, self._string_index = [], {}
+        self.count, self.last_frame, self.last_time = 0, None, None
+        self._view = None
+
+    def _string_code(self, value):
+        if value not in self._string_index:
+            if len(self.strings) >= GAZE_FRAME_MISSING:
+                raise ValueError(f"Too many distinct strings for the gaze timeline: {len(self.strings)}")
+            self._string_index[value] = len(self.strings)
+            self.strings.append(value)
+        return self._string_index[value]
+
+
+# Gaze timelines keyed by file path, see GazeTimeline. User IDs that sanitize to the same file share one timeline.
+gaze_timelines = {}
+gaze_timelines_lock = threading.Lock()
+
+
+def get_gaze_timeline(user_id):
+    """Returns the gaze timeline of `user_id`, opening it on first use."""
+    file_path = os.path.abspath(os.path.join(app.config['TIMELINE_FOLDER'],
+                                             (secure_filename(str(user_id)) or 'unknown') + GAZE_TIMELINE_EXTENSION))
+    with gaze_timelines_lock:
+        if file_path not in gaze_timelines:
+            os.makedirs(app.config['TIMELINE_FOLDER'], exist_ok=True)
+            gaze_timelines[file_path] = GazeTimeline(file_path)
+        return gaze_timelines[file_path]
+
+
+def append_to_timeline(user_id, df):
+    """Adds the new frames of an upload to the gaze timeline of `user_id`. Returns the number of frames added."""
+    timeline = get_gaze_timeline(user_id)
+    try:
+        with timeline.lock:
+            return timeline.append(df)
+    except (OSError, ValueError) as e:  # The upload is still analyzed
+        logger.error("Error adding frames to the timeline of %s: %s", user_id, e)
+        return 0
+
+
+def clear_timeline(user_id):
+    """Deletes every frame in the gaze timeline of `user_id`."""
+    timeline = get_gaze_timeline(user_id)
+    with timeline.lock:
+        timeline.clear()
+
+
 # Example usage
 #file_path = 'ID_002_Scene__Condition_0_2024-11-05-13-01.csv'
 """file_path = 'uploads/GazeData.csv'
@@ -1877,4 +4719,6 @@ localTest("ID_002_Scene__Condition_0_2024-11-05-13-01.csv")"""
 """
 
 if __name__ == '__main__':
+    logging.basicConfig(format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    analysis_scheduler.start()
     app.run(host='0.0.0.0', port=5000)  # Run on localhost
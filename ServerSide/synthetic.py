@@ -0,0 +1,469 @@
+"""
+Synthetic GazeData logs for scale testing.
+
+Writes logs in the exact schema of the Unity GazeData.csv (';' separated, decimal commas, VALID/INVALID
+eye status, GazedObject and Task labels) with a configurable sequence of fixations, saccades, blinks and
+tracking losses. The output is streamed chunk by chunk, so sessions of tens of millions of frames need no
+more memory than one chunk. The same seed and settings always give the same file.
+
+Gaze moves between fixation targets in head coordinates. Saccades follow a raised-cosine profile whose
+duration grows with the amplitude (main sequence, 2.2 ms per degree + 21 ms), blinks and tracking losses are
+INVALID frames with every eye field zeroed, as the headset logs them. GazedObject is the object of
+CLASSROOM_LAYOUT the combined head and eye direction points at.
+
+Run from the ServerSide folder, e.g.:
+    python synthetic.py synthetic_GazeData.csv --frames 1000000 --seed 1
+    python synthetic.py hour.csv.gz --minutes 60 --blink-rate 20 --fixation-duration 0.3 0.12
+"""
+import argparse
+import gzip
+import sys
+
+import numpy as np
+import pandas as pd
+from scipy.signal import lfilter, lfiltic
+
+import server
+
+# Objects of the classroom scene by the (yaw, pitch) region in degrees they cover seen from the seat,
+# first match wins and everything else is 'Wall'
+CLASSROOM_LAYOUT = [
+    ('Projector', (-15, 15), (14, 35)),
+    ('Board', (-25, 25), (-6, 14)),
+    ('Table', (-40, 40), (-60, -18)),
+    ('Chair', (-60, -25), (-18, -6)),
+    ('Chair3', (25, 60), (-18, -6)),
+    ('Locker', (-90, -55), (-6, 25)),
+    ('Wall2', (40, 90), (-6, 40)),
+]
+
+# Days from 0001-01-01 to 1970-01-01, the origin of the LogTime milliseconds
+LOG_TIME_EPOCH_OFFSET_MS = 719162 * 86400 * 1000
+
+FIXATION, BLINK, SACCADE = range(3)
+
+# Bytes of one formatted field before the padding is removed, see encode_csv
+FIELD_WIDTH = 16
+PADDING = 0
+
+
+class SyntheticGazeGenerator:
+    """
+    Generates GazeData frames chunk by chunk. State (position in the fixation/saccade sequence, pending
+    blinks and tracking losses, head pose, pupil size) carries over between chunks.
+
+    Parameters:
+    - seed (int): Seed of the random generator.
+    - fps (float): Mean frame rate of the headset.
+    - dropped_frame_rate (float): Share of frames the headset skips (Frame advances by 2).
+    - fixation_duration (tuple): Mean and standard deviation of the fixation durations in seconds (log-normal).
+    - saccade_amplitude (tuple): Mean and standard deviation of the saccade amplitudes in degrees (gamma).
+    - max_eccentricity (float): Largest eye-in-head angle in degrees, saccades turn back towards the centre.
+    - fixation_noise (float): Standard deviation of the gaze jitter within fixations in degrees.
+    - blink_rate (float): Blinks per minute, they happen between a fixation and the next saccade.
+    - blink_duration (tuple): Mean and standard deviation of the blink durations in seconds.
+    - tracking_loss_rate (float): Tracking losses per minute, at random moments.
+    - tracking_loss_duration (float): Mean tracking loss duration in seconds (exponential).
+    - pupil_diameter (tuple): Mean and standard deviation of the pupil diameter in mm.
+    - task (str): Task label of every frame.
+    - start_timestamp (int): TimeStamp of the first frame in milliseconds.
+    - start_time (str): Wall-clock time of the first frame, for LogTime.
+    """
+    def __init__(self, seed=0, fps=100, dropped_frame_rate=0.02, fixation_duration=(0.25, 0.1),
+                 saccade_amplitude=(6.0, 4.0), max_eccentricity=25, fixation_noise=0.05, blink_rate=15,
+                 blink_duration=(0.15, 0.05), tracking_loss_rate=0.5, tracking_loss_duration=1.0,
+                 pupil_diameter=(4.9, 0.4), task='Board', start_timestamp=1000000000000,
+                 start_time='2025-01-01 09:00'):
+        self.rng = np.random.default_rng(seed)
+        self.fps = fps
+        self.dropped_frame_rate = dropped_frame_rate
+        self.fixation_duration = fixation_duration
+        self.saccade_amplitude = saccade_amplitude
+        self.max_eccentricity = max_eccentricity
+        self.fixation_noise = fixation_noise
+        self.blink_duration = blink_duration
+        self.tracking_loss_rate = tracking_loss_rate
+        self.tracking_loss_duration = tracking_loss_duration
+        self.pupil_diameter = pupil_diameter
+        self.task = task
+        self.columns = list(server.GAZE_LOG_SCHEMA)
+
+        # A blink follows a fixation with the probability that gives `blink_rate` per minute
+        mean_saccade_duration = (2.2 * saccade_amplitude[0] + 21) / 1000
+        self.blink_probability = min(1.0, blink_rate / 60 * (fixation_duration[0] + mean_saccade_duration))
+
+        # Per-session constants of the simulated participant
+        self.ipd = self.rng.normal(63, 3)
+        self.iris_diameters = self.rng.normal(12.6, 0.3, 2)
+        self.seat_position = np.array([0.25, 2.26, 0.13]) + self.rng.normal(0, 0.05, 3)
+
+        # Running state
+        self.frame = 1
+        self.timestamp = start_timestamp
+        self.log_time_offset = (pd.Timestamp(start_time).value // 10 ** 6 + LOG_TIME_EPOCH_OFFSET_MS
+                                - start_timestamp)
+        self.target = np.zeros(2)
+        self.pending = None  # (kinds, eye angles) of generated frames not yet emitted
+        self.loss_remaining = 0
+        self.last_kind = -1
+        self.head_yaw = self.head_pitch = self.pupil = np.zeros(2)  # Last two values of the smooth walks
+        self.statistics = {'fixations': 0, 'saccades': 0, 'blinks': 0, 'tracking_losses': 0, 'invalid_frames': 0}
+
+    def _cycles(self, count):
+        """
+        Generates `count` fixation, (blink), saccade cycles.
+
+        Returns:
+        - tuple: (kinds, angles) per frame, angles as (n, 2) eye yaw and pitch in degrees.
+        """
+        rng, fps = self.rng, self.fps
+        mean, sd = self.fixation_duration
+        sigma = np.sqrt(np.log(1 + (sd / mean) ** 2))
+        fixation_frames = np.maximum(1, np.rint(rng.lognormal(np.log(mean) - sigma ** 2 / 2, sigma, count) * fps))
+        blink_frames = np.maximum(1, np.rint(rng.normal(*self.blink_duration, count).clip(0.05) * fps))
+        blink_frames[rng.random(count) >= self.blink_probability] = 0
+
+        mean, sd = self.saccade_amplitude
+        amplitudes = rng.gamma((mean / sd) ** 2, sd ** 2 / mean, count).clip(0.5, 2 * self.max_eccentricity)
+        directions = rng.uniform(0, 2 * np.pi, count)
+        # Targets depend on the previous one, saccades leaving the range turn back towards the centre
+        targets = np.empty((count + 1, 2))
+        targets[0] = self.target
+        for index in range(count):
+            step = amplitudes[index] * np.array([np.cos(directions[index]), np.sin(directions[index])])
+            target = targets[index] + step
+            if np.hypot(*target) > self.max_eccentricity:
+                target = targets[index] - step
+                eccentricity = np.hypot(*target)
+                if eccentricity > self.max_eccentricity:
+                    target *= self.max_eccentricity / eccentricity
+            targets[index + 1] = target
+        self.target = targets[-1]
+        saccade_frames = np.maximum(1, np.rint((2.2 * amplitudes + 21) / 1000 * fps))
+
+        # Segments in order fixation, blink, saccade per cycle, empty blinks have no frames
+        lengths = np.stack([fixation_frames, blink_frames, saccade_frames], axis=1).ravel().astype(np.int64)
+        kinds = np.tile([FIXATION, BLINK, SACCADE], count)
+        starts = np.repeat(targets[:-1], 3, axis=0)
+        ends = starts.copy()
+        ends[2::3] = targets[1:]
+
+        frame_kinds = np.repeat(kinds, lengths)
+        segment_starts = np.cumsum(lengths) - lengths
+        position = np.arange(len(frame_kinds)) - np.repeat(segment_starts, lengths)
+        # Raised cosine from start to end, the last saccade frame is on target
+        progress = (position + 1) / np.repeat(lengths, lengths)
+        profile = np.where(frame_kinds == SACCADE, (1 - np.cos(np.pi * progress)) / 2, 0.0)
+        angles = np.repeat(starts, lengths, axis=0) + (np.repeat(ends - starts, lengths, axis=0) * profile[:, None])
+        fixating = frame_kinds == FIXATION
+        angles[fixating] += rng.normal(0, self.fixation_noise, (fixating.sum(), 2))
+
+        return frame_kinds, angles
+
+    def _eye_frames(self, n):
+        """Returns the kinds and eye angles of the next `n` frames."""
+        kinds, angles = self.pending if self.pending is not None else (np.empty(0, np.int64), np.empty((0, 2)))
+        while len(kinds) < n:
+            # About two cycles per 30 frames, so one batch mostly suffices
+            more_kinds, more_angles = self._cycles(max(64, n // 15))
+            kinds, angles = np.concatenate([kinds, more_kinds]), np.concatenate([angles, more_angles])
+        self.pending = kinds[n:], angles[n:]
+        kinds, angles = kinds[:n], angles[:n]
+        # Consecutive segments always differ in kind, so every change of kind starts one
+        starts = kinds[np.flatnonzero(np.diff(kinds, prepend=self.last_kind))]
+        for kind, name in ((FIXATION, 'fixations'), (SACCADE, 'saccades'), (BLINK, 'blinks')):
+            self.statistics[name] += int((starts == kind).sum())
+        self.last_kind = kinds[-1]
+        return kinds, angles
+
+    def _tracking_loss(self, n):
+        """Returns the mask of the next `n` frames lost to tracking losses."""
+        lost = np.zeros(n, dtype=bool)
+        carried = min(self.loss_remaining, n)
+        lost[:carried] = True
+        self.loss_remaining -= carried
+        count = self.rng.poisson(self.tracking_loss_rate / 60 * n / self.fps)
+        for start in np.sort(self.rng.integers(0, n, count)):
+            length = max(1, int(round(self.rng.exponential(self.tracking_loss_duration) * self.fps)))
+            lost[start:start + length] = True
+            self.loss_remaining = max(self.loss_remaining, start + length - n)
+        self.statistics['tracking_losses'] += count
+        return lost
+
+    def _smooth_walk(self, n, history, sd, time_constant):
+        """
+        Continues a smooth mean-reverting random walk (second-order autoregression with a double pole) with
+        stationary standard deviation `sd` and its last two values `history` for `n` frames.
+
+        Returns:
+        - tuple: (the `n` values, their new history).
+        """
+        pole = np.exp(-1 / (self.fps * time_constant))
+        denominator = [1, -2 * pole, pole ** 2]
+        innovations = self.rng.normal(0, sd * np.sqrt((1 - pole ** 2) ** 3 / (1 + pole ** 2)), n)
+        values, _ = lfilter([1], denominator, innovations, zi=lfiltic([1], denominator, history[::-1]))
+        return values, np.concatenate([history, values])[-2:]
+
+    def chunk(self, n):
+        """
+        Generates the next `n` frames.
+
+        Returns:
+        - DataFrame: Frames with the columns of the Unity log, in its order.
+        """
+        rng, fps = self.rng, self.fps
+        steps = np.where(rng.random(n) < self.dropped_frame_rate, 2, 1)
+        frames = self.frame + np.cumsum(steps) - steps[0]
+        intervals = steps * 1000 / fps + rng.normal(0, 1.5, n)
+        timestamps = self.timestamp + np.rint(np.cumsum(intervals) - intervals[0]).astype(np.int64)
+        timestamps = np.maximum.accumulate(timestamps)
+        self.frame, self.timestamp = int(frames[-1] + steps[-1]), int(timestamps[-1] + round(1000 / fps))
+
+        kinds, eye = self._eye_frames(n)
+        valid = (kinds != BLINK) & ~self._tracking_loss(n)
+        self.statistics['invalid_frames'] += int(n - valid.sum())
+
+        # Head turns slowly around the board, the eye angles add to it
+        head_yaw, self.head_yaw = self._smooth_walk(n, self.head_yaw, 6, 3)
+        head_pitch, self.head_pitch = self._smooth_walk(n, self.head_pitch, 3, 3)
+        pupil, self.pupil = self._smooth_walk(n, self.pupil, self.pupil_diameter[1], 1)
+        pupil = pupil + self.pupil_diameter[0]
+
+        data = {}
+        data['Frame'] = frames
+        data['TimeStamp'] = timestamps
+        data['LogTime'] = (timestamps + self.log_time_offset).astype(float)
+        position = self.seat_position + np.cumsum(rng.normal(0, 0.0002, (n, 3)), axis=0)
+        self.seat_position = position[-1]
+        head_direction = unit_vectors(head_yaw, head_pitch)
+        for axis, name in enumerate('XYZ'):
+            data[f'HeadPosition{name}'] = position[:, axis]
+        for axis, name in enumerate('XYZ'):
+            data[f'HeadDirection{name}'] = head_direction[:, axis]
+
+        status = np.where(valid, 'VALID', 'INVALID')
+        zero = np.zeros(n)
+        combined = unit_vectors(eye[:, 0], eye[:, 1])
+        data['GazeStatus'] = status
+        for axis, name in enumerate('XYZ'):
+            data[f'CombinedGazeForward{name}'] = np.where(valid, combined[:, axis], 0)
+        for name in 'XYZ':
+            data[f'CombinedGazePosition{name}'] = zero
+        data['InterPupillaryDistanceInMM'] = np.where(valid, self.ipd, 0)
+
+        openness = (0.95 + rng.normal(0, 0.02, (n, 2))).clip(0, 1)
+        # Lids are half closed on the frames next to a blink
+        closing = np.convolve(kinds == BLINK, np.ones(5), mode='same') > 0
+        openness[closing & valid] *= 0.5
+        for side, (name, sign, iris) in enumerate(zip(('Left', 'Right'), (-1, 1), self.iris_diameters)):
+            # Each eye converges a little on the board about 2 m ahead
+            direction = unit_vectors(eye[:, 0] - sign * np.degrees(np.arctan(self.ipd / 2000 / 2)), eye[:, 1])
+            diameter = pupil + rng.normal(0, 0.02, n) + 0.05 * sign
+            data[f'{name}EyeStatus'] = status
+            for axis, axis_name in enumerate('XYZ'):
+                data[f'{name}GazeDirection{axis_name}'] = np.where(valid, direction[:, axis], 0)
+            data[f'{name}EyePositionX'] = np.where(valid, sign * self.ipd / 2000, 0)
+            data[f'{name}EyePositionY'] = zero
+            data[f'{name}EyePositionZ'] = zero
+            data[f'{name}PupilIrisDiameterRatio'] = np.where(valid, diameter / iris, 0)
+            data[f'{name}PupilDiameterInMM'] = np.where(valid, diameter, 0)
+            data[f'{name}IrisDiameterInMM'] = np.where(valid, iris, 0)
+            data[f'{name}EyeOpenness'] = np.where(valid, openness[:, side], 0)
+        data['FocusDistance'] = np.where(valid, 2, 0)
+        data['FocusStability'] = np.where(valid, (0.95 + rng.normal(0, 0.01, n)).clip(0, 1), 0)
+
+        unknown = np.full(n, 'Unknown', dtype=object)
+        data['Condition'] = unknown
+        data['Scene'] = unknown
+        data['Task'] = np.full(n, self.task, dtype=object)
+        data['GazedObject'] = gazed_objects(head_yaw + eye[:, 0], head_pitch + eye[:, 1])
+        data['ClickedObject'] = unknown
+        data['QuizAnswer'] = unknown
+        data['ChatBot'] = unknown
+        return pd.DataFrame(data, columns=self.columns)
+
+    def write(self, output, frames, chunk_size=100000):
+        """
+        Streams `frames` frames to `output`, a file path ('.gz' is compressed, '-' is stdout) or a binary file.
+
+        Returns:
+        - dict: Counts of the generated fixations, saccades, blinks, tracking losses and INVALID frames.
+        """
+        if isinstance(output, str):
+            if output == '-':
+                return self.write(sys.stdout.buffer, frames, chunk_size)
+            opener = gzip.open if output.endswith('.gz') else open
+            with opener(output, 'wb') as file:
+                return self.write(file, frames, chunk_size)
+
+        output.write((';'.join(self.columns) + '\n').encode())
+        written = 0
+        while written < frames:
+            n = min(chunk_size, frames - written)
+            output.write(encode_csv(self.chunk(n)))
+            written += n
+        return dict(self.statistics, frames=frames)
+
+
+def unit_vectors(yaw, pitch):
+    """Returns (n, 3) unit vectors (x right, y up, z forward) for yaw and pitch angles in degrees."""
+    yaw, pitch = np.radians(yaw), np.radians(pitch)
+    return np.stack([np.sin(yaw) * np.cos(pitch), np.sin(pitch), np.cos(yaw) * np.cos(pitch)], axis=1)
+
+
+def gazed_objects(yaw, pitch):
+    """Returns the CLASSROOM_LAYOUT object for each gaze direction, 'Wall' where none matches."""
+    conditions = [(yaw >= yaw_range[0]) & (yaw < yaw_range[1]) & (pitch >= pitch_range[0]) & (pitch < pitch_range[1])
+                  for _, yaw_range, pitch_range in CLASSROOM_LAYOUT]
+    return np.select(conditions, [name for name, _, _ in CLASSROOM_LAYOUT], default='Wall').astype(object)
+
+
+def format_floats(values):
+    """
+    Formats floats as C# float.ToString() does (the 'G7' format: 7 significant digits without trailing
+    zeros, scientific notation below 1E-04 and from 1E+07 on) with a decimal comma, like '%.7g' with ','.
+
+    Returns:
+    - ndarray: (n, FIELD_WIDTH) uint8 characters per value, padded with PADDING.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    n = len(values)
+    field = np.full((n, FIELD_WIDTH), PADDING, dtype=np.uint8)
+    rows = np.arange(n)
+    magnitude = np.abs(values)
+    nonzero = magnitude > 0
+    field[~nonzero, 0] = ord('0')
+
+    # 7-digit mantissa and decimal exponent, corrected where log10 or the rounding is off by one
+    exponent = np.zeros(n, dtype=np.int64)
+    exponent[nonzero] = np.floor(np.log10(magnitude[nonzero]))
+    mantissa = np.rint(magnitude / 10.0 ** (exponent - 6)).astype(np.int64)
+    for wrong, step in ((nonzero & (mantissa >= 10 ** 7), 1), (nonzero & (mantissa < 10 ** 6), -1)):
+        exponent[wrong] += step
+        mantissa[wrong] = np.rint(magnitude[wrong] / 10.0 ** (exponent[wrong] - 6))
+    digits = mantissa[:, None] // 10 ** np.arange(6, -1, -1) % 10
+    # Significant digits once trailing zeros are dropped
+    significant = 7 - np.argmax(digits[:, ::-1] != 0, axis=1)
+
+    negative = nonzero & (values < 0)
+    field[negative, 0] = ord('-')
+    offset = negative.astype(np.int64)
+    scientific = nonzero & ((exponent < -4) | (exponent >= 7))
+    large = nonzero & ~scientific & (exponent >= 0)
+    small = nonzero & ~scientific & (exponent < 0)
+
+    # Fixed point >= 1: integer digits, then the comma and the remaining significant digits
+    for k in range(7):
+        shown = large & ((k <= exponent) | (k < significant))
+        field[rows[shown], (offset + k + (k > exponent))[shown]] = digits[shown, k] + ord('0')
+    comma = large & (significant > exponent + 1)
+    field[rows[comma], (offset + exponent + 1)[comma]] = ord(',')
+
+    # Fixed point < 1: '0,', zeros up to the first digit, the significant digits
+    field[rows[small], offset[small]] = ord('0')
+    field[rows[small], offset[small] + 1] = ord(',')
+    zeros = -exponent - 1
+    for k in range(4):
+        shown = small & (k < zeros)
+        field[rows[shown], (offset + 2 + k)[shown]] = ord('0')
+    for k in range(7):
+        shown = small & (k < significant)
+        field[rows[shown], (offset + 2 + zeros + k)[shown]] = digits[shown, k] + ord('0')
+
+    # Scientific: d,ddddddE+XX
+    for k in range(7):
+        shown = scientific & (k < significant)
+        field[rows[shown], (offset + k + (k > 0))[shown]] = digits[shown, k] + ord('0')
+    comma = scientific & (significant > 1)
+    field[rows[comma], offset[comma] + 1] = ord(',')
+    end = offset + significant + (significant > 1)
+    field[rows[scientific], end[scientific]] = ord('E')
+    field[rows[scientific], end[scientific] + 1] = np.where(exponent[scientific] < 0, ord('-'), ord('+'))
+    for k, power in enumerate((10, 1)):
+        field[rows[scientific], end[scientific] + 2 + k] = np.abs(exponent[scientific]) // power % 10 + ord('0')
+    return field
+
+
+def format_integers(values):
+    """Formats non-negative integers of up to FIELD_WIDTH digits, see format_floats."""
+    values = np.asarray(values, dtype=np.int64)
+    digits = values[:, None] // 10 ** np.arange(FIELD_WIDTH - 1, -1, -1, dtype=np.int64) % 10
+    # Leading zeros are padding, except the last digit
+    leading = np.cumsum(digits != 0, axis=1) == 0
+    leading[:, -1] = False
+    return np.where(leading, PADDING, digits + ord('0')).astype(np.uint8)
+
+
+def format_labels(values):
+    """Formats string labels through a per-label lookup table, see format_floats."""
+    codes, labels = pd.factorize(np.asarray(values, dtype=object))
+    encoded = [label.encode() for label in labels]
+    table = np.full((len(labels), max(len(label) for label in encoded)), PADDING, dtype=np.uint8)
+    for index, label in enumerate(encoded):
+        table[index, :len(label)] = np.frombuffer(label, dtype=np.uint8)
+    return table[codes]
+
+
+def encode_csv(df):
+    """
+    Encodes a frame table as ';'-separated lines in the Unity log format, without a header.
+
+    Every column is formatted into fixed-width byte fields with numpy, then the padding is removed, which
+    is much faster than formatting value by value with DataFrame.to_csv.
+
+    Returns:
+    - bytes: The encoded lines.
+    """
+    blocks = []
+    for index, column in enumerate(df.columns):
+        values = df[column].to_numpy()
+        if values.dtype.kind == 'f':
+            block = format_floats(values)
+        elif values.dtype.kind in 'iu':
+            block = format_integers(values)
+        else:
+            block = format_labels(values)
+        separator = np.full((len(df), 1), ord('\n' if index == len(df.columns) - 1 else ';'), dtype=np.uint8)
+        blocks.extend([block, separator])
+    characters = np.concatenate(blocks, axis=1).ravel()
+    return characters[characters != PADDING].tobytes()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('output', help="Log to write, '.gz' is compressed, '-' writes to stdout")
+    size = parser.add_mutually_exclusive_group()
+    size.add_argument('--frames', type=int, default=None, help='Number of frames (default: 10 minutes)')
+    size.add_argument('--minutes', type=float, default=None, help='Session length in minutes')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed')
+    parser.add_argument('--fps', type=float, default=100, help='Mean frame rate')
+    parser.add_argument('--dropped-frame-rate', type=float, default=0.02, help='Share of skipped frames')
+    parser.add_argument('--fixation-duration', type=float, nargs=2, default=[0.25, 0.1],
+                        metavar=('MEAN', 'SD'), help='Fixation duration mean and sd in seconds')
+    parser.add_argument('--saccade-amplitude', type=float, nargs=2, default=[6.0, 4.0],
+                        metavar=('MEAN', 'SD'), help='Saccade amplitude mean and sd in degrees')
+    parser.add_argument('--fixation-noise', type=float, default=0.05, help='Gaze jitter within fixations (degrees)')
+    parser.add_argument('--blink-rate', type=float, default=15, help='Blinks per minute')
+    parser.add_argument('--blink-duration', type=float, nargs=2, default=[0.15, 0.05],
+                        metavar=('MEAN', 'SD'), help='Blink duration mean and sd in seconds')
+    parser.add_argument('--tracking-loss-rate', type=float, default=0.5, help='Tracking losses per minute')
+    parser.add_argument('--tracking-loss-duration', type=float, default=1.0, help='Mean tracking loss in seconds')
+    parser.add_argument('--task', default='Board', help='Task label')
+    parser.add_argument('--chunk-size', type=int, default=100000, help='Frames generated and written at once')
+    args = parser.parse_args()
+
+    frames = args.frames or int(round((args.minutes or 10) * 60 * args.fps))
+
+    generator = SyntheticGazeGenerator(
+        seed=args.seed, fps=args.fps, dropped_frame_rate=args.dropped_frame_rate,
+        fixation_duration=tuple(args.fixation_duration), saccade_amplitude=tuple(args.saccade_amplitude),
+        fixation_noise=args.fixation_noise, blink_rate=args.blink_rate, blink_duration=tuple(args.blink_duration),
+        tracking_loss_rate=args.tracking_loss_rate, tracking_loss_duration=args.tracking_loss_duration,
+        task=args.task)
+    statistics = generator.write(args.output, frames, args.chunk_size)
+    print(', '.join(f"{value} {name.replace('_', ' ')}" for name, value in statistics.items()),
+          file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
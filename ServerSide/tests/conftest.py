@@ -0,0 +1,27 @@
+"""
+Shared setup of the ServerSide tests. Run from the ServerSide folder: python -m pytest tests
+"""
+import glob
+import os
+import sys
+
+SERVER_SIDE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVER_SIDE)
+
+# Every study log in the uploads folder, the parity tests run against each of them
+UPLOAD_FILES = sorted(glob.glob(os.path.join(SERVER_SIDE, 'uploads', '*.csv')))
+
+
+def upload_velocities(file_path):
+    """
+    Returns the valid samples of an upload with the gaze and head angular velocities the classifier sees,
+    as a DataFrame with TimeStamp (seconds), GazeVelocity and HeadVelocity.
+    """
+    import server
+
+    df = server.read_gaze_log(file_path, columns='analysis')
+    df['TimeStamp'] = df['TimeStamp'] / 1000.0
+    valid = server.get_valid_head_and_gaze_movements(df)
+    gaze_velocity, head_velocity, _ = server.angular_velocity_kernel(
+        valid[server.KINEMATICS_COLUMNS].to_numpy(dtype=float), valid['TimeStamp'].to_numpy(dtype=float))
+    return valid[['TimeStamp']].assign(GazeVelocity=gaze_velocity, HeadVelocity=head_velocity).reset_index(drop=True)
@@ -0,0 +1,28 @@
+"""
+The cohort pipeline finds and analyzes uploads in the server's partitioned archive.
+"""
+import os
+
+import batch
+import server
+from conftest import UPLOAD_FILES
+
+
+def test_batch_analyzes_archived_uploads(tmp_path):
+    upload = next(file_path for file_path in UPLOAD_FILES if os.path.basename(file_path) == 'GazeData.csv')
+    archiver = server.UploadArchiver(str(tmp_path / 'archive'), archive_format='csv')
+    with open(upload, 'rb') as file:
+        assert archiver.submit('1_240_GazeData.csv', file.read(), user_id='P7', archive=True)
+    archiver.flush()
+    archived_path = next(os.path.join(root, name) for root, _, names in os.walk(tmp_path / 'archive') for name in names)
+
+    file_infos = batch.find_logs(str(tmp_path / 'archive'))
+    assert list(file_infos) == [archived_path]
+    file_info = file_infos[archived_path]
+    assert file_info['participant_id'] == 'P7'
+    assert file_info['session'] == os.path.basename(os.path.dirname(archived_path)).split('=', 1)[1]
+    assert file_info['upload'] == '1_240_GazeData'
+
+    features = batch.analyze_files(list(file_infos), workers=1)
+    assert features[archived_path] is not None
+    assert features[archived_path]['total_duration_seconds'] > 0
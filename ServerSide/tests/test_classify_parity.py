@@ -0,0 +1,90 @@
+"""
+Parity of the array classify_points with the per-sample loop it replaced, on every upload and on random traces.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import server
+from conftest import UPLOAD_FILES, upload_velocities
+
+
+def reference_classify_points(df):
+    """The per-sample classify_points loop, without its debug prints."""
+    eye_movement_ids = [None] * len(df)
+    last_type_list = ['outlier'] * len(df)
+    movement_durations, movement_amplitudes, movement_velocities = {}, {}, {}
+    current_id = 1
+    last_type = 'saccade_candidate'
+    movement_start_time = df['TimeStamp'].iloc[0]
+    movement_start_index = 0
+
+    def close_movement(end_index, duration):
+        valid = (last_type == 'fixation_candidate' and server.MIN_FIXATION_DURATION <= duration <= server.MAX_FIXATION_DURATION) or \
+                (last_type == 'saccade_candidate' and server.MIN_SACCADE_DURATION <= duration <= server.MAX_SACCADE_DURATION)
+        label = ('fixation' if last_type == 'fixation_candidate' else 'saccade') if valid else last_type
+        for index in range(movement_start_index, end_index):
+            eye_movement_ids[index] = current_id
+            last_type_list[index] = label
+        movement_durations[current_id] = duration
+        movement_amplitudes[current_id] = df['GazeVelocity'].iloc[movement_start_index:end_index].mean()
+        movement_velocities[current_id] = df['GazeVelocity'].iloc[movement_start_index:end_index].tolist()
+
+    for i in range(1, len(df)):
+        gaze_velocity = df['GazeVelocity'].iloc[i]
+        head_velocity = df['HeadVelocity'].iloc[i]
+        timestamp = df['TimeStamp'].iloc[i]
+        if pd.isna(gaze_velocity) or pd.isna(head_velocity) or pd.isna(timestamp):
+            continue
+        if head_velocity < server.HEAD_VELOCITY_THRESHOLD and gaze_velocity < server.GAZE_VELOCITY_FIXATION_THRESHOLD:
+            current_type = 'fixation_candidate'
+        elif gaze_velocity > server.GAZE_VELOCITY_SACCADE_THRESHOLD:
+            current_type = 'saccade_candidate'
+        else:
+            current_type = 'outlier'
+
+        if current_type != last_type:
+            close_movement(i, timestamp - movement_start_time)
+            current_id += 1
+            movement_start_time = timestamp
+            movement_start_index = i
+            last_type = current_type
+
+    close_movement(len(df), df['TimeStamp'].iloc[-1] - movement_start_time)
+    return last_type_list, eye_movement_ids, movement_durations, movement_amplitudes, movement_velocities
+
+
+def assert_same_classification(expected, result):
+    assert result[0] == expected[0]
+    assert result[1] == expected[1]
+    for expected_values, values in zip(expected[2:4], result[2:4]):
+        assert list(values) == list(expected_values)
+        np.testing.assert_allclose(list(values.values()), list(expected_values.values()), rtol=1e-12)
+    assert list(result[4]) == list(expected[4])
+    for movement_id, velocities in expected[4].items():
+        np.testing.assert_array_equal(result[4][movement_id], velocities)
+
+
+@pytest.mark.parametrize('file_path', UPLOAD_FILES, ids=os.path.basename)
+def test_classify_points_matches_reference_on_uploads(file_path):
+    df = upload_velocities(file_path)
+    if df.empty:
+        pytest.skip('no valid samples')
+    assert_same_classification(reference_classify_points(df), server.classify_points(df))
+
+
+def test_classify_points_matches_reference_on_random_traces():
+    rng = np.random.default_rng(0)
+    for _ in range(300):
+        size = int(rng.integers(1, 200))
+        timestamps = np.cumsum(rng.choice([0.005, 0.01, 0.011, 0.02, 0.05], size))
+        if rng.random() < 0.1:
+            timestamps[rng.integers(size)] = np.nan
+        df = pd.DataFrame({
+            'TimeStamp': timestamps,
+            'GazeVelocity': rng.choice([5.0, 20, 35, 45, 100, np.nan], size, p=[.3, .2, .15, .2, .1, .05]),
+            'HeadVelocity': rng.choice([1.0, 3, 10, np.nan], size, p=[.5, .3, .15, .05])
+        })
+        assert_same_classification(reference_classify_points(df), server.classify_points(df))
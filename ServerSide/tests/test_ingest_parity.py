@@ -0,0 +1,55 @@
+"""
+Parity of the incremental /ingest analysis with the one-shot process_log_dataframe, for every upload sent
+in random batch sizes. The isolated velocity outlier filter is disabled, /ingest does not apply it.
+"""
+import io
+import os
+
+import numpy as np
+import pytest
+
+import server
+from conftest import UPLOAD_FILES
+
+
+def assert_same(result, expected):
+    if isinstance(expected, dict):
+        assert sorted(result) == sorted(expected)
+        for key in expected:
+            assert_same(result[key], expected[key])
+    elif expected is None or result is None:
+        assert result is expected
+    else:
+        np.testing.assert_allclose(result, expected, rtol=1e-9)
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setitem(server.app.config, 'ARCHIVE_UPLOADS', False)
+    monkeypatch.setitem(server.app.config, 'TIMELINE_STORE', False)
+    monkeypatch.setitem(server.app.config, 'SKETCH_FOLDER', None)
+    return server.app.test_client()
+
+
+@pytest.mark.parametrize('file_path', UPLOAD_FILES, ids=os.path.basename)
+def test_ingest_matches_one_shot_analysis(client, file_path):
+    with open(file_path, 'rb') as file:
+        lines = file.read().decode('utf-8-sig').splitlines(True)
+    client.post('/start_session', data={'user_id': 'parity'})
+    rng = np.random.default_rng(len(lines))
+    start = 1
+    while start < len(lines):
+        end = start + int(rng.integers(1, 400))
+        body = (lines[0] + ''.join(lines[start:end])).encode()
+        response = client.post('/ingest', data={'file': (io.BytesIO(body), 'GazeData.csv')},
+                               content_type='multipart/form-data')
+        assert response.status_code == 200, response.json
+        start = end
+
+    expected, _ = server.process_log_dataframe(server.read_gaze_log(file_path, columns='analysis'), file_path, 'summary')
+    analysis_session = server.find_analysis_session('parity')
+    assert_same(analysis_session.movement_statistics(), expected['eye_movement_statistics'])
+    assert_same(response.json['Gaze_Object_Percentages'], expected['gazed_object_durations'])
+    stats = expected['eye_movement_statistics']
+    assert response.json['Fixation_Ratio'] == pytest.approx(stats['fixation']['percentage'], rel=1e-9)
+    assert response.json['Saccade_Ratio'] == pytest.approx(stats['saccade']['percentage'], rel=1e-9)
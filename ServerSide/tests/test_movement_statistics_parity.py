@@ -0,0 +1,45 @@
+"""
+Parity of the grouped movement statistics with the per-sample loop they replaced.
+"""
+import os
+
+import numpy as np
+import pytest
+
+import benchmarks
+import server
+from conftest import UPLOAD_FILES, upload_velocities
+
+
+def assert_same_statistics(result, expected):
+    if isinstance(expected, dict):
+        assert list(result) == list(expected)
+        for key in expected:
+            assert_same_statistics(result[key], expected[key])
+    elif expected is None or result is None:
+        assert result is expected
+    else:
+        np.testing.assert_allclose(result, expected, rtol=1e-12)
+
+
+@pytest.mark.parametrize('file_path', UPLOAD_FILES, ids=os.path.basename)
+def test_movement_statistics_match_reference_on_uploads(file_path):
+    df = upload_velocities(file_path)
+    if df.empty:
+        pytest.skip('no valid samples')
+    movements = server.classify_points(df)
+    movements = server.process_outliers_fixation(*movements)
+    movement_types, eye_movement_ids, movement_durations, _, _ = server.process_outliers_saccade(*movements)
+    total_time = df['TimeStamp'].iloc[-1] - df['TimeStamp'].iloc[0]
+
+    expected = benchmarks.legacy_get_movement_statistics(movement_types, eye_movement_ids, movement_durations, total_time)
+    result = server.get_movement_statistics(movement_types, eye_movement_ids, movement_durations, total_time)
+    assert_same_statistics(result, expected)
+
+
+@pytest.mark.parametrize('seed', range(30))
+def test_movement_statistics_match_reference_on_random_runs(seed):
+    movement_types, eye_movement_ids, movement_durations, _, _ = benchmarks.make_movement_runs(2000, seed)
+    expected = benchmarks.legacy_get_movement_statistics(movement_types, eye_movement_ids, movement_durations, 20.0)
+    result = server.get_movement_statistics(movement_types, eye_movement_ids, movement_durations, 20.0)
+    assert_same_statistics(result, expected)
@@ -0,0 +1,46 @@
+"""
+Parity of the rolling median/MAD isolated outlier filter with the O(N^2) filter it replaced.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import benchmarks
+import server
+from conftest import UPLOAD_FILES, upload_velocities
+
+
+@pytest.mark.parametrize('file_path', UPLOAD_FILES, ids=os.path.basename)
+def test_outlier_filter_matches_reference_on_uploads(file_path):
+    df = upload_velocities(file_path)
+    for column in ('GazeVelocity', 'HeadVelocity'):
+        expected = benchmarks.legacy_interpolate_outliers_time_window(
+            df[column], df['TimeStamp'], server.ISOLATED_OUTLIER_WINDOW, server.ISOLATED_OUTLIER_THRESHOLD)
+        result = server.interpolate_outliers_time_window(
+            df[column], df['TimeStamp'], server.ISOLATED_OUTLIER_WINDOW, server.ISOLATED_OUTLIER_THRESHOLD)
+        pd.testing.assert_series_equal(result, expected, check_names=False)
+
+
+def test_outlier_filter_matches_reference_on_random_series():
+    rng = np.random.default_rng(1)
+    for trial in range(1000):
+        size = int(rng.integers(1, 40))
+        kind = trial % 4
+        values = rng.normal(10, 3, size)
+        if kind == 1:
+            values = np.round(values)  # Ties
+        if kind == 2:
+            values[rng.random(size) < 0.3] = np.nan
+        if rng.random() < 0.3:
+            values[rng.integers(0, size)] = 500
+        timestamps = np.sort(rng.uniform(0, 1, size)) if kind != 3 else rng.uniform(0, 1, size)
+        if kind == 3 and size > 2:
+            timestamps[0] = np.nan  # Unordered times, a missing time and a repeated one
+            timestamps[1] = timestamps[2]
+        window, threshold = float(rng.choice([0.05, 0.1, 0.3, 2.0])), float(rng.choice([0, 1, 3, 5]))
+        values, timestamps = pd.Series(values), pd.Series(timestamps)
+        expected = benchmarks.legacy_interpolate_outliers_time_window(values, timestamps, window, threshold)
+        result = server.interpolate_outliers_time_window(values, timestamps, window, threshold)
+        pd.testing.assert_series_equal(result, expected)
@@ -0,0 +1,56 @@
+"""
+Parity of the run-table outlier merges with the per-outlier loops they replaced, on every upload and on random runs.
+"""
+import os
+
+import numpy as np
+import pytest
+
+import benchmarks
+import server
+from conftest import UPLOAD_FILES, upload_velocities
+
+
+def assert_same_movements(result, expected):
+    assert list(result[0]) == list(expected[0])
+    assert list(result[1]) == list(expected[1])
+    for values, expected_values in zip(result[2:4], expected[2:4]):
+        assert sorted(values) == sorted(expected_values)
+        for movement_id, value in expected_values.items():
+            np.testing.assert_allclose(values[movement_id], value, rtol=1e-12)
+    assert sorted(result[4]) == sorted(expected[4])
+    for movement_id, velocities in expected[4].items():
+        np.testing.assert_array_equal(result[4][movement_id], velocities)
+
+
+def assert_same_merges(movements):
+    expected = benchmarks.legacy_process_outliers_fixation(*movements)
+    result = server.process_outliers_fixation(*movements)
+    assert_same_movements(result, expected)
+
+    expected = benchmarks.legacy_process_outliers_saccade(*expected)
+    result = server.process_outliers_saccade(*result)
+    assert_same_movements(result, expected)
+
+
+@pytest.mark.parametrize('file_path', UPLOAD_FILES, ids=os.path.basename)
+def test_outlier_merges_match_reference_on_uploads(file_path):
+    df = upload_velocities(file_path)
+    if df.empty:
+        pytest.skip('no valid samples')
+    assert_same_merges(server.classify_points(df))
+
+
+@pytest.mark.parametrize('seed', range(40))
+def test_outlier_merges_match_reference_on_random_runs(seed):
+    rng = np.random.default_rng(seed)
+    movements = benchmarks.make_movement_runs(int(rng.integers(1, 400)), seed)
+    movement_types, eye_movement_ids, movement_durations = movements[:3]
+    # Random durations around the limits, and some runs already labelled by the classifier
+    for movement_id in movement_durations:
+        movement_durations[movement_id] = float(rng.choice([0.005, 0.01, 0.03, 0.05, 0.1, 0.5, 1.0, 3.0]))
+    labels = {'fixation_candidate': 'fixation', 'saccade_candidate': 'saccade'}
+    relabelled = {movement_id for movement_id in movement_durations if rng.random() < 0.3}
+    movement_types = [labels.get(movement_type, movement_type) if movement_id in relabelled else movement_type
+                      for movement_type, movement_id in zip(movement_types, eye_movement_ids)]
+    assert_same_merges((movement_types,) + movements[1:])
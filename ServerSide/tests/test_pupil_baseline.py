@@ -0,0 +1,69 @@
+"""
+The baseline-corrected pupil statistics of an /ingest session are those of the smoothed diameters divided by
+the session baseline, however the frames are split into batches.
+"""
+import os
+
+import pandas as pd
+import pytest
+
+import server
+from conftest import UPLOAD_FILES
+
+BATCH_SIZE = 300
+
+
+def upload_batches(file_path):
+    df = server.read_gaze_log(file_path, columns='analysis')
+    df['TimeStamp'] = df['TimeStamp'] / 1000.0
+    return [df.iloc[start:start + BATCH_SIZE] for start in range(0, len(df), BATCH_SIZE)]
+
+
+@pytest.mark.parametrize('file_path', UPLOAD_FILES, ids=os.path.basename)
+def test_ingest_pupil_statistics_are_baseline_corrected(file_path):
+    batches = upload_batches(file_path)
+    processor = server.IncrementalPupilProcessor()
+    smoothed = []
+    for batch in batches:
+        pupil_data = server.process_pupil_diameter_data(batch, processor=processor)
+        smoothed.append(pd.DataFrame(pupil_data['smoothed_pupil_data']))
+    smoothed = pd.concat(smoothed).dropna()
+    if smoothed.empty:
+        pytest.skip('no pupil samples')
+
+    in_baseline = smoothed['TimeStamp'] <= smoothed['TimeStamp'].iloc[0] + server.BASELINE_DURATION
+    baseline = smoothed.loc[in_baseline, 'SmoothedPupilDiameter'].mean()
+    corrected = smoothed['SmoothedPupilDiameter'] / baseline
+    expected = server.get_pupil_statistics(corrected)
+
+    # The incremental session reports what its processor computed from the same batches
+    analysis_session = server.IncrementalAnalysisSession('test')
+    for batch in batches:
+        analysis_session.ingest(batch)
+    statistics = analysis_session.pupil_statistics()
+
+    assert statistics['baseline_pupil_diameter'] == pytest.approx(baseline, rel=1e-12)
+    result = statistics['baseline_corrected_statistics']
+    assert result['count'] == expected['count']
+    for name in ('min_pupil_diameter', 'max_pupil_diameter', 'mean_pupil_diameter', 'std_pupil_diameter'):
+        assert result[name] == pytest.approx(expected[name], rel=1e-9, nan_ok=True)
+
+
+def test_upload_windows_share_the_session_pupil_baseline(monkeypatch):
+    monkeypatch.setattr(server, 'upload_pupil_sessions', {})
+    df = server.read_gaze_log(UPLOAD_FILES[0], columns='analysis')
+    windows = [df.iloc[:400], df.iloc[200:600]]  # Overlapping like consecutive /upload windows
+    for window in windows:
+        results_dict = server.process_eye_tracking_frames(window.copy(), session_inputs=True)
+        results = server.anchor_to_upload_session('test', results_dict)
+        assert 'Session_Inputs' not in results and 'Session_Inputs' in results_dict
+
+    # Every sample counted once, the baseline is the one of the first window
+    processor = server.upload_pupil_sessions['test']
+    first = server.process_eye_tracking_frames(windows[0].copy(), session_inputs=True)['Session_Inputs']
+    whole = df.iloc[:600].copy()
+    whole['TimeStamp'] = whole['TimeStamp'] / 1000.0
+    assert processor.count == server.get_pupil_diameter_data(whole)['AvgPupilDiameter'].notna().sum()
+    smoothed = pd.Series(first['SmoothedPupilDiameter'])
+    times = pd.Series(first['TimeStamp'])
+    assert processor.baseline == pytest.approx(smoothed[times <= times.iloc[0] + server.BASELINE_DURATION].mean())